@@ -0,0 +1,135 @@
+import re
+import functools
+
+# Всё, что не является буквой, цифрой или пробелом, считается знаком препинания
+PUNCTUATION = re.compile(r'[^\w\s]|_')
+# Разделитель вариантов правильного ответа: "Кит|Синий кит"
+ALIAS_SEPARATOR = '|'
+# Количество скомпилированных ответов, которые хранятся для ответов, прочитанных из хранилища сессий
+COMPILED_CACHE_SIZE = 4096
+
+def normalize_answer(text):
+    """
+    Приведение ответа к нормальной форме: регистр, ё/е, знаки препинания и лишние пробелы не учитываются.
+    :param text: Текст ответа.
+    :return: Нормализованный текст.
+    """
+    text = PUNCTUATION.sub(' ', text.casefold().replace('ё', 'е'))
+    return ' '.join(text.split())
+
+def allowed_typos(text):
+    """
+    Допустимое количество опечаток в зависимости от длины ответа.
+    В ответах с цифрами (годы, числа) опечатки не допускаются: другая цифра - другой ответ.
+    :param text: Нормализованный правильный ответ.
+    :return: Максимальное расстояние редактирования.
+    """
+    if len(text) <= 4 or any(char.isdigit() for char in text):
+        return 0
+    if len(text) <= 8:
+        return 1
+    return 2
+
+def within_distance(first, second, limit):
+    """
+    Проверка, что расстояние Левенштейна между строками не больше limit.
+    Общие начало и конец строк отбрасываются, затем считается только полоса шириной 2 * limit + 1
+    вокруг диагонали, и вычисление прекращается, как только вся строка матрицы превышает limit.
+    :param first: Первая строка.
+    :param second: Вторая строка.
+    :param limit: Максимальное допустимое расстояние.
+    :return: True, если расстояние не больше limit.
+    """
+    if abs(len(first) - len(second)) > limit:
+        return False
+    if first == second:
+        return True
+    if limit == 0:
+        return False
+
+    # Отбрасываем общий префикс и суффикс: опечатка обычно затрагивает один-два символа
+    start = 0
+    while start < len(first) and start < len(second) and first[start] == second[start]:
+        start += 1
+    end_first, end_second = len(first), len(second)
+    while end_first > start and end_second > start and first[end_first - 1] == second[end_second - 1]:
+        end_first -= 1
+        end_second -= 1
+    first = first[start:end_first]
+    second = second[start:end_second]
+    if not first or not second:
+        return max(len(first), len(second)) <= limit
+
+    too_far = limit + 1
+    length = len(second)
+    previous = list(range(length + 1))
+    for i in range(1, len(first) + 1):
+        first_char = first[i - 1]
+        current = [too_far] * (length + 1)
+        current[0] = i if i < too_far else too_far
+        row_min = current[0]
+        for j in range(max(1, i - limit), min(length, i + limit) + 1):
+            value = previous[j - 1] if first_char == second[j - 1] else previous[j - 1] + 1
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if value > too_far:
+                value = too_far
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return False
+        previous = current
+    return previous[length] <= limit
+
+class CompiledAnswer(str):
+    """
+    Правильный ответ с заранее нормализованными вариантами.
+    Ведёт себя как обычная строка (исходный текст ответа), дополнительно умеет проверять ответ игрока.
+    """
+
+    def __new__(cls, text, fuzzy=True):
+        """
+        Создание ответа.
+        :param text: Текст ответа, варианты разделяются символом '|'.
+        :param fuzzy: Допускать ли опечатки.
+        """
+        answer = super().__new__(cls, text)
+        answer.variants = []
+        for variant in text.split(ALIAS_SEPARATOR):
+            normalized = normalize_answer(variant)
+            if normalized:
+                answer.variants.append((normalized, allowed_typos(normalized) if fuzzy else 0))
+        answer.exact = frozenset(normalized for normalized, _ in answer.variants)
+        return answer
+
+    def matches(self, reply):
+        """
+        Проверка ответа игрока.
+        :param reply: Ответ игрока.
+        :return: True, если ответ правильный.
+        """
+        reply = normalize_answer(reply or '')
+        if reply in self.exact:
+            return True
+        return any(limit and within_distance(reply, variant, limit) for variant, limit in self.variants)
+
+@functools.lru_cache(maxsize=COMPILED_CACHE_SIZE)
+def compile_text(text):
+    """
+    Компиляция текста ответа с кэшированием. Хранилища snapshot и sqlite сохраняют ответ
+    в сессии обычной строкой, поэтому без кэша ответ компилировался бы заново на каждое сообщение.
+    :param text: Текст ответа.
+    :return: CompiledAnswer.
+    """
+    return CompiledAnswer(text)
+
+def compile_answer(answer):
+    """
+    Получение скомпилированного ответа.
+    :param answer: Текст ответа или уже скомпилированный ответ.
+    :return: CompiledAnswer.
+    """
+    return answer if isinstance(answer, CompiledAnswer) else compile_text(answer)
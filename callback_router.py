@@ -0,0 +1,148 @@
+import time
+import logging
+from metrics import HANDLER_SECONDS
+from tracing import span
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Версия формата callback_data. Формат: <версия><код>[:<аргумент>...], например "1q:12"
+CALLBACK_VERSION = '1'
+# Ограничение Telegram на длину callback_data в байтах
+MAX_CALLBACK_DATA = 64
+
+# Маршруты: имя -> (короткий код, типы аргументов)
+CALLBACK_ROUTES = {
+    'single': ('s', ()),
+    'pvp': ('p', ()),
+    'leave_queue': ('l', ()),
+    'quiz': ('q', (int,)),
+    'replay': ('r', (int,)),
+    'newquiz': ('n', ()),
+    'add_quiz': ('a', ()),
+    'update_quiz': ('u', ()),
+    'delete_quiz': ('x', ()),
+    'select_quiz': ('e', (int,)),
+    'delete_quiz_id': ('d', (int,)),
+    'done': ('f', ()),
+    'quiz_page': ('g', (str, str, int, str)),  # Код маршрута кнопок, направление, ID-граница, префикс названия
+}
+
+# Таблица декодирования: код -> (имя, типы аргументов)
+CALLBACK_CODES = {code: (name, arg_types) for name, (code, arg_types) in CALLBACK_ROUTES.items()}
+
+# Старый формат callback_data в уже отправленных сообщениях: "quiz_12", "select_quiz_12", "single" и т.д.
+LEGACY_ROUTES = {name: name for name, (_, arg_types) in CALLBACK_ROUTES.items() if not arg_types}
+LEGACY_ROUTES_WITH_ID = {'quiz': 'quiz', 'replay': 'replay', 'select_quiz': 'select_quiz', 'delete_quiz': 'delete_quiz_id'}
+
+def encode_callback(name, *args):
+    """
+    Кодирование callback_data для кнопки.
+    :param name: Имя маршрута.
+    :param args: Аргументы маршрута.
+    :return: Строка callback_data.
+    """
+    code, arg_types = CALLBACK_ROUTES[name]
+    if len(args) != len(arg_types):
+        raise ValueError(f"Callback '{name}' expects {len(arg_types)} arguments, got {len(args)}")
+    data = CALLBACK_VERSION + code
+    if any(':' in str(arg) for arg in args):
+        raise ValueError(f"Callback '{name}' arguments must not contain ':'")
+    if args:
+        data += ':' + ':'.join(str(arg_type(arg)) for arg_type, arg in zip(arg_types, args))
+    if len(data.encode('utf-8')) > MAX_CALLBACK_DATA:
+        raise ValueError(f"Callback data for '{name}' exceeds {MAX_CALLBACK_DATA} bytes")
+    return data
+
+def decode_callback(data):
+    """
+    Декодирование callback_data.
+    :param data: Строка callback_data.
+    :return: Кортеж (имя маршрута, аргументы) или (None, ()), если данные не распознаны.
+    """
+    if not data:
+        return None, ()
+    if data[0] == CALLBACK_VERSION:
+        code, _, raw_args = data[1:].partition(':')
+        route = CALLBACK_CODES.get(code)
+        if route is None:
+            return None, ()
+        name, arg_types = route
+        raw_args = raw_args.split(':') if raw_args else []
+        if len(raw_args) != len(arg_types):
+            return None, ()
+        try:
+            return name, tuple(arg_type(arg) for arg_type, arg in zip(arg_types, raw_args))
+        except ValueError:
+            return None, ()
+    name = LEGACY_ROUTES.get(data)
+    if name is not None:
+        return name, ()
+    prefix, _, raw_id = data.rpartition('_')
+    name = LEGACY_ROUTES_WITH_ID.get(prefix)
+    if name is not None and raw_id.isdigit():
+        return name, (int(raw_id),)
+    return None, ()
+
+class CallbackRouter:
+    def __init__(self):
+        """
+        Инициализация маршрутизатора callback-запросов.
+        Обработчики регистрируются по имени маршрута, выбор обработчика - поиск в словаре по коду.
+        """
+        self.handlers = {}  # Имя маршрута -> обработчик
+        self.calls = {}  # Имя маршрута -> количество вызовов
+        self.total_time = {}  # Имя маршрута -> суммарное время обработки в секундах
+        self.max_time = {}  # Имя маршрута -> максимальное время обработки в секундах
+
+    def add(self, name, handler):
+        """
+        Регистрация обработчика маршрута.
+        :param name: Имя маршрута из CALLBACK_ROUTES.
+        :param handler: Асинхронный обработчик handler(call, *args).
+        """
+        if name not in CALLBACK_ROUTES:
+            raise ValueError(f"Unknown callback route: {name}")
+        self.handlers[name] = handler
+        self.calls[name] = 0
+        self.total_time[name] = 0.0
+        self.max_time[name] = 0.0
+
+    async def dispatch(self, call):
+        """
+        Вызов обработчика, соответствующего callback_data.
+        :param call: Объект callback-запроса.
+        :return: True, если обработчик найден.
+        """
+        name, args = decode_callback(call.data)
+        handler = self.handlers.get(name)
+        if handler is None:
+            logger.warning(f"Unknown callback data: {call.data}")
+            return False
+        started = time.perf_counter()
+        try:
+            with span(f"callback:{name}"):
+                await handler(call, *args)
+        finally:
+            elapsed = time.perf_counter() - started
+            HANDLER_SECONDS.observe(elapsed, f"callback:{name}")
+            self.calls[name] += 1
+            self.total_time[name] += elapsed
+            if elapsed > self.max_time[name]:
+                self.max_time[name] = elapsed
+        return True
+
+    def stats(self):
+        """
+        Статистика времени обработки по маршрутам.
+        :return: Словарь имя маршрута -> {'calls', 'avg', 'max'} (время в секундах).
+        """
+        return {
+            name: {
+                'calls': calls,
+                'avg': self.total_time[name] / calls if calls else 0.0,
+                'max': self.max_time[name],
+            }
+            for name, calls in self.calls.items()
+        }
@@ -1,6 +1,7 @@
 import aiosqlite
-from telebot import types
 from database import Database
+from keyboards import MODE_KEYBOARD, MANAGE_KEYBOARD
+from metrics import instrument
 import logging
 
 # Настройка логирования
@@ -8,24 +9,31 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class CommandHandler:
-    def __init__(self, bot, database):
+    def __init__(self, bot, database, usernames, keyboards, mailboxes):
         """
         Инициализация обработчика команд.
         :param bot: Экземпляр бота.
         :param database: Экземпляр базы данных.
+        :param usernames: Кэш имён пользователей.
+        :param keyboards: Кэш клавиатур.
+        :param mailboxes: Почтовые ящики для последовательной обработки обновлений чата.
         """
         self.bot = bot
         self.database = database
+        self.usernames = usernames
+        self.keyboards = keyboards
+        self.mailboxes = mailboxes
 
     def setup_handlers(self):
         """
         Установка обработчиков команд.
         """
-        self.bot.message_handler(commands=['start'])(self.send_welcome)
-        self.bot.message_handler(commands=['quiz'])(self.start_quiz_command)
-        self.bot.message_handler(commands=['leaderboard'])(self.show_leaderboard_command)
-        self.bot.message_handler(commands=['clear_leaderboard'])(self.clear_leaderboard_command)
-        self.bot.message_handler(commands=['manage_quizzes'])(self.manage_quizzes_command)  # управление викторинами
+        serial = self.mailboxes.serial
+        self.bot.message_handler(commands=['start'])(instrument('command:start', serial(self.send_welcome)))
+        self.bot.message_handler(commands=['quiz'])(instrument('command:quiz', serial(self.start_quiz_command)))
+        self.bot.message_handler(commands=['leaderboard'])(instrument('command:leaderboard', serial(self.show_leaderboard_command)))
+        self.bot.message_handler(commands=['clear_leaderboard'])(instrument('command:clear_leaderboard', serial(self.clear_leaderboard_command)))
+        self.bot.message_handler(commands=['manage_quizzes'])(instrument('command:manage_quizzes', serial(self.manage_quizzes_command)))  # управление викторинами
 
     async def send_welcome(self, message):
         """
@@ -34,22 +42,29 @@ class CommandHandler:
         """
         try:
             chat_id = message.chat.id
-            keyboard = types.InlineKeyboardMarkup()
-            keyboard.add(
-                types.InlineKeyboardButton(text="Одиночная", callback_data="single"),
-                types.InlineKeyboardButton(text="PVP-викторина", callback_data="pvp")
-            )
-            await self.bot.send_message(chat_id, "Привет! Выбери тип викторины:", reply_markup=keyboard)
+            self.usernames.remember_message(message)
+            await self.bot.send_message(chat_id, "Привет! Выбери тип викторины:", reply_markup=MODE_KEYBOARD)
         except Exception as e:
             logger.error(f"Error sending welcome message: {e}")
 
     async def start_quiz_command(self, message):
         """
-        Обработчик команды /quiz.
+        Обработчик команды /quiz [начало названия]: первая страница списка викторин.
         :param message: Объект сообщения.
         """
         try:
-            await self.start_quiz(message)
+            chat_id = message.chat.id
+            self.usernames.remember_message(message)
+            _, _, prefix = message.text.partition(' ')
+            keyboard = await self.keyboards.quiz_page(prefix=prefix)
+            if keyboard:
+                await self.bot.send_message(chat_id, "Выберите викторину:", reply_markup=keyboard)
+            else:
+                await self.bot.send_message(chat_id, "Нет доступных викторин.")
+        except ValueError as e:
+            # Кнопки меню не удалось закодировать в callback_data
+            logger.error(f"Error building quiz menu: {e}")
+            await self.bot.send_message(message.chat.id, "Не удалось показать викторины с таким фильтром.")
         except Exception as e:
             logger.error(f"Error starting quiz: {e}")
 
@@ -63,6 +78,18 @@ class CommandHandler:
         except Exception as e:
             logger.error(f"Error showing leaderboard: {e}")
 
+    async def show_leaderboard(self, message):
+        """
+        Отображение лидерборда.
+        :param message: Объект сообщения.
+        """
+        chat_id = message.chat.id
+        leaderboard = await self.database.leaderboard.fetch()
+        if leaderboard:
+            await self.bot.send_message(chat_id, self.database.leaderboard.render(leaderboard))
+        else:
+            await self.bot.send_message(chat_id, "Лидерборд пока пуст.")
+
     async def clear_leaderboard_command(self, message):
         """
         Обработчик команды /clear_leaderboard.
@@ -82,12 +109,6 @@ class CommandHandler:
         """
         try:
             chat_id = message.chat.id
-            keyboard = types.InlineKeyboardMarkup()
-            keyboard.add(
-                types.InlineKeyboardButton(text="Добавить викторину", callback_data="add_quiz"),
-                types.InlineKeyboardButton(text="Обновить викторину", callback_data="update_quiz"),
-                types.InlineKeyboardButton(text="Удалить викторину", callback_data="delete_quiz")
-            )
-            await self.bot.send_message(chat_id, "Выберите действие:", reply_markup=keyboard)
+            await self.bot.send_message(chat_id, "Выберите действие:", reply_markup=MANAGE_KEYBOARD)
         except Exception as e:
             logger.error(f"Error managing quizzes: {e}")
@@ -0,0 +1,118 @@
+import time
+import asyncio
+import aiosqlite
+import logging
+from contextlib import asynccontextmanager
+from metrics import DB_POOL_WAIT_SECONDS
+from tracing import span
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ConnectionPool:
+    def __init__(self, db_name, readers=4):
+        """
+        Инициализация пула соединений с базой данных.
+        Пул держит одно соединение для записи и несколько соединений для чтения,
+        которые открываются один раз при запуске бота и переиспользуются всеми менеджерами.
+        :param db_name: Имя базы данных.
+        :param readers: Количество соединений для чтения.
+        """
+        self.db_name = db_name
+        self.readers_count = readers
+        self.readers = None
+        self.reader_connections = []
+        self.writer_connection = None
+        self.write_lock = asyncio.Lock()
+
+    @property
+    def is_open(self):
+        """
+        Проверка, открыт ли пул.
+        :return: True, если соединения открыты.
+        """
+        return self.writer_connection is not None
+
+    async def open(self):
+        """
+        Открытие соединений пула. Повторный вызов ничего не делает.
+        """
+        if self.is_open:
+            return
+        self.writer_connection = await self._connect()
+        # WAL позволяет читателям работать параллельно с записью
+        await self.writer_connection.execute("PRAGMA journal_mode = WAL")
+        await self.writer_connection.execute("PRAGMA synchronous = NORMAL")
+
+        self.readers = asyncio.Queue()
+        if self.db_name == ':memory:':
+            # База в памяти существует только внутри одного соединения
+            self.readers.put_nowait(self.writer_connection)
+            return
+        for _ in range(self.readers_count):
+            connection = await self._connect()
+            await connection.execute("PRAGMA query_only = ON")
+            self.reader_connections.append(connection)
+            self.readers.put_nowait(connection)
+        logger.info(f"Connection pool opened: {self.db_name} (1 writer, {self.readers_count} readers)")
+
+    async def close(self):
+        """
+        Закрытие всех соединений пула.
+        """
+        for connection in self.reader_connections:
+            await connection.close()
+        self.reader_connections = []
+        self.readers = None
+        if self.writer_connection is not None:
+            await self.writer_connection.close()
+            self.writer_connection = None
+
+    async def _connect(self):
+        """
+        Открытие нового соединения с общими настройками.
+        :return: Соединение с базой данных.
+        """
+        connection = await aiosqlite.connect(self.db_name)
+        await connection.execute("PRAGMA foreign_keys = ON")
+        return connection
+
+    @asynccontextmanager
+    async def reader(self):
+        """
+        Получение соединения для чтения из пула.
+        :return: Соединение с базой данных.
+        """
+        if not self.is_open:
+            await self.open()
+        started = time.perf_counter()
+        with span('db.reader_wait'):
+            connection = await self.readers.get()
+        DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - started, 'reader')
+        try:
+            yield connection
+        finally:
+            self.readers.put_nowait(connection)
+
+    @asynccontextmanager
+    async def writer(self):
+        """
+        Получение единственного соединения для записи. Записи выполняются строго по очереди.
+        Незавершённая транзакция откатывается при выходе из блока.
+        :return: Соединение с базой данных.
+        """
+        if not self.is_open:
+            await self.open()
+        started = time.perf_counter()
+        with span('db.writer_wait'):
+            await self.write_lock.acquire()
+        DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - started, 'writer')
+        try:
+            yield self.writer_connection
+        finally:
+            try:
+                if self.writer_connection.in_transaction:
+                    await self.writer_connection.rollback()
+            finally:
+                self.write_lock.release()
@@ -1,127 +1,124 @@
-import aiosqlite
+import os
+import json
 import logging
+from connection_pool import ConnectionPool
+from quiz_catalog import QuizCatalog
+from leaderboard import LeaderboardEngine
+from migrations import migrate
+from score_writer import ScoreWriter
+from quiz_io import read_rows
+from metrics import DB_SECONDS, timed
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Страница списка викторин по ID: n - следующая после границы, p - предыдущая перед ней
+QUIZ_PAGE_QUERIES = {
+    'n': "SELECT id, name FROM quizzes WHERE id > ? AND name LIKE ? ESCAPE '\\' ORDER BY id LIMIT ?",
+    'p': "SELECT id, name FROM quizzes WHERE id < ? AND name LIKE ? ESCAPE '\\' ORDER BY id DESC LIMIT ?",
+}
+
+def like_prefix(prefix):
+    """
+    Шаблон LIKE для поиска по началу строки.
+    :param prefix: Начало строки.
+    :return: Шаблон с экранированными символами % и _.
+    """
+    return prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+# Начальные викторины: заголовок с версией данных и вопросы в формате JSONL импорта
+SEED_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'seed_quizzes.jsonl')
+
 class Database:
-    def __init__(self, db_name):
+    def __init__(self, db_name, seed_file=SEED_FILE):
         """
         Инициализация базы данных.
         :param db_name: Имя базы данных.
+        :param seed_file: Файл начальных данных или None, если база не заполняется.
         """
         self.db_name = db_name
+        self.seed_file = seed_file
+        self.pool = ConnectionPool(db_name)
+        self.catalog = QuizCatalog(self.pool)
+        self.leaderboard = LeaderboardEngine(self.pool)
+        self.scores = ScoreWriter(self.pool)
+
+    async def open(self):
+        """
+        Открытие пула соединений и запуск фоновой записи результатов. Вызывается один раз при запуске бота.
+        """
+        await self.pool.open()
+        self.scores.start()
 
+    async def close(self):
+        """
+        Запись оставшихся в очереди результатов и закрытие пула соединений.
+        """
+        await self.scores.stop()
+        await self.pool.close()
+
+    @timed(DB_SECONDS, 'initialize_database')
     async def initialize_database(self):
         """
-        Инициализация базы данных. Создает таблицы, если они не существуют, и заполняет их начальными данными.
+        Инициализация базы данных. Применяет миграции схемы и заполняет таблицы начальными данными.
         :return: Сообщение об успешной инициализации.
         """
         try:
-            async with aiosqlite.connect(self.db_name) as db:
-                await db.execute("PRAGMA foreign_keys = ON")
-                cursor = await db.cursor()
-
-                # Проверка на существование таблиц
-                await cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='quizzes'")
-                quizzes_table_exists = await cursor.fetchone()
-
-                await cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='questions'")
-                questions_table_exists = await cursor.fetchone()
-
-                await cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='scores'")
-                scores_table_exists = await cursor.fetchone()
-
-                if not quizzes_table_exists:
-                    # Создание таблицы quizzes
-                    await cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS quizzes (
-                        id INTEGER PRIMARY KEY,
-                        name TEXT UNIQUE
-                    )
-                    ''')
-
-                if not questions_table_exists:
-                    # Создание таблицы questions
-                    await cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS questions (
-                        id INTEGER PRIMARY KEY,
-                        quiz_id INTEGER,
-                        question TEXT UNIQUE,
-                        answer TEXT,
-                        FOREIGN KEY (quiz_id) REFERENCES quizzes (id)
-                    )
-                    ''')
-
-                if not scores_table_exists:
-                    # Создание таблицы scores
-                    await cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS scores (
-                        id INTEGER PRIMARY KEY,
-                        user_id INTEGER,
-                        username TEXT,
-                        quiz_id INTEGER,
-                        score REAL,
-                        FOREIGN KEY (quiz_id) REFERENCES quizzes (id)
-                    )
-                    ''')
-
-                # Добавление базовых викторин и вопросов в базу данных
-                quizzes = [
-                    ('Столицы стран', [
-                        ('Столица Франции?', 'Париж'),
-                        ('Столица Исландии?', 'Рейкьявик'),
-                        ('Столица Германии?', 'Берлин'),
-                        ('Столица Испании?', 'Мадрид'),
-                        ('Столица Белоруссии?', 'Минск'),
-                        ('Столица Италии?', 'Рим')
-                    ]),
-                    ('Животные', [
-                        ('Самое крупное животное на суше - это?', 'Слон'),
-                        ('Самое медленное животное - это?', 'Ленивец'),
-                        ('Самое крупное морское животное - это?', 'Кит'),
-                        ('Самое быстрое животное на суше - это?', 'Гепард')
-                    ]),
-                    ('Растения', [
-                        ('Какое растение вырастает самым высоким?', 'Секвойя'),
-                        ('Какое растение является символом Канады?', 'Клён'),
-                        ('Какое растение сбрасывает иголки на зиму?', 'Лиственница'),
-                        ('Какое дерево считается символом России?', 'Берёза'),
-                        ('Какой цветок изображался на гербе королевской Франции?', 'Лилия'),
-                        ('Какое растение является хищником?', 'Росянка')
-                    ])
-                ]
-
-                # Заполнение базы данных
-                for quiz_name, questions in quizzes:
-                    await cursor.execute("SELECT id FROM quizzes WHERE name = ?", (quiz_name,))
-                    quiz_id = await cursor.fetchone()
-                    if not quiz_id:
-                        await cursor.execute("INSERT INTO quizzes (name) VALUES (?)", (quiz_name,))
-                        quiz_id = cursor.lastrowid
-                    else:
-                        quiz_id = quiz_id[0]
-                    for question, answer in questions:
-                        await cursor.execute("SELECT id FROM questions WHERE question = ?", (question,))
-                        question_id = await cursor.fetchone()
-                        if not question_id:
-                            await cursor.execute("INSERT INTO questions (quiz_id, question, answer) VALUES (?, ?, ?)",
-                                                   (quiz_id, question, answer))
-                await db.commit()
+            async with self.pool.writer() as db:
+                await migrate(db)
+                await self.seed(db)
 
+            await self.catalog.load()
             return "База данных успешно заполнена данными."
         except Exception as e:
             logger.error(f"Error initializing database: {e}")
             return "Ошибка при инициализации базы данных."
 
+    async def seed(self, db):
+        """
+        Заполнение базы начальными викторинами из файла seed_file.
+        Первая строка файла - заголовок с версией начальных данных, остальные строки - вопросы в формате JSONL
+        импорта (quiz, question, answer). Версия уже загруженных данных хранится в таблице meta, и если она
+        совпадает с версией файла, читается только заголовок. Иначе все вопросы записываются одной транзакцией
+        через executemany, уже существующие викторины и вопросы пропускаются.
+        :param db: Соединение для записи.
+        """
+        if not self.seed_file or not os.path.exists(self.seed_file):
+            logger.warning(f"Seed file not found: {self.seed_file}")
+            return
+        with open(self.seed_file, encoding='utf-8') as handle:
+            seed_version = str(json.loads(handle.readline())['seed_version'])
+            cursor = await db.execute("SELECT value FROM meta WHERE key = 'seed_version'")
+            row = await cursor.fetchone()
+            if row is not None and row[0] == seed_version:
+                return
+            rows = []
+            for line_number, quiz, question, answer in read_rows(handle, 'jsonl'):
+                if quiz is None:
+                    logger.warning(f"Skipping invalid seed row {line_number + 1}: {question}")
+                    continue
+                rows.append((quiz, question, answer))
+
+        quiz_names = list(dict.fromkeys(quiz for quiz, _, _ in rows))
+        await db.executemany("INSERT OR IGNORE INTO quizzes (name) VALUES (?)", [(name,) for name in quiz_names])
+        cursor = await db.execute("SELECT name, id FROM quizzes WHERE name IN (SELECT value FROM json_each(?))",
+                                  (json.dumps(quiz_names, ensure_ascii=False),))
+        quiz_ids = dict(await cursor.fetchall())
+        await db.executemany("INSERT OR IGNORE INTO questions (quiz_id, question, answer) VALUES (?, ?, ?)",
+                             [(quiz_ids[quiz], question, answer) for quiz, question, answer in rows])
+        await db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('seed_version', ?)", (seed_version,))
+        await db.commit()
+        logger.info(f"Seed data version {seed_version} loaded: {len(rows)} questions")
+
+    @timed(DB_SECONDS, 'clear_leaderboard')
     async def clear_leaderboard(self):
         """
         Очистка лидерборда. Удаляет все записи из таблицы scores.
         :return: Сообщение об успешной очистке.
         """
         try:
-            async with aiosqlite.connect(self.db_name) as db:
+            async with self.pool.writer() as db:
                 await db.execute("DELETE FROM scores")
                 await db.commit()
             return "Лидерборд успешно очищен."
@@ -129,6 +126,7 @@ class Database:
             logger.error(f"Error clearing leaderboard: {e}")
             return "Ошибка при очистке лидерборда."
 
+    @timed(DB_SECONDS, 'add_quiz')
     async def add_quiz(self, quiz_name, questions):
         """
         Добавление новой викторины.
@@ -137,27 +135,26 @@ class Database:
         :return: Сообщение об успешном добавлении.
         """
         try:
-            async with aiosqlite.connect(self.db_name) as db:
+            async with self.pool.writer() as db:
                 cursor = await db.cursor()
                 await db.execute("BEGIN")
                 try:
                     await cursor.execute("INSERT INTO quizzes (name) VALUES (?)", (quiz_name,))
                     quiz_id = cursor.lastrowid
-                    for question, answer in questions:
-                        await cursor.execute("SELECT id FROM questions WHERE question = ?", (question,))
-                        question_id = await cursor.fetchone()
-                        if not question_id:
-                            await cursor.execute("INSERT INTO questions (quiz_id, question, answer) VALUES (?, ?, ?)",
-                                                 (quiz_id, question, answer))
+                    # Вопросы уникальны во всей базе: уже существующие пропускаются
+                    await cursor.executemany("INSERT OR IGNORE INTO questions (quiz_id, question, answer) VALUES (?, ?, ?)",
+                                             [(quiz_id, question, answer) for question, answer in questions])
                     await db.commit()
                 except Exception as e:
                     await db.rollback()
                     raise e
+            await self.catalog.reload_quiz(quiz_id)
             return f"Викторина '{quiz_name}' успешно добавлена."
         except Exception as e:
             logger.error(f"Error adding quiz: {e}")
             return f"Ошибка при добавлении викторины '{quiz_name}'."
 
+    @timed(DB_SECONDS, 'update_quiz')
     async def update_quiz(self, quiz_name, new_quiz_name, questions):
         """
         Обновление существующей викторины.
@@ -167,7 +164,7 @@ class Database:
         :return: Сообщение об успешном обновлении.
         """
         try:
-            async with aiosqlite.connect(self.db_name) as db:
+            async with self.pool.writer() as db:
                 cursor = await db.cursor()
                 await db.execute("BEGIN")
                 try:
@@ -187,11 +184,13 @@ class Database:
                 except Exception as e:
                     await db.rollback()
                     raise e
+            await self.catalog.reload_quiz(quiz_id)
             return f"Викторина '{quiz_name}' успешно обновлена на '{new_quiz_name}'."
         except Exception as e:
             logger.error(f"Error updating quiz: {e}")
             return f"Ошибка при обновлении викторины '{quiz_name}'."
 
+    @timed(DB_SECONDS, 'delete_quiz')
     async def delete_quiz(self, quiz_name):
         """
         Удаление викторины по названию.
@@ -199,7 +198,7 @@ class Database:
         :return: Сообщение об успешном удалении.
         """
         try:
-            async with aiosqlite.connect(self.db_name) as db:
+            async with self.pool.writer() as db:
                 cursor = await db.cursor()
                 await db.execute("BEGIN")
                 try:
@@ -207,6 +206,8 @@ class Database:
                     quiz_id = await cursor.fetchone()
                     if quiz_id:
                         quiz_id = quiz_id[0]
+                        # Результаты ссылаются на викторину внешним ключом и удаляются вместе с ней
+                        await cursor.execute("DELETE FROM scores WHERE quiz_id = ?", (quiz_id,))
                         await cursor.execute("DELETE FROM questions WHERE quiz_id = ?", (quiz_id,))
                         await cursor.execute("DELETE FROM quizzes WHERE name = ?", (quiz_name,))
                         await db.commit()
@@ -216,11 +217,13 @@ class Database:
                 except Exception as e:
                     await db.rollback()
                     raise e
+            self.catalog.remove_quiz(quiz_id)
             return f"Викторина '{quiz_name}' успешно удалена."
         except Exception as e:
             logger.error(f"Error deleting quiz: {e}")
             return f"Ошибка при удалении викторины '{quiz_name}'."
 
+    @timed(DB_SECONDS, 'delete_quiz_by_id')
     async def delete_quiz_by_id(self, quiz_id):
         """
         Удаление викторины по ID.
@@ -228,7 +231,7 @@ class Database:
         :return: Сообщение об успешном удалении.
         """
         try:
-            async with aiosqlite.connect(self.db_name) as db:
+            async with self.pool.writer() as db:
                 cursor = await db.cursor()
                 await db.execute("BEGIN")
                 try:
@@ -237,9 +240,12 @@ class Database:
                     quiz_name = await cursor.fetchone()
                     quiz_name = quiz_name[0] if quiz_name else "Unknown Quiz"
 
+                    # Результаты ссылаются на викторину внешним ключом и удаляются вместе с ней
+                    await cursor.execute("DELETE FROM scores WHERE quiz_id = ?", (quiz_id,))
                     await cursor.execute("DELETE FROM questions WHERE quiz_id = ?", (quiz_id,))
                     await cursor.execute("DELETE FROM quizzes WHERE id = ?", (quiz_id,))
                     await db.commit()
+                    self.catalog.remove_quiz(quiz_id)
                     return f"Викторина '{quiz_name}' успешно удалена."
                 except Exception as e:
                     await db.rollback()
@@ -248,34 +254,53 @@ class Database:
             logger.error(f"Error deleting quiz by ID: {e}")
             return f"Ошибка при удалении викторины с ID {quiz_id}."
 
+    @timed(DB_SECONDS, 'get_quizzes')
     async def get_quizzes(self):
         """
-        Получение списка всех викторин.
+        Получение списка всех викторин из кэша каталога.
         :return: Список викторин.
         """
         try:
-            async with aiosqlite.connect(self.db_name) as db:
-                cursor = await db.cursor()
-                await cursor.execute("SELECT id, name FROM quizzes")
-                return await cursor.fetchall()
+            await self.catalog.ensure_loaded()
+            return self.catalog.get_quizzes()
         except Exception as e:
             logger.error(f"Error getting quizzes: {e}")
             return []
 
+    @timed(DB_SECONDS, 'get_quiz_page')
+    async def get_quiz_page(self, direction='n', anchor=0, prefix='', limit=10):
+        """
+        Получение страницы списка викторин по ключу (keyset): викторины с ID больше границы (n) или
+        меньше неё (p), упорядоченные по ID. Стоимость запроса не зависит от номера страницы.
+        :param direction: Направление: n - следующая страница, p - предыдущая.
+        :param anchor: ID-граница: последний ID предыдущей страницы или первый ID следующей.
+        :param prefix: Начало названия викторины или пустая строка.
+        :param limit: Размер страницы.
+        :return: Список пар (ID, название) по возрастанию ID и признак того, что в этом направлении есть ещё викторины.
+        """
+        try:
+            async with self.pool.reader() as db:
+                cursor = await db.execute(QUIZ_PAGE_QUERIES[direction], (anchor, like_prefix(prefix), limit + 1))
+                rows = await cursor.fetchall()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            if direction == 'p':
+                rows.reverse()
+            return rows, has_more
+        except Exception as e:
+            logger.error(f"Error getting quiz page: {e}")
+            return [], False
+
+    @timed(DB_SECONDS, 'get_quiz_details')
     async def get_quiz_details(self, quiz_id):
         """
-        Получение деталей викторины по её ID.
+        Получение деталей викторины по её ID из кэша каталога.
         :param quiz_id: ID викторины.
         :return: Название викторины и список вопросов.
         """
         try:
-            async with aiosqlite.connect(self.db_name) as db:
-                cursor = await db.cursor()
-                await cursor.execute("SELECT name FROM quizzes WHERE id = ?", (quiz_id,))
-                quiz_name = await cursor.fetchone()
-                await cursor.execute("SELECT question, answer FROM questions WHERE quiz_id = ?", (quiz_id,))
-                questions = await cursor.fetchall()
-                return quiz_name[0], questions
+            await self.catalog.ensure_loaded()
+            return self.catalog.get_quiz_details(quiz_id)
         except Exception as e:
             logger.error(f"Error getting quiz details: {e}")
             return None, []
@@ -0,0 +1,86 @@
+import time
+from collections import OrderedDict
+
+class EditorSession:
+    __slots__ = ('action', 'step', 'quiz', 'touched')
+
+    def __init__(self, action, step):
+        """
+        Инициализация сессии редактора викторин одного чата.
+        :param action: Текущее действие (add_quiz, update_quiz, delete_quiz).
+        :param step: Текущий шаг действия.
+        """
+        self.action = action
+        self.step = step
+        self.quiz = {}
+        self.touched = time.monotonic()
+
+    @property
+    def state(self):
+        """
+        Состояние сессии для выбора обработчика.
+        :return: Кортеж (действие, шаг).
+        """
+        return self.action, self.step
+
+class EditorSessionStore:
+    def __init__(self, ttl=1800):
+        """
+        Инициализация хранилища сессий редактора викторин.
+        Сессии хранятся отдельно для каждого чата и удаляются после ttl секунд бездействия.
+        :param ttl: Время жизни неактивной сессии в секундах.
+        """
+        self.ttl = ttl
+        self.sessions = OrderedDict()  # chat_id -> EditorSession, от давно неактивных к недавним
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def start(self, chat_id, action, step=None):
+        """
+        Начало новой сессии редактора. Предыдущая сессия чата заменяется.
+        :param chat_id: ID чата.
+        :param action: Действие.
+        :param step: Первый шаг действия.
+        :return: Новая сессия.
+        """
+        self.evict_expired()
+        session = EditorSession(action, step)
+        self.sessions[chat_id] = session
+        self.sessions.move_to_end(chat_id)
+        return session
+
+    def get(self, chat_id):
+        """
+        Получение активной сессии чата с продлением её времени жизни.
+        :param chat_id: ID чата.
+        :return: Сессия или None.
+        """
+        session = self.sessions.get(chat_id)
+        if session is None:
+            return None
+        now = time.monotonic()
+        if now - session.touched > self.ttl:
+            del self.sessions[chat_id]
+            return None
+        session.touched = now
+        self.sessions.move_to_end(chat_id)
+        return session
+
+    def finish(self, chat_id):
+        """
+        Завершение сессии чата.
+        :param chat_id: ID чата.
+        """
+        self.sessions.pop(chat_id, None)
+
+    def evict_expired(self):
+        """
+        Удаление сессий, неактивных дольше ttl. Проверяются только самые старые сессии.
+        """
+        deadline = time.monotonic() - self.ttl
+        while self.sessions:
+            chat_id, session = next(iter(self.sessions.items()))
+            if session.touched > deadline:
+                break
+            del self.sessions[chat_id]
@@ -0,0 +1,229 @@
+import json
+import time
+import asyncio
+import itertools
+import logging
+from telebot import types
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class SentMessage:
+    __slots__ = ('chat', 'message_id', 'text', 'reply_markup')
+
+    def __init__(self, chat_id, message_id, text, reply_markup):
+        """
+        Сообщение, "отправленное" имитацией бота.
+        :param chat_id: ID чата.
+        :param message_id: ID сообщения.
+        :param text: Текст сообщения.
+        :param reply_markup: Клавиатура сообщения.
+        """
+        self.chat = types.Chat(chat_id, 'private')
+        self.message_id = message_id
+        self.text = text
+        self.reply_markup = reply_markup
+
+    def buttons(self):
+        """
+        Кнопки встроенной клавиатуры сообщения.
+        :return: Список пар (текст кнопки, callback_data).
+        """
+        markup = self.reply_markup
+        if markup is None:
+            return []
+        if isinstance(markup, str):
+            rows = json.loads(markup).get('inline_keyboard', [])
+            return [(button['text'], button.get('callback_data')) for row in rows for button in row]
+        if isinstance(markup, types.InlineKeyboardMarkup):
+            return [(button.text, button.callback_data) for row in markup.keyboard for button in row]
+        return []
+
+class FakeBot:
+    def __init__(self, api_latency=0.0):
+        """
+        Инициализация имитации AsyncTeleBot для нагрузочного тестирования.
+        Обработчики регистрируются так же, как в AsyncTeleBot, обновления передаются через
+        process_new_updates, а исходящие сообщения складываются во входящие очереди чатов,
+        откуда их читают имитируемые пользователи. Время работы каждого обработчика записывается.
+        :param api_latency: Искусственная задержка каждого запроса к API в секундах.
+        """
+        self.api_latency = api_latency
+        self.message_handlers = []  # Пары (обработчик, фильтры)
+        self.callback_handlers = []
+        self.inboxes = {}  # chat_id -> asyncio.Queue отправленных сообщений
+        self.message_ids = itertools.count(1)
+        self.update_ids = itertools.count(1)
+        self.latencies = {'command': [], 'text': [], 'callback': []}  # Время обработки обновлений в секундах
+        self.api_calls = 0
+
+    def message_handler(self, commands=None, func=None, **kwargs):
+        """
+        Регистрация обработчика сообщений.
+        :param commands: Список команд без '/'.
+        :param func: Функция-фильтр.
+        :return: Декоратор.
+        """
+        def decorator(handler):
+            self.message_handlers.append((handler, commands, func))
+            return handler
+        return decorator
+
+    def callback_query_handler(self, func=None, **kwargs):
+        """
+        Регистрация обработчика callback-запросов.
+        :param func: Функция-фильтр.
+        :return: Декоратор.
+        """
+        def decorator(handler):
+            self.callback_handlers.append((handler, None, func))
+            return handler
+        return decorator
+
+    def inbox(self, chat_id):
+        """
+        Очередь сообщений, отправленных ботом в чат.
+        :param chat_id: ID чата.
+        :return: asyncio.Queue.
+        """
+        inbox = self.inboxes.get(chat_id)
+        if inbox is None:
+            inbox = self.inboxes[chat_id] = asyncio.Queue()
+        return inbox
+
+    async def _api_call(self):
+        """
+        Учёт запроса к API и имитация сетевой задержки.
+        """
+        self.api_calls += 1
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+
+    async def send_message(self, chat_id, text, reply_markup=None, **kwargs):
+        await self._api_call()
+        message = SentMessage(chat_id, next(self.message_ids), text, reply_markup)
+        self.inbox(chat_id).put_nowait(message)
+        return message
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, reply_markup=None, **kwargs):
+        await self._api_call()
+        return True
+
+    async def get_chat(self, chat_id):
+        await self._api_call()
+        return types.Chat(chat_id, 'private', username=f"user{chat_id}")
+
+    async def answer_callback_query(self, callback_query_id, *args, **kwargs):
+        await self._api_call()
+        return True
+
+    async def set_webhook(self, *args, **kwargs):
+        return True
+
+    def message_update(self, chat_id, text):
+        """
+        Создание обновления с текстовым сообщением пользователя.
+        :param chat_id: ID чата (совпадает с ID пользователя).
+        :param text: Текст сообщения.
+        :return: types.Update.
+        """
+        user = {'id': chat_id, 'is_bot': False, 'first_name': 'User', 'username': f"user{chat_id}"}
+        message = {
+            'message_id': next(self.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private', 'username': f"user{chat_id}"},
+            'from': user,
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return types.Update.de_json({'update_id': next(self.update_ids), 'message': message})
+
+    def callback_update(self, chat_id, data):
+        """
+        Создание обновления с нажатием кнопки встроенной клавиатуры.
+        :param chat_id: ID чата (совпадает с ID пользователя).
+        :param data: callback_data кнопки.
+        :return: types.Update.
+        """
+        user = {'id': chat_id, 'is_bot': False, 'first_name': 'User', 'username': f"user{chat_id}"}
+        message = {
+            'message_id': next(self.message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private', 'username': f"user{chat_id}"},
+            'text': '',
+        }
+        callback_query = {'id': str(next(self.update_ids)), 'from': user, 'message': message, 'chat_instance': str(chat_id), 'data': data}
+        return types.Update.de_json({'update_id': next(self.update_ids), 'callback_query': callback_query})
+
+    async def process_new_updates(self, updates):
+        """
+        Обработка обновлений первым подходящим обработчиком, как в AsyncTeleBot.
+        :param updates: Список types.Update.
+        """
+        for update in updates:
+            if update.message is not None:
+                message = update.message
+                command = message.text[1:].split()[0].split('@')[0] if message.text and message.text.startswith('/') else None
+                kind = 'command' if command else 'text'
+                for handler, commands, func in self.message_handlers:
+                    if commands is not None and command not in commands:
+                        continue
+                    if func is not None and not func(message):
+                        continue
+                    await self._timed(kind, handler, message)
+                    break
+            elif update.callback_query is not None:
+                call = update.callback_query
+                for handler, _, func in self.callback_handlers:
+                    if func is None or func(call):
+                        await self._timed('callback', handler, call)
+                        break
+
+    async def _timed(self, kind, handler, argument):
+        """
+        Вызов обработчика с замером времени.
+        :param kind: Вид обновления: command, text или callback.
+        :param handler: Обработчик.
+        :param argument: Сообщение или callback-запрос.
+        """
+        started = time.perf_counter()
+        try:
+            await handler(argument)
+        except Exception as e:
+            logger.error(f"Error in handler {getattr(handler, '__name__', handler)}: {e}")
+        finally:
+            self.latencies[kind].append(time.perf_counter() - started)
+
+    async def send_text(self, chat_id, text):
+        """
+        Отправка боту текстового сообщения от пользователя.
+        :param chat_id: ID чата.
+        :param text: Текст сообщения.
+        """
+        await self.process_new_updates([self.message_update(chat_id, text)])
+
+    async def press(self, chat_id, data):
+        """
+        Нажатие пользователем кнопки встроенной клавиатуры.
+        :param chat_id: ID чата.
+        :param data: callback_data кнопки.
+        """
+        await self.process_new_updates([self.callback_update(chat_id, data)])
+
+    async def wait_for(self, chat_id, predicate, timeout=30):
+        """
+        Ожидание сообщения бота в чате, удовлетворяющего условию. Остальные сообщения пропускаются.
+        :param chat_id: ID чата.
+        :param predicate: Условие predicate(SentMessage).
+        :param timeout: Максимальное время ожидания в секундах.
+        :return: SentMessage.
+        """
+        inbox = self.inbox(chat_id)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            message = await asyncio.wait_for(inbox.get(), max(0, deadline - loop.time()))
+            if predicate(message):
+                return message
@@ -1,19 +1,43 @@
-import aiosqlite
-from telebot import types
 import logging
+from keyboards import MAIN_KEYBOARD
+from send_scheduler import PRIORITY_QUESTION
+from answer_matcher import compile_answer
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Префикс ключей одиночных викторин в хранилище сессий
+SESSION_PREFIX = "game:"
+
+def session_key(chat_id):
+    """
+    Ключ одиночной викторины в хранилище сессий.
+    :param chat_id: ID чата.
+    :return: Ключ.
+    """
+    return f"{SESSION_PREFIX}{chat_id}"
+
 class GameStateManager:
-    def __init__(self, bot):
+    def __init__(self, bot, database, usernames, sessions, reaper, keyboards):
         """
         Инициализация менеджера состояния одиночных викторин.
+        Состояние викторин хранится в хранилище сессий: номер вопроса - число уже отправленных вопросов,
+        счёт - число правильных ответов.
         :param bot: Экземпляр бота.
+        :param database: Экземпляр базы данных.
+        :param usernames: Кэш имён пользователей.
+        :param sessions: Хранилище сессий.
+        :param reaper: Очистка брошенных сессий.
+        :param keyboards: Кэш клавиатур.
         """
         self.bot = bot
-        self.game_state = {}
+        self.database = database
+        self.usernames = usernames
+        self.sessions = sessions
+        self.reaper = reaper
+        self.keyboards = keyboards
+        self.reaper.add(SESSION_PREFIX, self.evict_session)
 
     async def start_quiz_game(self, chat_id, quiz_id):
         """
@@ -22,35 +46,31 @@ class GameStateManager:
         :param quiz_id: ID викторины.
         """
         try:
-            async with aiosqlite.connect('quiz.db') as db:
-                cursor = await db.cursor()
-                await cursor.execute("SELECT question, answer FROM questions WHERE quiz_id = ? ORDER BY RANDOM()", (quiz_id,))
-                questions = await cursor.fetchall()
-                if questions:
-                    self.game_state[chat_id] = {
-                        'questions': questions,
-                        'current_question': 0,
-                        'score': 0,
-                        'answer': None,
-                        'quiz_id': quiz_id
-                    }
-                    await self.send_next_question(chat_id)
-                else:
-                    await self.bot.send_message(chat_id, "Викторина не найдена.")
+            questions = await self.fetch_questions(quiz_id)
+            if questions:
+                await self.reaper.make_room()
+                await self.sessions.put(session_key(chat_id), {
+                    'questions': questions,
+                    'question': 0,
+                    'score': 0,
+                    'answer': None,
+                    'quiz_id': quiz_id
+                })
+                await self.send_next_question(chat_id)
+            else:
+                await self.bot.send_message(chat_id, "Викторина не найдена.")
         except Exception as e:
             logger.error(f"Error starting quiz game: {e}")
 
     async def fetch_questions(self, quiz_id):
         """
-        Получение вопросов викторины.
+        Получение вопросов викторины в случайном порядке из кэша каталога.
         :param quiz_id: ID викторины.
         :return: Список вопросов.
         """
         try:
-            async with aiosqlite.connect('quiz.db') as db:
-                cursor = await db.cursor()
-                await cursor.execute("SELECT question, answer FROM questions WHERE quiz_id = ? ORDER BY RANDOM()", (quiz_id,))
-                return await cursor.fetchall()
+            await self.database.catalog.ensure_loaded()
+            return self.database.catalog.get_questions(quiz_id)
         except Exception as e:
             logger.error(f"Error fetching questions: {e}")
             return []
@@ -72,19 +92,59 @@ class GameStateManager:
         :param chat_id: ID чата.
         """
         try:
-            if chat_id in self.game_state:
-                current_question = self.game_state[chat_id]['current_question']
-                questions = self.game_state[chat_id]['questions']
+            key = session_key(chat_id)
+            session = await self.sessions.get(key)
+            if session is not None:
+                current_question = session['question']
+                questions = session['questions']
                 if current_question < len(questions):
                     question, answer = questions[current_question]
-                    self.game_state[chat_id]['current_question'] += 1
-                    self.game_state[chat_id]['answer'] = answer
-                    await self.bot.send_message(chat_id, question)
+                    if await self.sessions.compare_and_set(key, current_question, current_question + 1, updates={'answer': answer}) is not None:
+                        await self.bot.send_message(chat_id, question, priority=PRIORITY_QUESTION)
                 else:
                     await self.finish_quiz(chat_id)
         except Exception as e:
             logger.error(f"Error sending next question: {e}")
 
+    async def answer_question(self, chat_id, text):
+        """
+        Обработка ответа на текущий вопрос одиночной викторины.
+        Проверка ответа, начисление очка и переход к следующему вопросу выполняются одним compare_and_set,
+        поэтому повторно доставленный или параллельно обработанный ответ не будет засчитан дважды.
+        :param chat_id: ID чата.
+        :param text: Текст ответа.
+        :return: True, если в чате идёт одиночная викторина.
+        """
+        try:
+            key = session_key(chat_id)
+            session = await self.sessions.get(key)
+            if session is None:
+                return False
+            if session.get('answer') is None:
+                return True
+            current_question = session['question']
+            questions = session['questions']
+            correct = compile_answer(session['answer']).matches(text)
+            next_question = questions[current_question] if current_question < len(questions) else None
+            session = await self.sessions.compare_and_set(
+                key, current_question, current_question + 1,
+                score_delta=1 if correct else 0,
+                updates={'answer': next_question[1] if next_question else None}
+            )
+            if session is None:
+                return True  # Ответ на уже пройденный вопрос
+            await self.bot.send_message(chat_id, "Правильно!" if correct else "Неправильно!")
+
+            # Отправляем следующий вопрос, если он есть
+            if next_question:
+                await self.bot.send_message(chat_id, next_question[0], priority=PRIORITY_QUESTION)
+            else:
+                await self.finish_quiz(chat_id)
+            return True
+        except Exception as e:
+            logger.error(f"Error answering question: {e}")
+            return True
+
     async def finish_quiz(self, chat_id, silent=False):
         """
         Завершение викторины.
@@ -94,17 +154,30 @@ class GameStateManager:
 
         """
         try:
-            if chat_id in self.game_state:
-                score = self.game_state[chat_id]['score']
-                total_questions = len(self.game_state[chat_id]['questions'])
-                await self.save_score(chat_id, self.game_state[chat_id]['quiz_id'], score)
+            key = session_key(chat_id)
+            session = await self.sessions.get(key)
+            if session is not None:
+                await self.sessions.delete(key)  # Очистка состояния игры
+                score = session['score']
+                total_questions = len(session['questions'])
+                await self.save_score(chat_id, session['quiz_id'], score)
                 if not silent:
                     await self.bot.send_message(chat_id, f"Викторина завершена! Ваш счёт {score} из {total_questions}", reply_markup=self.get_main_keyboard())
-                    await self.ask_for_next_action(chat_id, self.game_state[chat_id]['quiz_id'])
-                del self.game_state[chat_id]  # Очистка состояния игры
+                    await self.ask_for_next_action(chat_id, session['quiz_id'])
         except Exception as e:
             logger.error(f"Error finishing quiz: {e}")
 
+    async def evict_session(self, key, session, reason):
+        """
+        Завершение брошенной викторины очисткой сессий. Набранный счёт сохраняется.
+        :param key: Ключ сессии.
+        :param session: Сессия.
+        :param reason: Причина: idle или lru.
+        :return: True.
+        """
+        await self.finish_quiz(int(key[len(SESSION_PREFIX):]), silent=True)
+        return True
+
     async def ask_for_next_action(self, chat_id, quiz_id):
         """
         Запрос следующего действия после завершения викторины.
@@ -112,54 +185,26 @@ class GameStateManager:
         :param quiz_id: ID викторины.
         """
         try:
-            keyboard = types.InlineKeyboardMarkup()
-            keyboard.add(
-                types.InlineKeyboardButton(text="Пройти заново", callback_data=f"replay_{quiz_id}"),
-                types.InlineKeyboardButton(text="Другая викторина", callback_data="newquiz")
-            )
-            await self.bot.send_message(chat_id, "Сыграем ещё?", reply_markup=keyboard)
+            await self.bot.send_message(chat_id, "Сыграем ещё?", reply_markup=self.keyboards.next_action(quiz_id))
         except Exception as e:
             logger.error(f"Error asking for next action: {e}")
 
     def get_main_keyboard(self):
         """
         Получение основной клавиатуры.
-        :return: Основная клавиатура.
+        :return: Основная клавиатура (JSON-строка).
         """
-        keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
-        keyboard.add(
-            types.KeyboardButton("Новая викторина"),
-            types.KeyboardButton("Смена режима"),
-            types.KeyboardButton("Лидерборд")
-        )
-        return keyboard
+        return MAIN_KEYBOARD
 
     async def save_score(self, chat_id, quiz_id, score):
         """
-        Сохранение результата викторины.
+        Сохранение результата викторины. Результат ставится в очередь и записывается в базу в фоне.
         :param chat_id: ID чата.
         :param quiz_id: ID викторины.
         :param score: Результат викторины.
         """
         try:
-            chat = await self.bot.get_chat(chat_id)
-            username = chat.username
-            async with aiosqlite.connect('quiz.db') as db:
-                cursor = await db.cursor()
-                await cursor.execute("SELECT score FROM scores WHERE user_id = ? AND quiz_id = ?", (chat_id, quiz_id))
-                existing_score = await cursor.fetchone()
-
-                # Получаем название викторины по её ID
-                await cursor.execute("SELECT name FROM quizzes WHERE id = ?", (quiz_id,))
-                quiz_name = await cursor.fetchone()
-                quiz_name = quiz_name[0] if quiz_name else "Unknown Quiz"
-
-                # Сравниваем лучший результат
-                if existing_score is None or score > existing_score[0]:
-                    await cursor.execute(
-                        "INSERT OR REPLACE INTO scores (user_id, username, quiz_id, score) VALUES (?, ?, ?, ?)",
-                        (chat_id, username, quiz_id, score))
-                    await db.commit()
-                    logger.info(f"Score saved: {username} - {quiz_name} - {score}")
+            username = await self.usernames.get(chat_id)
+            self.database.scores.submit(chat_id, username, quiz_id, score)
         except Exception as e:
             logger.error(f"Error saving score: {e}")
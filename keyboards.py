@@ -0,0 +1,179 @@
+import logging
+from collections import OrderedDict
+from telebot import types
+from callback_router import encode_callback, CALLBACK_ROUTES, MAX_CALLBACK_DATA
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Максимальная длина фильтра по началу названия: фильтр передаётся в callback_data кнопок страниц
+MAX_PREFIX_LENGTH = 20
+# Байты callback_data, остающиеся для фильтра после остальных полей кнопки страницы с самым длинным ID
+MAX_PREFIX_BYTES = MAX_CALLBACK_DATA - max(
+    len(encode_callback("quiz_page", code, "n", 2 ** 63 - 1, "").encode('utf-8')) for code, _ in CALLBACK_ROUTES.values()
+)
+
+def serialize(keyboard):
+    """
+    Сериализация клавиатуры в JSON. Готовая строка передаётся в reply_markup как есть,
+    поэтому при отправке клавиатура не собирается и не сериализуется заново.
+    :param keyboard: Клавиатура telebot.
+    :return: JSON-строка.
+    """
+    return keyboard.to_json()
+
+def inline_keyboard(*rows):
+    """
+    Построение встроенной клавиатуры.
+    :param rows: Ряды кнопок, каждая кнопка - пара (текст, callback_data).
+    :return: JSON-строка клавиатуры.
+    """
+    keyboard = types.InlineKeyboardMarkup()
+    for row in rows:
+        keyboard.add(*(types.InlineKeyboardButton(text=text, callback_data=data) for text, data in row))
+    return serialize(keyboard)
+
+def build_main_keyboard():
+    """
+    Построение основной клавиатуры.
+    :return: JSON-строка клавиатуры.
+    """
+    keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    keyboard.add(
+        types.KeyboardButton("Новая викторина"),
+        types.KeyboardButton("Смена режима"),
+        types.KeyboardButton("Лидерборд")
+    )
+    return serialize(keyboard)
+
+# Клавиатуры, не зависящие от данных, строятся один раз при импорте
+MAIN_KEYBOARD = build_main_keyboard()
+MODE_KEYBOARD = inline_keyboard((("Одиночная", encode_callback("single")), ("PVP-викторина", encode_callback("pvp"))))
+DONE_KEYBOARD = inline_keyboard((("Готово", encode_callback("done")),))
+LEAVE_QUEUE_KEYBOARD = inline_keyboard((("Покинуть очередь", encode_callback("leave_queue")),))
+MANAGE_KEYBOARD = inline_keyboard((
+    ("Добавить викторину", encode_callback("add_quiz")),
+    ("Обновить викторину", encode_callback("update_quiz")),
+    ("Удалить викторину", encode_callback("delete_quiz"))
+))
+
+def normalize_prefix(prefix):
+    """
+    Приведение фильтра по началу названия викторины к виду, который помещается в callback_data.
+    Фильтр обрезается по символам, поэтому многобайтовые символы не разрезаются.
+    :param prefix: Введённый пользователем фильтр или None.
+    :return: Фильтр без ':', не длиннее MAX_PREFIX_LENGTH символов и MAX_PREFIX_BYTES байт в UTF-8.
+    """
+    prefix = (prefix or '').replace(':', '').strip()[:MAX_PREFIX_LENGTH]
+    while len(prefix.encode('utf-8')) > MAX_PREFIX_BYTES:
+        prefix = prefix[:-1]
+    return prefix.rstrip()
+
+def page_callback(route, direction, anchor, prefix):
+    """
+    callback_data кнопки перехода между страницами списка викторин.
+    :param route: Маршрут кнопок викторин: quiz, select_quiz или delete_quiz_id.
+    :param direction: Направление: n - следующая страница, p - предыдущая.
+    :param anchor: ID-граница страницы.
+    :param prefix: Фильтр по началу названия.
+    :return: Строка callback_data.
+    """
+    return encode_callback("quiz_page", CALLBACK_ROUTES[route][0], direction, anchor, prefix)
+
+class KeyboardCache:
+    def __init__(self, database, page_size=10, max_pages=256):
+        """
+        Инициализация кэша клавиатур, построенных по каталогу викторин.
+        Клавиатуры хранятся сериализованными и перестраиваются только после изменения каталога
+        (по номеру версии каталога). Список викторин разбит на страницы по page_size, каждая страница
+        читается из базы одним запросом по ключу, поэтому стоимость меню не зависит от размера каталога.
+        :param database: Экземпляр базы данных.
+        :param page_size: Количество викторин на странице.
+        :param max_pages: Максимальное количество страниц в кэше (вытесняются давно не использованные).
+        """
+        self.database = database
+        self.catalog = database.catalog
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.version = None  # Версия каталога, по которой построены клавиатуры
+        self.pages = OrderedDict()  # (маршрут, направление, граница, фильтр) -> клавиатура или None
+        self.next_actions = {}  # ID викторины -> клавиатура "Сыграем ещё?"
+        self.hits = 0
+        self.builds = 0
+
+    def _check_version(self):
+        """
+        Сброс клавиатур, построенных по устаревшей версии каталога.
+        """
+        if self.version != self.catalog.version:
+            self.version = self.catalog.version
+            self.pages = OrderedDict()
+            self.next_actions = {}
+
+    async def quiz_page(self, route="quiz", direction='n', anchor=0, prefix=''):
+        """
+        Клавиатура страницы списка викторин с кнопками "Назад" и "Далее".
+        :param route: Маршрут callback-запроса кнопок викторин: quiz, select_quiz или delete_quiz_id.
+        :param direction: Направление от границы: n - викторины после неё, p - перед ней.
+        :param anchor: ID-граница, 0 для первой страницы.
+        :param prefix: Фильтр по началу названия.
+        :return: JSON-строка клавиатуры или None, если на странице нет викторин.
+        """
+        prefix = normalize_prefix(prefix)
+        key = (route, direction, anchor, prefix)
+        self._check_version()
+        if key in self.pages:
+            self.pages.move_to_end(key)
+            self.hits += 1
+            return self.pages[key]
+
+        version = self.version
+        quizzes, has_more = await self.database.get_quiz_page(direction, anchor, prefix, self.page_size)
+        keyboard = None
+        if quizzes:
+            rows = [((quiz_name, encode_callback(route, quiz_id)),) for quiz_id, quiz_name in quizzes]
+            # На следующую страницу пришли с предыдущей, на предыдущую - со следующей
+            has_previous, has_next = (anchor > 0, has_more) if direction == 'n' else (has_more, True)
+            navigation = []
+            if has_previous:
+                navigation.append(("« Назад", page_callback(route, 'p', quizzes[0][0], prefix)))
+            if has_next:
+                navigation.append(("Далее »", page_callback(route, 'n', quizzes[-1][0], prefix)))
+            if navigation:
+                rows.append(tuple(navigation))
+            keyboard = inline_keyboard(*rows)
+        self.builds += 1
+
+        # Каталог мог измениться во время запроса: такая страница не кэшируется
+        self._check_version()
+        if self.version == version:
+            self.pages[key] = keyboard
+            if len(self.pages) > self.max_pages:
+                self.pages.popitem(last=False)
+        return keyboard
+
+    def next_action(self, quiz_id):
+        """
+        Клавиатура после завершения викторины: "Пройти заново" и "Другая викторина".
+        :param quiz_id: ID викторины.
+        :return: JSON-строка клавиатуры.
+        """
+        self._check_version()
+        keyboard = self.next_actions.get(quiz_id)
+        if keyboard is not None:
+            self.hits += 1
+            return keyboard
+        keyboard = self.next_actions[quiz_id] = inline_keyboard((
+            ("Пройти заново", encode_callback("replay", quiz_id)),
+            ("Другая викторина", encode_callback("newquiz"))
+        ))
+        self.builds += 1
+        return keyboard
+
+    def stats(self):
+        """
+        Статистика кэша.
+        :return: Словарь с количеством попаданий и построений клавиатур.
+        """
+        return {'hits': self.hits, 'builds': self.builds, 'pages': len(self.pages), 'next_actions': len(self.next_actions)}
@@ -0,0 +1,71 @@
+import logging
+from metrics import DB_SECONDS, timed
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Лучший результат каждого пользователя вместе с названием викторины и числом вопросов за один запрос
+LEADERBOARD_QUERY = """
+    WITH totals AS (
+        SELECT quiz_id, COUNT(*) AS total_questions
+        FROM questions
+        GROUP BY quiz_id
+    ),
+    ranked AS (
+        SELECT scores.username,
+               quizzes.name AS quiz_name,
+               scores.score,
+               totals.total_questions,
+               scores.score * 1.0 / totals.total_questions AS ratio,
+               ROW_NUMBER() OVER (
+                   PARTITION BY scores.username
+                   ORDER BY scores.score * 1.0 / totals.total_questions DESC, scores.score DESC
+               ) AS position
+        FROM scores
+        JOIN totals ON totals.quiz_id = scores.quiz_id
+        JOIN quizzes ON quizzes.id = scores.quiz_id
+    )
+    SELECT username, quiz_name, score, total_questions
+    FROM ranked
+    WHERE position = 1
+    ORDER BY ratio DESC, score DESC
+    LIMIT ?
+"""
+
+class LeaderboardEngine:
+    def __init__(self, pool, limit=10):
+        """
+        Инициализация движка лидерборда.
+        :param pool: Пул соединений с базой данных.
+        :param limit: Количество строк в лидерборде по умолчанию.
+        """
+        self.pool = pool
+        self.limit = limit
+
+    @timed(DB_SECONDS, 'leaderboard.fetch')
+    async def fetch(self, limit=None):
+        """
+        Получение лучших результатов пользователей.
+        :param limit: Максимальное количество строк.
+        :return: Список кортежей (имя пользователя, название викторины, счёт, количество вопросов).
+        """
+        async with self.pool.reader() as db:
+            cursor = await db.cursor()
+            await cursor.execute(LEADERBOARD_QUERY, (limit or self.limit,))
+            return await cursor.fetchall()
+
+    @staticmethod
+    def render(rows):
+        """
+        Формирование текста лидерборда.
+        :param rows: Строки, полученные из fetch.
+        :return: Текст лидерборда.
+        """
+        response = "Лидерборд:\n"
+        for position, (username, quiz_name, score, total_questions) in enumerate(rows, start=1):
+            score = int(score)
+            response += (f"{position}. {username} - {quiz_name}: "
+                         f"{score}/{total_questions} "
+                         f"({score / total_questions * 100:.2f}%)\n")
+        return response
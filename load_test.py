@@ -0,0 +1,280 @@
+import os
+import sys
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import logging
+import aiosqlite.core
+from fake_bot import FakeBot
+from send_scheduler import TokenBucket
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ErrorCounter(logging.Handler):
+    def __init__(self):
+        """
+        Подсчёт записей журнала уровня ERROR и выше.
+        """
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+class DatabaseTimer:
+    def __init__(self):
+        """
+        Замер времени запросов к базе данных. Оборачивает Connection._execute aiosqlite, через который
+        проходит каждое обращение к соединению, поэтому в замер входят и ожидание потока соединения,
+        и само выполнение запроса.
+        """
+        self.calls = 0
+        self.seconds = 0.0
+        self.original = None
+
+    def install(self):
+        """
+        Подмена Connection._execute.
+        """
+        self.original = original = aiosqlite.core.Connection._execute
+        timer = self
+
+        async def _execute(connection, fn, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await original(connection, fn, *args, **kwargs)
+            finally:
+                timer.calls += 1
+                timer.seconds += time.perf_counter() - started
+
+        aiosqlite.core.Connection._execute = _execute
+
+    def uninstall(self):
+        """
+        Восстановление исходного Connection._execute.
+        """
+        if self.original is not None:
+            aiosqlite.core.Connection._execute = self.original
+            self.original = None
+
+def percentile(values, fraction):
+    """
+    Перцентиль по отсортированному списку.
+    :param values: Отсортированный список значений.
+    :param fraction: Доля от 0 до 1.
+    :return: Значение перцентиля или 0 для пустого списка.
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+class LoadTest:
+    def __init__(self, quiz_bot, fake_bot, correct_ratio=0.7, timeout=60):
+        """
+        Инициализация сценариев имитируемых пользователей.
+        :param quiz_bot: Экземпляр QuizBot, работающий поверх имитации Telegram.
+        :param fake_bot: Имитация Telegram.
+        :param correct_ratio: Доля правильных ответов.
+        :param timeout: Максимальное время ожидания ответа бота в секундах.
+        """
+        self.quiz_bot = quiz_bot
+        self.bot = fake_bot
+        self.correct_ratio = correct_ratio
+        self.timeout = timeout
+        self.answers = {}  # Текст вопроса -> правильный ответ
+        self.completed = 0
+        self.failed = 0
+
+    def load_answers(self):
+        """
+        Построение таблицы правильных ответов по каталогу викторин.
+        """
+        for quiz in self.quiz_bot.database.catalog.quizzes.values():
+            for question, answer in quiz['questions']:
+                self.answers[question] = str(answer).split('|')[0]
+
+    def reply(self, question):
+        """
+        Ответ имитируемого пользователя на вопрос.
+        :param question: Текст вопроса.
+        :return: Правильный ответ с вероятностью correct_ratio, иначе заведомо неправильный.
+        """
+        return self.answers[question] if random.random() < self.correct_ratio else "не знаю"
+
+    async def wait_text(self, chat_id, prefix):
+        """
+        Ожидание сообщения бота, текст которого начинается с prefix.
+        :param chat_id: ID чата.
+        :param prefix: Начало текста.
+        :return: Сообщение.
+        """
+        return await self.bot.wait_for(chat_id, lambda message: message.text.startswith(prefix), self.timeout)
+
+    async def press_button(self, chat_id, message, text=None):
+        """
+        Нажатие кнопки встроенной клавиатуры сообщения.
+        :param chat_id: ID чата.
+        :param message: Сообщение с клавиатурой.
+        :param text: Текст кнопки или None для случайной кнопки.
+        """
+        buttons = message.buttons()
+        data = next(data for label, data in buttons if label == text) if text else random.choice(buttons)[1]
+        await self.bot.press(chat_id, data)
+
+    async def play(self, chat_id, finished_prefix):
+        """
+        Ответы на вопросы до сообщения о завершении викторины.
+        :param chat_id: ID чата.
+        :param finished_prefix: Начало текста сообщения о завершении.
+        """
+        while True:
+            message = await self.bot.wait_for(
+                chat_id, lambda message: message.text in self.answers or message.text.startswith(finished_prefix), self.timeout
+            )
+            if message.text.startswith(finished_prefix):
+                return
+            await self.bot.send_text(chat_id, self.reply(message.text))
+
+    async def single_user(self, chat_id):
+        """
+        Сценарий одиночной игры: /start, выбор викторины, ответы на все вопросы, лидерборд.
+        :param chat_id: ID чата.
+        """
+        await self.bot.send_text(chat_id, "/start")
+        await self.press_button(chat_id, await self.wait_text(chat_id, "Привет!"), "Одиночная")
+        await self.press_button(chat_id, await self.wait_text(chat_id, "Выберите викторину"))
+        await self.play(chat_id, "Викторина завершена!")
+        await self.wait_text(chat_id, "Сыграем ещё?")
+        await self.bot.send_text(chat_id, "Лидерборд")
+        await self.bot.wait_for(chat_id, lambda message: message.text.startswith(("Лидерборд", "Ошибка")), self.timeout)
+
+    async def pvp_user(self, chat_id):
+        """
+        Сценарий PVP-игры: /start, постановка в очередь, ответы на вопросы матча.
+        :param chat_id: ID чата.
+        """
+        await self.bot.send_text(chat_id, "/start")
+        await self.press_button(chat_id, await self.wait_text(chat_id, "Привет!"), "PVP-викторина")
+        await self.wait_text(chat_id, "PVP-викторина начинается")
+        await self.play(chat_id, "Викторина завершена!")
+
+    async def run_user(self, scenario, chat_id, semaphore):
+        """
+        Выполнение сценария одного пользователя с учётом ограничения параллельности.
+        :param scenario: Сценарий.
+        :param chat_id: ID чата.
+        :param semaphore: Ограничение количества одновременно играющих пользователей.
+        """
+        async with semaphore:
+            try:
+                await scenario(chat_id)
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error in simulated user {chat_id}: {type(e).__name__} {e}")
+
+def report(test, fake_bot, quiz_bot, db_timer, errors, elapsed):
+    """
+    Вывод результатов нагрузочного теста.
+    :param test: Сценарии пользователей.
+    :param fake_bot: Имитация Telegram.
+    :param quiz_bot: Экземпляр QuizBot.
+    :param db_timer: Замер времени запросов к базе.
+    :param errors: Счётчик ошибок в журнале.
+    :param elapsed: Длительность теста в секундах.
+    """
+    latencies = [value for values in fake_bot.latencies.values() for value in values]
+    lines = [
+        f"Users: {test.completed} completed, {test.failed} failed in {elapsed:.2f} s",
+        f"Updates: {len(latencies)} ({len(latencies) / elapsed:.0f}/s)",
+    ]
+    for kind, values in [('all', latencies)] + list(fake_bot.latencies.items()):
+        values = sorted(values)
+        lines.append(f"  {kind:<8} n={len(values):<7} p50={percentile(values, 0.5) * 1000:.2f} ms "
+                     f"p99={percentile(values, 0.99) * 1000:.2f} ms max={(values[-1] if values else 0) * 1000:.2f} ms")
+    lines.append(f"Database: {db_timer.calls} calls, {db_timer.seconds:.2f} s total, "
+                 f"{db_timer.seconds / max(1, db_timer.calls) * 1000:.3f} ms per call")
+    sender = quiz_bot.sender.stats()
+    lines.append(f"Bot API: {fake_bot.api_calls} calls, sender sent={sender['sent']} retried={sender['retried']} failed={sender['failed']}")
+    lines.append(f"Sessions: {quiz_bot.reaper.stats()}")
+    lines.append(f"Errors logged: {errors.count}")
+    print('\n'.join(lines))
+
+async def main(argv=None):
+    """
+    Точка входа командной строки:
+    python load_test.py --users 2000 --pvp-users 200 --concurrency 500
+    :param argv: Аргументы командной строки.
+    :return: Код завершения: 0, если все пользователи доиграли без ошибок.
+    """
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота без Telegram: имитируемые пользователи "
+                                                 "проходят одиночные и PVP-викторины.")
+    parser.add_argument('--users', type=int, default=1000, help="Количество пользователей одиночных викторин.")
+    parser.add_argument('--pvp-users', type=int, default=100, help="Количество пользователей PVP (чётное).")
+    parser.add_argument('--concurrency', type=int, default=200, help="Максимальное количество одновременно играющих пользователей одиночных викторин.")
+    parser.add_argument('--correct', type=float, default=0.7, help="Доля правильных ответов.")
+    parser.add_argument('--db', help="База данных с викториной, копия которой используется в тесте (по умолчанию quiz.db, если есть).")
+    parser.add_argument('--api-latency', type=float, default=0.0, help="Задержка запроса к Telegram API в секундах.")
+    parser.add_argument('--telegram-limits', action='store_true', help="Оставить ограничения частоты отправки Telegram.")
+    parser.add_argument('--timeout', type=float, default=60, help="Максимальное время ожидания ответа бота в секундах.")
+    parser.add_argument('--seed', type=int, help="Начальное значение генератора случайных чисел.")
+    args = parser.parse_args(argv)
+    if args.pvp_users % 2:
+        parser.error("--pvp-users must be even")
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    directory = tempfile.mkdtemp(prefix='quiz-load-')
+    db_name = os.path.join(directory, 'quiz.db')
+    source = args.db or ('quiz.db' if os.path.exists('quiz.db') else None)
+    if source:
+        shutil.copyfile(source, db_name)
+    os.environ.setdefault('SESSION_STORE', 'memory')
+    os.environ.setdefault('SESSION_DB', os.path.join(directory, 'sessions.db'))
+    os.environ.setdefault('SESSION_SNAPSHOT_DIR', os.path.join(directory, 'sessions'))
+    os.environ.setdefault('SESSION_MAX', str(max(10000, args.users + args.pvp_users * 2)))
+
+    from main import QuizBot  # После настройки окружения: QuizBot читает его при создании
+
+    errors = ErrorCounter()
+    logging.getLogger().addHandler(errors)
+    logging.getLogger().setLevel(logging.WARNING)  # Журнал INFO на тысячах пользователей искажает замеры
+    db_timer = DatabaseTimer()
+    fake_bot = FakeBot(args.api_latency)
+    quiz_bot = QuizBot(db_name, bot=fake_bot)
+    if not args.telegram_limits:
+        quiz_bot.sender.global_bucket = TokenBucket(1e9, 1e9)
+        quiz_bot.sender.chat_rate = 1e9
+        quiz_bot.sender.chat_burst = 1e9
+    quiz_bot.pvp_quiz_manager.start_delay = 0
+    quiz_bot.pvp_quiz_manager.countdown_seconds = 0
+    test = LoadTest(quiz_bot, fake_bot, args.correct, args.timeout)
+    try:
+        await quiz_bot.start()
+        test.load_answers()
+        db_timer.install()
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(args.concurrency)
+        pvp_semaphore = asyncio.Semaphore(max(1, args.pvp_users))  # Игроки PVP ждут друг друга и не ограничиваются
+        chat_ids = iter(range(1, args.users + args.pvp_users + 1))
+        await asyncio.gather(
+            *(test.run_user(test.single_user, next(chat_ids), semaphore) for _ in range(args.users)),
+            *(test.run_user(test.pvp_user, next(chat_ids), pvp_semaphore) for _ in range(args.pvp_users))
+        )
+        elapsed = time.perf_counter() - started
+        db_timer.uninstall()
+        await quiz_bot.reaper.update_gauges()
+        report(test, fake_bot, quiz_bot, db_timer, errors, elapsed)
+    finally:
+        db_timer.uninstall()
+        await quiz_bot.stop()
+        shutil.rmtree(directory, ignore_errors=True)
+    return 0 if test.failed == 0 and errors.count == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,105 @@
+import time
+import asyncio
+import functools
+import logging
+from metrics import MAILBOX_WAIT_SECONDS, MAILBOX_DROPPED
+from tracing import span
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def update_chat(update):
+    """
+    Ключ почтового ящика входящего обновления: ID чата.
+    :param update: Сообщение или callback-запрос.
+    :return: Ключ.
+    """
+    message = update.message if getattr(update, 'data', None) is not None else update
+    return ('chat', message.chat.id)
+
+class MailboxFull(Exception):
+    """
+    Почтовый ящик переполнен: задача не принята.
+    """
+
+class Mailbox:
+    __slots__ = ('lock', 'pending')
+
+    def __init__(self):
+        """
+        Инициализация почтового ящика одного ключа.
+        """
+        self.lock = asyncio.Lock()  # Задачи ящика выполняются по одной в порядке поступления
+        self.pending = 0  # Задачи в ящике, включая выполняемую
+
+class Mailboxes:
+    def __init__(self, size=100):
+        """
+        Инициализация почтовых ящиков для последовательной обработки по ключам (чат, матч).
+        Задачи одного ключа выполняются строго по одной в порядке поступления, задачи разных ключей -
+        параллельно, поэтому обработчикам одного чата не нужна общая блокировка. В ящике не больше size задач:
+        цикл опроса AsyncTeleBot не ждёт обработки обновлений, поэтому ожидание места не ограничивало бы
+        память, и задачи сверх size отклоняются (обновления переполненного чата отбрасываются).
+        Ящик существует, пока в нём есть задачи, поэтому память занимают только активные чаты.
+        :param size: Максимальное количество задач в ящике.
+        """
+        self.size = size
+        self.mailboxes = {}  # Ключ -> Mailbox
+        self.processed = 0
+        self.dropped = 0  # Задачи, отклонённые переполненным ящиком
+
+    async def run(self, key, handler, *args):
+        """
+        Выполнение задачи в почтовом ящике ключа после всех задач, поступивших раньше.
+        :param key: Ключ ящика: ('chat', ID чата) или ('match', ID матча).
+        :param handler: Асинхронная функция.
+        :param args: Аргументы функции.
+        :return: Результат функции.
+        :raises MailboxFull: В ящике уже size задач.
+        """
+        mailbox = self.mailboxes.get(key)
+        if mailbox is None:
+            mailbox = self.mailboxes[key] = Mailbox()
+        elif mailbox.pending >= self.size:
+            self.dropped += 1
+            MAILBOX_DROPPED.inc(key[0])
+            raise MailboxFull(key)
+        mailbox.pending += 1
+        try:
+            started = time.perf_counter()
+            with span('mailbox.wait'):
+                await mailbox.lock.acquire()
+            MAILBOX_WAIT_SECONDS.observe(time.perf_counter() - started, key[0])
+            try:
+                self.processed += 1
+                return await handler(*args)
+            finally:
+                mailbox.lock.release()
+        finally:
+            mailbox.pending -= 1
+            if mailbox.pending == 0:
+                del self.mailboxes[key]
+
+    def serial(self, handler, key=update_chat):
+        """
+        Обёртка обработчика обновлений, выполняющая обновления одного чата по очереди.
+        Обновление, не поместившееся в переполненный ящик, отбрасывается.
+        :param handler: Асинхронный обработчик handler(update).
+        :param key: Функция ключа ящика по обновлению.
+        :return: Обёрнутый обработчик.
+        """
+        @functools.wraps(handler)
+        async def wrapper(update, *args, **kwargs):
+            try:
+                return await self.run(key(update), functools.partial(handler, update, *args, **kwargs))
+            except MailboxFull as e:
+                logger.warning(f"Mailbox {e.args[0]} is full, update dropped")
+        return wrapper
+
+    def stats(self):
+        """
+        Статистика почтовых ящиков.
+        :return: Словарь с количеством активных ящиков, выполненных и отклонённых задач.
+        """
+        return {'mailboxes': len(self.mailboxes), 'processed': self.processed, 'dropped': self.dropped}
@@ -4,40 +4,96 @@ import logging
 from telebot.async_telebot import AsyncTeleBot
 from command_handler import CommandHandler
 from message_handler import MessageHandler
-from game_state_manager import GameStateManager
+from game_state_manager import GameStateManager, SESSION_PREFIX
 from pvp_quiz_manager import PVPQuizManager
 from database import Database
+from username_cache import UsernameCache
+from send_scheduler import SendScheduler
+from keyboards import KeyboardCache
+from webhook_server import WebhookServer
+from session_store import create_session_store
+from session_reaper import SessionReaper
+from matchmaking import MATCH_PREFIX
+from tracing import TRACER
+from mailboxes import Mailboxes
+from metrics import MetricsServer, LIVE_SESSIONS, SESSION_MEMORY_BYTES, LIVE_GAMES, PVP_QUEUE_DEPTH, SEND_QUEUE_DEPTH, ACTIVE_MAILBOXES
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class QuizBot:
-    def __init__(self, db_name):
+    def __init__(self, db_name, bot=None):
         """
         Инициализация бота.
         :param db_name: Имя базы данных.
+        :param bot: Готовый экземпляр бота (например, имитация Telegram в нагрузочном тесте) или None,
+        чтобы создать AsyncTeleBot с токеном из API_TOKEN.
         """
-        self.api_token = os.getenv('API_TOKEN')
-        if not self.api_token:
-            raise ValueError("API_TOKEN environment variable is not set")
-        self.bot = AsyncTeleBot(self.api_token)
+        self.mode = os.getenv('BOT_MODE', 'polling')  # polling или webhook
+        if self.mode not in ('polling', 'webhook'):
+            raise ValueError(f"Unknown BOT_MODE: {self.mode}")
+        if bot is None:
+            self.api_token = os.getenv('API_TOKEN')
+            if not self.api_token:
+                raise ValueError("API_TOKEN environment variable is not set")
+            bot = AsyncTeleBot(self.api_token)
+        self.bot = bot
+        self.sender = SendScheduler(self.bot)  # Все исходящие сообщения идут через планировщик
         self.database = Database(db_name)
+        self.usernames = UsernameCache(self.bot)
+        self.keyboards = KeyboardCache(self.database)  # Готовые клавиатуры, в том числе список викторин
+        # Обновления одного чата и ответы одного матча обрабатываются по очереди, разных - параллельно
+        self.mailboxes = Mailboxes(int(os.getenv('MAILBOX_SIZE', '100')))
+        # Хранилище игровых сессий: memory - в памяти процесса, snapshot - в памяти со снимками на диске,
+        # sqlite - общая база для нескольких процессов
+        self.sessions = create_session_store(
+            os.getenv('SESSION_STORE', 'snapshot'),
+            db_name=os.getenv('SESSION_DB', 'sessions.db'),
+            snapshot_dir=os.getenv('SESSION_SNAPSHOT_DIR', 'sessions'),
+            snapshot_interval=int(os.getenv('SESSION_SNAPSHOT_INTERVAL', '60'))
+        )
+        self.reaper = SessionReaper(
+            self.sessions,
+            idle_ttl=int(os.getenv('SESSION_IDLE_TTL', '1800')),
+            max_sessions=int(os.getenv('SESSION_MAX', '10000')),
+            interval=int(os.getenv('SESSION_REAP_INTERVAL', '60'))
+        )
 
         # Инициализация всех компонентов
-        self.command_handler = CommandHandler(self.bot, self.database)
-        self.game_state_manager = GameStateManager(self.bot)
-        self.pvp_quiz_manager = PVPQuizManager(self.bot)
+        self.command_handler = CommandHandler(self.sender, self.database, self.usernames, self.keyboards, self.mailboxes)
+        self.game_state_manager = GameStateManager(self.sender, self.database, self.usernames, self.sessions, self.reaper, self.keyboards)
+        self.pvp_quiz_manager = PVPQuizManager(self.sender, self.database, self.usernames, self.sessions, self.reaper, self.mailboxes)
+        # Викторины, из которых берутся PVP-вопросы (ID через запятую), по умолчанию все
+        pvp_quizzes = os.getenv('PVP_QUIZ_IDS', '')
+        if pvp_quizzes.strip():
+            self.pvp_quiz_manager.quiz_ids = [int(quiz_id) for quiz_id in pvp_quizzes.split(',') if quiz_id.strip()]
 
         # Передача необходимых атрибутов в MessageHandler
         self.message_handler = MessageHandler(
-            self.bot,
-            self.pvp_quiz_manager.pvp_queue,
-            self.pvp_quiz_manager.pvp_game_state,
-            self.game_state_manager.game_state,
+            self.sender,
             self.game_state_manager,
             self.pvp_quiz_manager,
-            self.database
+            self.database,
+            self.usernames,
+            self.keyboards,
+            self.mailboxes
+        )
+
+        # Показатели в формате Prometheus на локальном /metrics, если задан METRICS_PORT
+        metrics_port = int(os.getenv('METRICS_PORT', '0'))
+        self.metrics_server = MetricsServer(
+            host=os.getenv('METRICS_HOST', '127.0.0.1'),
+            port=metrics_port,
+            collectors=[self.collect_metrics]
+        ) if metrics_port else None
+
+        # Трассировка обновлений: дерево участков медленных обновлений и профили самых медленных
+        TRACER.configure(
+            slow_threshold=float(os.getenv('TRACE_SLOW_MS', '1000')) / 1000,
+            profile=os.getenv('TRACE_PROFILE', '0') == '1',
+            profile_top=int(os.getenv('TRACE_PROFILE_TOP', '10')),
+            profile_dir=os.getenv('TRACE_PROFILE_DIR', 'profiles')
         )
 
         self.setup_handlers()
@@ -49,16 +105,86 @@ class QuizBot:
         self.command_handler.setup_handlers()
         self.message_handler.setup_handlers()
 
+    async def start(self):
+        """
+        Подготовка к приёму обновлений: открытие базы и хранилища сессий, запуск фоновых задач,
+        инициализация базы и продолжение восстановленных PVP-матчей.
+        """
+        await self.database.open()
+        await self.sessions.open()
+        self.sender.start()
+        self.reaper.start()
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        result = await self.database.initialize_database()
+        logger.info(result)
+        resumed = await self.pvp_quiz_manager.resume_matches()
+        if resumed:
+            logger.info(f"Resumed {resumed} PVP matches")
+
+    async def stop(self):
+        """
+        Остановка фоновых задач и закрытие хранилища сессий и базы.
+        """
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        await self.reaper.stop()
+        await self.pvp_quiz_manager.stop()
+        await self.sender.stop()
+        await self.sessions.close()
+        await self.database.close()
+
+    async def collect_metrics(self):
+        """
+        Обновление показателей живых игр и очередей перед выдачей /metrics.
+        """
+        await self.reaper.update_gauges()
+        LIVE_SESSIONS.set(self.reaper.live_sessions)
+        SESSION_MEMORY_BYTES.set(self.reaper.memory_bytes)
+        LIVE_GAMES.set(len(await self.sessions.keys(SESSION_PREFIX)), 'single')
+        LIVE_GAMES.set(len(await self.sessions.keys(MATCH_PREFIX)), 'pvp')
+        PVP_QUEUE_DEPTH.set(len(self.pvp_quiz_manager.matchmaker.queue))
+        SEND_QUEUE_DEPTH.set(self.sender.queued)
+        ACTIVE_MAILBOXES.set(len(self.mailboxes.mailboxes))
+
     async def run(self):
         """
         Запуск бота.
         """
         try:
-            result = await self.database.initialize_database()
-            logger.info(result)
-            await self.bot.polling()
+            await self.start()
+            if self.mode == 'webhook':
+                await self.run_webhook()
+            else:
+                await self.bot.polling()
         except Exception as e:
             logger.error(f"Error during bot initialization: {e}")
+        finally:
+            await self.stop()
+
+    async def run_webhook(self):
+        """
+        Приём обновлений через вебхук. Настройки берутся из переменных окружения:
+        WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_QUEUE_SIZE, WEBHOOK_WORKERS.
+        """
+        secret_token = os.getenv('WEBHOOK_SECRET')
+        if not secret_token:
+            raise ValueError("WEBHOOK_SECRET environment variable is not set")
+        server = WebhookServer(
+            self.bot,
+            os.getenv('WEBHOOK_URL'),
+            secret_token,
+            host=os.getenv('WEBHOOK_HOST', '0.0.0.0'),
+            port=int(os.getenv('WEBHOOK_PORT', '8080')),
+            path=os.getenv('WEBHOOK_PATH', '/webhook'),
+            queue_size=int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000')),
+            workers=int(os.getenv('WEBHOOK_WORKERS', '8'))
+        )
+        await server.start()
+        try:
+            await server.serve_forever()
+        finally:
+            await server.stop()
 
 # Запуск бота
 if __name__ == "__main__":
@@ -0,0 +1,230 @@
+import uuid
+import itertools
+from collections import deque, OrderedDict
+
+class MatchmakingQueue:
+    def __init__(self):
+        """
+        Инициализация очереди игроков на PVP-викторину.
+        Очередь хранит порядок игроков в deque, а принадлежность к очереди - в словаре,
+        поэтому вход, выход и проверка выполняются за O(1). Вышедшие игроки удаляются из deque лениво.
+        """
+        self.order = deque()  # Пары (номер заявки, ID игрока) в порядке постановки в очередь
+        self.waiting = {}  # ID игрока -> номер действующей заявки
+        self.tickets = itertools.count()
+
+    def __contains__(self, player):
+        return player in self.waiting
+
+    def __len__(self):
+        return len(self.waiting)
+
+    def join(self, player):
+        """
+        Постановка игрока в очередь.
+        :param player: ID игрока.
+        :return: True, если игрок добавлен, False если он уже в очереди.
+        """
+        if player in self.waiting:
+            return False
+        ticket = next(self.tickets)
+        self.waiting[player] = ticket
+        self.order.append((ticket, player))
+        return True
+
+    def leave(self, player):
+        """
+        Удаление игрока из очереди.
+        :param player: ID игрока.
+        :return: True, если игрок был в очереди.
+        """
+        if self.waiting.pop(player, None) is None:
+            return False
+        if len(self.order) > 2 * len(self.waiting) + 16:
+            # Чистка устаревших заявок, чтобы deque не рос при частых входах и выходах
+            self.order = deque(entry for entry in self.order if self.waiting.get(entry[1]) == entry[0])
+        return True
+
+    def pop(self):
+        """
+        Извлечение игрока, который дольше всех ждёт в очереди.
+        :return: ID игрока или None, если очередь пуста.
+        """
+        while self.order:
+            ticket, player = self.order.popleft()
+            if self.waiting.get(player) == ticket:
+                del self.waiting[player]
+                return player
+        return None
+
+    def pop_pair(self):
+        """
+        Извлечение пары игроков для нового матча.
+        :return: Кортеж (ID первого игрока, ID второго игрока) или None, если игроков меньше двух.
+        """
+        if len(self.waiting) < 2:
+            return None
+        return self.pop(), self.pop()
+
+# Префиксы ключей матчей и индекса игрок -> матч в хранилище сессий
+MATCH_PREFIX = "pvp:"
+PLAYER_PREFIX = "pvp_player:"
+MATCH_FINISHED = -1  # Номер вопроса матча, итоги которого уже отправляются
+
+class RecentQuestions:
+    def __init__(self, per_player=200, max_players=10000):
+        """
+        Инициализация истории недавно заданных игрокам PVP-вопросов.
+        Для каждого игрока хранится упорядоченное множество последних per_player вопросов,
+        а игроки, давно не игравшие, вытесняются при превышении max_players.
+        История хранится в памяти процесса и теряется при перезапуске.
+        :param per_player: Количество запоминаемых вопросов на игрока.
+        :param max_players: Максимальное количество игроков в истории.
+        """
+        self.per_player = per_player
+        self.max_players = max_players
+        self.players = OrderedDict()  # ID игрока -> OrderedDict текстов вопросов
+
+    def seen(self, *players):
+        """
+        Вопросы, недавно заданные хотя бы одному из игроков.
+        :param players: ID игроков.
+        :return: Множество текстов вопросов.
+        """
+        questions = set()
+        for player in players:
+            questions.update(self.players.get(player, ()))
+        return questions
+
+    def add(self, players, questions):
+        """
+        Запоминание вопросов, заданных игрокам.
+        :param players: ID игроков.
+        :param questions: Тексты вопросов.
+        """
+        for player in players:
+            history = self.players.pop(player, None)
+            if history is None:
+                history = OrderedDict()
+            self.players[player] = history
+            for question in questions:
+                history.pop(question, None)
+                history[question] = None
+            while len(history) > self.per_player:
+                history.popitem(last=False)
+        while len(self.players) > self.max_players:
+            self.players.popitem(last=False)
+
+def match_key(match_id):
+    """
+    Ключ матча в хранилище сессий.
+    :param match_id: ID матча.
+    :return: Ключ.
+    """
+    return f"{MATCH_PREFIX}{match_id}"
+
+def player_key(player):
+    """
+    Ключ индекса игрок -> матч в хранилище сессий.
+    :param player: ID игрока.
+    :return: Ключ.
+    """
+    return f"{PLAYER_PREFIX}{player}"
+
+def new_match(match_id, player1, player2):
+    """
+    Создание сессии PVP-матча.
+    Номер вопроса сессии используется как номер раунда: пока открыт приём ответов на вопрос k,
+    он равен 2k + 1, а во время обратного отсчёта перед вопросом k - 2k. Поэтому и "кто первым ответил
+    правильно", и переход к следующему вопросу решаются одним compare_and_set по номеру раунда.
+    Счёт и флаги игроков хранятся в словарях с ключом str(ID игрока), чтобы сессия сериализовалась в JSON.
+    :param match_id: ID матча.
+    :param player1: ID первого игрока.
+    :param player2: ID второго игрока.
+    :return: Сессия матча.
+    """
+    return {
+        'match_id': match_id,
+        'players': [player1, player2],
+        'scores': {str(player1): 0, str(player2): 0},
+        'answered': {str(player1): False, str(player2): False},
+        'questions': [],
+        'answer': None,  # None, пока вопрос не отправлен игрокам
+        'question': 0,
+        'score': 0,
+    }
+
+def opponent(match, player):
+    """
+    Получение противника игрока.
+    :param match: Сессия матча.
+    :param player: ID игрока.
+    :return: ID противника.
+    """
+    player1, player2 = match['players']
+    return player2 if player == player1 else player1
+
+class Matchmaker:
+    def __init__(self, sessions):
+        """
+        Инициализация подбора соперников.
+        Очередь ожидания хранится в процессе, а матчи и индекс игрок -> ID матча - в хранилище сессий,
+        поэтому матч может обслуживать любой процесс бота, работающий с тем же хранилищем.
+        :param sessions: Хранилище сессий.
+        """
+        self.queue = MatchmakingQueue()
+        self.sessions = sessions
+
+    async def get_match(self, player):
+        """
+        Получение текущего матча игрока.
+        :param player: ID игрока.
+        :return: Сессия матча или None.
+        """
+        index = await self.sessions.get(player_key(player))
+        if index is None:
+            return None
+        return await self.sessions.get(match_key(index['match_id']))
+
+    def join(self, player):
+        """
+        Постановка игрока в очередь.
+        :param player: ID игрока.
+        :return: True, если игрок добавлен, False если он уже в очереди.
+        """
+        return self.queue.join(player)
+
+    def leave(self, player):
+        """
+        Удаление игрока из очереди.
+        :param player: ID игрока.
+        :return: True, если игрок был в очереди.
+        """
+        return self.queue.leave(player)
+
+    async def pair_players(self):
+        """
+        Создание матчей из всех пар игроков, ожидающих в очереди.
+        :return: Список сессий новых матчей.
+        """
+        matches = []
+        pair = self.queue.pop_pair()
+        while pair is not None:
+            match = new_match(uuid.uuid4().hex, *pair)
+            await self.sessions.put(match_key(match['match_id']), match)
+            for player in pair:
+                await self.sessions.put(player_key(player), {'match_id': match['match_id']})
+            matches.append(match)
+            pair = self.queue.pop_pair()
+        return matches
+
+    async def remove_match(self, match):
+        """
+        Удаление завершённого матча.
+        :param match: Сессия матча.
+        """
+        for player in match['players']:
+            index = await self.sessions.get(player_key(player))
+            if index is not None and index['match_id'] == match['match_id']:
+                await self.sessions.delete(player_key(player))
+        await self.sessions.delete(match_key(match['match_id']))
@@ -1,210 +1,291 @@
-import aiosqlite
-from telebot import types
+import time
+from callback_router import CallbackRouter, CALLBACK_CODES
 import logging
+from editor_sessions import EditorSessionStore
+from keyboards import MODE_KEYBOARD, DONE_KEYBOARD, LEAVE_QUEUE_KEYBOARD
+from metrics import HANDLER_SECONDS
+from tracing import trace_update
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Заголовки меню со списком викторин по маршруту кнопок
+QUIZ_MENU_TITLES = {
+    "quiz": "Выберите викторину:",
+    "select_quiz": "Выберите викторину для обновления:",
+    "delete_quiz_id": "Выберите викторину для удаления:",
+}
+
 class MessageHandler:
-    def __init__(self, bot, pvp_queue, pvp_game_state, game_state, game_state_manager, pvp_quiz_manager, database):
+    def __init__(self, bot, game_state_manager, pvp_quiz_manager, database, usernames, keyboards, mailboxes):
         """
         Инициализация обработчика сообщений.
         :param bot: Экземпляр бота.
-        :param pvp_queue: Очередь для PVP-викторин.
-        :param pvp_game_state: Состояние PVP-викторин.
-        :param game_state: Состояние одиночных викторин.
         :param game_state_manager: Менеджер состояния одиночных викторин.
         :param pvp_quiz_manager: Менеджер PVP-викторин.
         :param database: Экземпляр базы данных.
+        :param usernames: Кэш имён пользователей.
+        :param keyboards: Кэш клавиатур.
+        :param mailboxes: Почтовые ящики для последовательной обработки обновлений чата.
         """
         self.bot = bot
-        self.pvp_queue = pvp_queue
-        self.pvp_game_state = pvp_game_state
-        self.game_state = game_state
         self.game_state_manager = game_state_manager
         self.pvp_quiz_manager = pvp_quiz_manager
         self.database = database
-        self.current_action = None
-        self.current_quiz = {}
-        self.current_step = None
+        self.usernames = usernames
+        self.keyboards = keyboards
+        self.mailboxes = mailboxes
+        self.router = CallbackRouter()
+        self.editor_sessions = EditorSessionStore()  # Сессии редактора викторин, отдельно для каждого чата
+        # Обработчики текстовых сообщений редактора по состоянию сессии (действие, шаг)
+        self.editor_steps = {
+            ("add_quiz", "name"): self.editor_enter_name,
+            ("add_quiz", "question"): self.editor_enter_question,
+            ("add_quiz", "answer"): self.editor_enter_answer,
+            ("update_quiz", "update_question"): self.editor_enter_question,
+            ("update_quiz", "update_answer"): self.editor_enter_answer,
+        }
 
     def setup_handlers(self):
         """
-        Установка обработчиков сообщений.
+        Установка обработчиков сообщений и маршрутов callback-запросов.
         """
-        self.bot.callback_query_handler(func=lambda call: True)(self.handle_callback)
-        self.bot.message_handler(func=lambda message: True)(self.handle_message)
+        self.router.add('quiz', self.on_quiz)
+        self.router.add('replay', self.on_replay)
+        self.router.add('newquiz', self.on_newquiz)
+        self.router.add('single', self.on_single)
+        self.router.add('pvp', self.on_pvp)
+        self.router.add('leave_queue', self.on_leave_queue)
+        self.router.add('add_quiz', self.on_add_quiz)
+        self.router.add('update_quiz', self.on_update_quiz)
+        self.router.add('delete_quiz', self.on_delete_quiz)
+        self.router.add('select_quiz', self.on_select_quiz)
+        self.router.add('delete_quiz_id', self.on_delete_quiz_id)
+        self.router.add('done', self.handle_done)
+        self.router.add('quiz_page', self.on_quiz_page)
+        self.bot.callback_query_handler(func=lambda call: True)(trace_update(self.mailboxes.serial(self.handle_callback)))
+        self.bot.message_handler(func=lambda message: True)(trace_update(self.mailboxes.serial(self.handle_message)))
 
     async def handle_callback(self, call):
         """
-        Обработчик callback-запросов.
+        Обработчик callback-запросов. Обработчик выбирается маршрутизатором по callback_data.
         :param call: Объект callback-запроса. Содержит информацию о запросе, такую как ID чата, данные запроса и т.д.
         """
         try:
-            chat_id = call.message.chat.id  # Используется для отправки сообщений в конкретный чат
-            if call.data == "add_quiz":
-                self.current_action = "add_quiz"
-                self.current_step = "name"
-                await self.bot.send_message(chat_id, "Введите название викторины:")
-            elif call.data == "update_quiz":
-                self.current_action = "update_quiz"
-                self.current_step = "select_quiz"
-                quizzes = await self.database.get_quizzes()
-                keyboard = types.InlineKeyboardMarkup()
-                for quiz_id, quiz_name in quizzes:
-                    keyboard.add(types.InlineKeyboardButton(text=quiz_name, callback_data=f"select_quiz_{quiz_id}"))
-                await self.bot.send_message(chat_id, "Выберите викторину для обновления:", reply_markup=keyboard)
-            elif call.data == "delete_quiz":
-                self.current_action = "delete_quiz"
-                quizzes = await self.database.get_quizzes()
-                keyboard = types.InlineKeyboardMarkup()
-                for quiz_id, quiz_name in quizzes:
-                    keyboard.add(types.InlineKeyboardButton(text=quiz_name, callback_data=f"delete_quiz_{quiz_id}"))
-                await self.bot.send_message(chat_id, "Выберите викторину для удаления:", reply_markup=keyboard)
-            elif call.data.startswith("select_quiz_"):
-                quiz_id = int(call.data.split('_')[2])
-                quiz_name, questions = await self.database.get_quiz_details(quiz_id)
-                self.current_quiz = {'name': quiz_name, 'questions': questions}
-                self.current_step = "update_question"
-                await self.bot.send_message(chat_id, f"Викторина: {quiz_name}\nВопросы и ответы:")
-                for question, answer in questions:
-                    await self.bot.send_message(chat_id, f"Вопрос: {question}\nОтвет: {answer}")
-                await self.bot.send_message(chat_id, "Введите новый вопрос или нажмите 'Готово':", reply_markup=self.get_done_keyboard())
-            elif call.data.startswith("delete_quiz_"):
-                quiz_id = int(call.data.split('_')[2])
-                result = await self.database.delete_quiz_by_id(quiz_id)
-                await self.bot.send_message(chat_id, result)
-                self.current_action = None
-                self.current_quiz = {}
-            elif call.data == "done":
-                await self.handle_done(call)
-            elif call.data == "single":
-                await self.start_quiz(call.message)
-            elif call.data == "pvp":
-                if chat_id in self.pvp_queue:
-                    await self.bot.send_message(chat_id, "Вы уже в очереди на PVP-викторину.")
-                else:
-                    self.pvp_queue.append(chat_id)
-                    if len(self.pvp_queue) == 2:
-                        player1, player2 = self.pvp_queue
-                        await self.game_state_manager.finish_quiz(player1, silent=True)
-                        await self.game_state_manager.finish_quiz(player2, silent=True)
-                        await self.pvp_quiz_manager.start_pvp_game(player1, player2)
-                    else:
-                        keyboard = types.InlineKeyboardMarkup()
-                        keyboard.add(types.InlineKeyboardButton(text="Покинуть очередь", callback_data="leave_queue"))
-                        await self.bot.send_message(chat_id, "Вы добавлены в очередь на PVP-викторину. Пожалуйста, подождите второго игрока. Вы можете пока продолжить проходить одиночные викторины.", reply_markup=keyboard)
-            elif call.data == "leave_queue":
-                if chat_id in self.pvp_queue:
-                    self.pvp_queue.remove(chat_id)
-                    await self.bot.send_message(chat_id, "Вы покинули очередь на PVP-викторину.")
-                else:
-                    await self.bot.send_message(chat_id, "Вы не в очереди на PVP-викторину.")
-            elif call.data.startswith("quiz_"):
-                quiz_id = int(call.data.split('_')[1])
-                await self.game_state_manager.start_quiz_game(chat_id, quiz_id)
-            elif call.data.startswith("replay_"):
-                quiz_id = int(call.data.split('_')[1])
-                await self.replay_quiz(chat_id, quiz_id)
-            elif call.data == "newquiz":
-                await self.start_quiz(call.message)
-            elif call.data in ["add_quiz", "update_quiz", "delete_quiz"]:
-                # Принудительное завершение текущей викторины
-                if chat_id in self.game_state:
-                    await self.game_state_manager.finish_quiz(chat_id)
+            self.usernames.remember_message(call.message)
+            await self.router.dispatch(call)
         except Exception as e:
             logger.error(f"Error handling callback: {e}")
 
+    async def on_add_quiz(self, call):
+        """
+        Кнопка "Добавить викторину".
+        :param call: Объект callback-запроса.
+        """
+        chat_id = call.message.chat.id
+        self.editor_sessions.start(chat_id, "add_quiz", "name")
+        await self.bot.send_message(chat_id, "Введите название викторины:")
+
+    async def on_update_quiz(self, call):
+        """
+        Кнопка "Обновить викторину".
+        :param call: Объект callback-запроса.
+        """
+        chat_id = call.message.chat.id
+        self.editor_sessions.start(chat_id, "update_quiz", "select_quiz")
+        keyboard = await self.keyboards.quiz_page("select_quiz")
+        await self.bot.send_message(chat_id, QUIZ_MENU_TITLES["select_quiz"], reply_markup=keyboard)
+
+    async def on_delete_quiz(self, call):
+        """
+        Кнопка "Удалить викторину".
+        :param call: Объект callback-запроса.
+        """
+        chat_id = call.message.chat.id
+        self.editor_sessions.start(chat_id, "delete_quiz")
+        keyboard = await self.keyboards.quiz_page("delete_quiz_id")
+        await self.bot.send_message(chat_id, QUIZ_MENU_TITLES["delete_quiz_id"], reply_markup=keyboard)
+
+    async def on_select_quiz(self, call, quiz_id):
+        """
+        Выбор викторины для обновления.
+        :param call: Объект callback-запроса.
+        :param quiz_id: ID викторины.
+        """
+        chat_id = call.message.chat.id
+        quiz_name, questions = await self.database.get_quiz_details(quiz_id)
+        session = self.editor_sessions.get(chat_id) or self.editor_sessions.start(chat_id, "update_quiz")
+        session.quiz = {'name': quiz_name, 'questions': questions}
+        session.step = "update_question"
+        await self.bot.send_message(chat_id, f"Викторина: {quiz_name}\nВопросы и ответы:")
+        for question, answer in questions:
+            await self.bot.send_message(chat_id, f"Вопрос: {question}\nОтвет: {answer}")
+        await self.bot.send_message(chat_id, "Введите новый вопрос или нажмите 'Готово':", reply_markup=self.get_done_keyboard())
+
+    async def on_delete_quiz_id(self, call, quiz_id):
+        """
+        Выбор викторины для удаления.
+        :param call: Объект callback-запроса.
+        :param quiz_id: ID викторины.
+        """
+        chat_id = call.message.chat.id
+        result = await self.database.delete_quiz_by_id(quiz_id)
+        await self.bot.send_message(chat_id, result)
+        self.editor_sessions.finish(chat_id)
+
+    async def on_quiz_page(self, call, route_code, direction, anchor, prefix):
+        """
+        Кнопки "Назад" и "Далее" списка викторин: сообщение с меню заменяется соседней страницей.
+        :param call: Объект callback-запроса.
+        :param route_code: Код маршрута кнопок викторин.
+        :param direction: Направление: n - следующая страница, p - предыдущая.
+        :param anchor: ID-граница страницы.
+        :param prefix: Фильтр по началу названия.
+        """
+        route = CALLBACK_CODES.get(route_code, (None,))[0]
+        if route not in QUIZ_MENU_TITLES or direction not in ('n', 'p'):
+            logger.warning(f"Unknown quiz page: {call.data}")
+            return
+        keyboard = await self.keyboards.quiz_page(route, direction, anchor, prefix)
+        if keyboard is None:
+            # Викторины страницы удалены: возврат к первой странице
+            keyboard = await self.keyboards.quiz_page(route, prefix=prefix)
+        await self.bot.edit_message_text(
+            QUIZ_MENU_TITLES[route] if keyboard else "Нет доступных викторин.",
+            chat_id=call.message.chat.id, message_id=call.message.message_id, reply_markup=keyboard
+        )
+
+    async def on_single(self, call):
+        """
+        Выбор одиночного режима.
+        :param call: Объект callback-запроса.
+        """
+        await self.start_quiz(call.message)
+
+    async def on_pvp(self, call):
+        """
+        Выбор PVP-режима: постановка в очередь и подбор соперника.
+        :param call: Объект callback-запроса.
+        """
+        chat_id = call.message.chat.id
+        if await self.pvp_quiz_manager.get_match(chat_id):
+            await self.bot.send_message(chat_id, "Вы уже участвуете в PVP-викторине.")
+        elif not self.pvp_quiz_manager.matchmaker.join(chat_id):
+            await self.bot.send_message(chat_id, "Вы уже в очереди на PVP-викторину.")
+        else:
+            # Игроки объединяются в пары сразу, как только в очереди их набирается двое
+            for match in await self.pvp_quiz_manager.pair_players():
+                for player in match['players']:
+                    await self.game_state_manager.finish_quiz(player, silent=True)
+                self.pvp_quiz_manager.launch(self.pvp_quiz_manager.start_pvp_game(match))
+            if chat_id in self.pvp_quiz_manager.matchmaker.queue:
+                await self.bot.send_message(chat_id, "Вы добавлены в очередь на PVP-викторину. Пожалуйста, подождите второго игрока. Вы можете пока продолжить проходить одиночные викторины.", reply_markup=LEAVE_QUEUE_KEYBOARD)
+
+    async def on_leave_queue(self, call):
+        """
+        Кнопка "Покинуть очередь".
+        :param call: Объект callback-запроса.
+        """
+        chat_id = call.message.chat.id
+        if self.pvp_quiz_manager.matchmaker.leave(chat_id):
+            await self.bot.send_message(chat_id, "Вы покинули очередь на PVP-викторину.")
+        else:
+            await self.bot.send_message(chat_id, "Вы не в очереди на PVP-викторину.")
+
+    async def on_quiz(self, call, quiz_id):
+        """
+        Выбор викторины из списка.
+        :param call: Объект callback-запроса.
+        :param quiz_id: ID викторины.
+        """
+        await self.game_state_manager.start_quiz_game(call.message.chat.id, quiz_id)
+
+    async def on_replay(self, call, quiz_id):
+        """
+        Кнопка "Пройти заново".
+        :param call: Объект callback-запроса.
+        :param quiz_id: ID викторины.
+        """
+        await self.replay_quiz(call.message.chat.id, quiz_id)
+
+    async def on_newquiz(self, call):
+        """
+        Кнопка "Другая викторина".
+        :param call: Объект callback-запроса.
+        """
+        await self.start_quiz(call.message)
+
     async def handle_message(self, message):
         """
-        Обработчик сообщений.
+        Обработчик сообщений. Время обработки записывается в quiz_handler_seconds с меткой по виду сообщения.
         :param message: Объект сообщения. Содержит ID чата (message.chat.id), текст сообщения (message.text)
         """
+        started = time.perf_counter()
+        route = "message:answer"
         try:
             chat_id = message.chat.id  # Используется для отправки сообщений в конкретный чат
             text = message.text  # Используется для обработки текста сообщения
+            self.usernames.remember_message(message)
 
-            if self.current_action == "add_quiz":
-                if self.current_step == "name":
-                    self.current_quiz['name'] = text
-                    self.current_quiz['questions'] = []
-                    self.current_step = "question"
-                    await self.bot.send_message(chat_id, "Введите вопрос:")
-                elif self.current_step == "question":
-                    self.current_quiz['questions'].append((text, ''))
-                    self.current_step = "answer"
-                    await self.bot.send_message(chat_id, "Введите ответ:")
-                elif self.current_step == "answer":
-                    if self.current_quiz['questions']:
-                        self.current_quiz['questions'][-1] = (self.current_quiz['questions'][-1][0], text)
-                    await self.bot.send_message(chat_id, "Введите следующий вопрос или нажмите 'Готово':", reply_markup=self.get_done_keyboard())
-                    self.current_step = "question"  # Возвращаемся к шагу вопроса
-
-            elif self.current_action == "update_quiz":
-                if self.current_step == "update_question":
-                    self.current_quiz['questions'].append((text, ''))
-                    self.current_step = "update_answer"
-                    await self.bot.send_message(chat_id, "Введите ответ:")
-                elif self.current_step == "update_answer":
-                    if self.current_quiz['questions']:
-                        self.current_quiz['questions'][-1] = (self.current_quiz['questions'][-1][0], text)
-                    await self.bot.send_message(chat_id, "Введите следующий вопрос или нажмите 'Готово':", reply_markup=self.get_done_keyboard())
-                    self.current_step = "update_question"  # Возвращаемся к шагу вопроса
+            session = self.editor_sessions.get(chat_id)
+            if session is not None:
+                editor_step = self.editor_steps.get(session.state)
+                if editor_step is not None:
+                    route = "message:editor"
+                    await editor_step(chat_id, session, text)
+                    return
 
             if message.text == "Новая викторина":
+                route = "message:new_quiz"
                 await self.start_quiz(message)
             elif message.text == "Смена режима":
-                keyboard = types.InlineKeyboardMarkup()
-                keyboard.add(
-                    types.InlineKeyboardButton(text="Одиночная", callback_data="single"),
-                    types.InlineKeyboardButton(text="PVP-викторина", callback_data="pvp")
-                )
-                await self.bot.send_message(chat_id, "Выберите тип викторины:", reply_markup=keyboard)
+                route = "message:change_mode"
+                await self.bot.send_message(chat_id, "Выберите тип викторины:", reply_markup=MODE_KEYBOARD)
             elif message.text == "Лидерборд":
+                route = "message:leaderboard"
                 await self.show_leaderboard(message)
-            elif chat_id in self.game_state:
-                correct_answer = self.game_state[chat_id]['answer']
-                if message.text.lower() == correct_answer.lower():
-                    await self.bot.send_message(chat_id, "Правильно!")
-                    self.game_state[chat_id]['score'] += 1
-                else:
-                    await self.bot.send_message(chat_id, "Неправильно!")
-
-                # Отправляем следующий вопрос, если он есть
-                await self.game_state_manager.send_next_question(chat_id)
-            elif chat_id in self.pvp_game_state:
-                opponent = self.get_opponent(chat_id)
-                if opponent:
-                    correct_answer = self.pvp_game_state[chat_id]['answer']
-                    if message.text.lower() == correct_answer.lower():
-                        if not self.pvp_game_state[opponent]['correct_answer']:
-                            self.pvp_game_state[chat_id]['score'] += 1
-                            self.pvp_game_state[chat_id]['correct_answer'] = True
-                            player_name = await self.pvp_quiz_manager.get_username(chat_id)
-                            await self.bot.send_message(chat_id, "Верно!")
-                            await self.bot.send_message(opponent, f"Игрок {player_name} ответил правильно!")
-                            await self.pvp_quiz_manager.send_next_pvp_question(chat_id, opponent)
-                        else:
-                            await self.bot.send_message(chat_id, "Ответ уже был дан другим игроком.")
-                    else:
-                        self.pvp_game_state[chat_id]['answered'] = True
-                        await self.bot.send_message(chat_id, "Не верно.")
-                        if self.pvp_game_state[opponent]['answered']:
-                            await self.pvp_quiz_manager.send_next_pvp_question(chat_id, opponent)
+            elif not await self.game_state_manager.answer_question(chat_id, text):
+                await self.pvp_quiz_manager.answer_question(chat_id, text)
         except Exception as e:
             logger.error(f"Error handling message: {e}")
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, route)
 
-    def get_opponent(self, player_id):
+    async def editor_enter_name(self, chat_id, session, text):
         """
-        Получение противника для PVP-викторины.
-        :param player_id: ID игрока.
-        :return: ID противника.
+        Шаг редактора: ввод названия новой викторины.
+        :param chat_id: ID чата.
+        :param session: Сессия редактора.
+        :param text: Текст сообщения.
+        """
+        session.quiz['name'] = text
+        session.quiz['questions'] = []
+        session.step = "question"
+        await self.bot.send_message(chat_id, "Введите вопрос:")
+
+    async def editor_enter_question(self, chat_id, session, text):
         """
-        for player, state in self.pvp_game_state.items():
-            if player != player_id:
-                return player
-        return None
+        Шаг редактора: ввод вопроса.
+        :param chat_id: ID чата.
+        :param session: Сессия редактора.
+        :param text: Текст сообщения.
+        """
+        session.quiz['questions'].append((text, ''))
+        session.step = "answer" if session.action == "add_quiz" else "update_answer"
+        await self.bot.send_message(chat_id, "Введите ответ:")
+
+    async def editor_enter_answer(self, chat_id, session, text):
+        """
+        Шаг редактора: ввод ответа на последний вопрос.
+        :param chat_id: ID чата.
+        :param session: Сессия редактора.
+        :param text: Текст сообщения.
+        """
+        if session.quiz['questions']:
+            session.quiz['questions'][-1] = (session.quiz['questions'][-1][0], text)
+        await self.bot.send_message(chat_id, "Введите следующий вопрос или нажмите 'Готово':", reply_markup=self.get_done_keyboard())
+        session.step = "question" if session.action == "add_quiz" else "update_question"  # Возвращаемся к шагу вопроса
 
     async def start_quiz(self, message):
         """
@@ -213,32 +294,15 @@ class MessageHandler:
         """
         try:
             chat_id = message.chat.id  # Используется для отправки сообщений в конкретный чат
-            quizzes = await self.get_quizzes()
+            keyboard = await self.keyboards.quiz_page()
 
-            if quizzes:
-                keyboard = types.InlineKeyboardMarkup()
-                for quiz_id, quiz_name in quizzes:
-                    keyboard.add(types.InlineKeyboardButton(text=quiz_name, callback_data=f"quiz_{quiz_id}"))
-                await self.bot.send_message(chat_id, "Выберите викторину:", reply_markup=keyboard)
+            if keyboard:
+                await self.bot.send_message(chat_id, QUIZ_MENU_TITLES["quiz"], reply_markup=keyboard)
             else:
                 await self.bot.send_message(chat_id, "Нет доступных викторин.")
         except Exception as e:
             logger.error(f"Error starting quiz: {e}")
 
-    async def get_quizzes(self):
-        """
-        Получение списка викторин.
-        :return: Список викторин.
-        """
-        try:
-            async with aiosqlite.connect('quiz.db') as db:
-                cursor = await db.cursor()
-                await cursor.execute("SELECT id, name FROM quizzes")
-                return await cursor.fetchall()
-        except Exception as e:
-            logger.error(f"Error getting quizzes: {e}")
-            return []
-
     async def show_leaderboard(self, message):
         """
         Отображение лидерборда.
@@ -249,25 +313,7 @@ class MessageHandler:
             leaderboard = await self.fetch_leaderboard()
 
             if leaderboard:
-                best_scores = {}
-                for username, quiz_id, score, total_questions in leaderboard:
-                    if username not in best_scores or (
-                            score / total_questions > best_scores[username]['score'] / best_scores[username]['total_questions']):
-                        quiz_name = await self.fetch_quiz_name(quiz_id)
-                        best_scores[username] = {
-                            'quiz_name': quiz_name,
-                            'score': int(score),  # Convert score to integer
-                            'total_questions': total_questions
-                        }
-
-                response = "Лидерборд:\n"
-                for position, (username, data) in enumerate(
-                        sorted(best_scores.items(), key=lambda x: x[1]['score'] / x[1]['total_questions'], reverse=True),
-                        start=1):
-                    response += (f"{position}. {username} - {data['quiz_name']}: "
-                                 f"{data['score']}/{data['total_questions']} "
-                                 f"({data['score'] / data['total_questions'] * 100:.2f}%)\n")
-                await self.bot.send_message(chat_id, response)
+                await self.bot.send_message(chat_id, self.database.leaderboard.render(leaderboard))
             else:
                 await self.bot.send_message(chat_id, "Лидерборд пока пуст.")
         except Exception as e:
@@ -275,40 +321,15 @@ class MessageHandler:
 
     async def fetch_leaderboard(self):
         """
-        Получение лидерборда.
+        Получение лидерборда: лучший результат каждого пользователя одним запросом.
         :return: Лидерборд.
         """
         try:
-            async with aiosqlite.connect('quiz.db') as db:
-                cursor = await db.cursor()
-                await cursor.execute("""
-                    SELECT username, quiz_id, score,
-                           (SELECT COUNT(*) FROM questions WHERE quiz_id = scores.quiz_id) as total_questions
-                    FROM scores
-                    ORDER BY score DESC
-                """)
-                results = await cursor.fetchall()
-                return [result for result in results if result[3] > 0]  # Фильтруем результаты, где total_questions > 0
+            return await self.database.leaderboard.fetch()
         except Exception as e:
             logger.error(f"Error fetching leaderboard: {e}")
             return []
 
-    async def fetch_quiz_name(self, quiz_id):
-        """
-        Получение названия викторины по её ID.
-        :param quiz_id: ID викторины.
-        :return: Название викторины.
-        """
-        try:
-            async with aiosqlite.connect('quiz.db') as db:
-                cursor = await db.cursor()
-                await cursor.execute("SELECT name FROM quizzes WHERE id = ?", (quiz_id,))
-                result = await cursor.fetchone()
-                return result[0] if result else None
-        except Exception as e:
-            logger.error(f"Error fetching quiz name: {e}")
-            return None
-
     async def replay_quiz(self, chat_id, quiz_id):
         """
         Переигровка викторины.
@@ -320,56 +341,12 @@ class MessageHandler:
         except Exception as e:
             logger.error(f"Error replaying quiz: {e}")
 
-    async def send_next_question(self, chat_id):
-        """
-        Отправка следующего вопроса.
-        :param chat_id: ID чата.
-        """
-        try:
-            if chat_id in self.game_state:
-                current_question = self.game_state[chat_id]['current_question']
-                questions = self.game_state[chat_id]['questions']
-                if current_question < len(questions):
-                    question, answer = questions[current_question]
-                    self.game_state[chat_id]['current_question'] += 1
-                    self.game_state[chat_id]['answer'] = answer
-                    await self.bot.send_message(chat_id, question)
-                else:
-                    await self.game_state_manager.finish_quiz(chat_id)
-        except Exception as e:
-            logger.error(f"Error sending next question: {e}")
-
-    async def send_next_pvp_question(self, player1, player2):
-        """
-        Отправка следующего вопроса для PVP-викторины.
-        :param player1: ID первого игрока.
-        :param player2: ID второго игрока.
-        """
-        try:
-            if player1 in self.pvp_game_state and player2 in self.pvp_game_state:
-                current_question = self.pvp_game_state[player1]['current_question']
-                questions = self.pvp_game_state[player1]['questions']
-                if current_question < len(questions):
-                    question, answer = questions[current_question]
-                    self.pvp_game_state[player1]['current_question'] += 1
-                    self.pvp_game_state[player2]['current_question'] += 1
-                    self.pvp_game_state[player1]['answer'] = answer
-                    self.pvp_game_state[player2]['answer'] = answer
-                    await self.bot.send_message(player1, question)
-                    await self.bot.send_message(player2, question)
-                else:
-                    await self.pvp_quiz_manager.finish_pvp_game(player1, player2)
-        except Exception as e:
-            logger.error(f"Error sending next PVP question: {e}")
-
     def get_done_keyboard(self):
         """
         Получение клавиатуры с кнопкой "Готово".
-        :return: Клавиатура с кнопкой "Готово".
+        :return: Клавиатура с кнопкой "Готово" (JSON-строка).
         """
-        keyboard = types.InlineKeyboardMarkup()
-        keyboard.add(types.InlineKeyboardButton(text="Готово", callback_data="done"))
-        return keyboard
+        return DONE_KEYBOARD
 
     async def handle_done(self, call):
         """
@@ -378,13 +355,15 @@ class MessageHandler:
         """
         try:
             chat_id = call.message.chat.id  # Используется для отправки сообщений в конкретный чат
-            if self.current_action == "add_quiz":
-                await self.database.add_quiz(self.current_quiz['name'], self.current_quiz['questions'])
-                await self.bot.send_message(chat_id, f"Викторина '{self.current_quiz['name']}' успешно добавлена.")
-            elif self.current_action == "update_quiz":
-                await self.database.update_quiz(self.current_quiz['name'], self.current_quiz['name'], self.current_quiz['questions'])
-                await self.bot.send_message(chat_id, f"Викторина '{self.current_quiz['name']}' успешно обновлена.")
-            self.current_action = None
-            self.current_quiz = {}
+            session = self.editor_sessions.get(chat_id)
+            if session is None:
+                return
+            if session.action == "add_quiz":
+                await self.database.add_quiz(session.quiz['name'], session.quiz['questions'])
+                await self.bot.send_message(chat_id, f"Викторина '{session.quiz['name']}' успешно добавлена.")
+            elif session.action == "update_quiz":
+                await self.database.update_quiz(session.quiz['name'], session.quiz['name'], session.quiz['questions'])
+                await self.bot.send_message(chat_id, f"Викторина '{session.quiz['name']}' успешно обновлена.")
+            self.editor_sessions.finish(chat_id)
         except Exception as e:
             logger.error(f"Error handling done: {e}")
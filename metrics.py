@@ -0,0 +1,281 @@
+import time
+import functools
+import logging
+from aiohttp import web
+from tracing import span, trace_update
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм времени в секундах
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def escape_label(value):
+    """
+    Экранирование значения метки для текстового формата Prometheus.
+    :param value: Значение метки.
+    :return: Экранированная строка.
+    """
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_labels(names, values, extra=None):
+    """
+    Форматирование меток показателя.
+    :param names: Имена меток.
+    :param values: Значения меток.
+    :param extra: Дополнительная пара (имя, значение), например le гистограммы.
+    :return: Строка вида {name="value",...} или пустая строка.
+    """
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def format_value(value):
+    """
+    Форматирование числа для текстового формата Prometheus.
+    :param value: Число.
+    :return: Строка.
+    """
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=(), registry=None):
+        """
+        Инициализация показателя.
+        :param name: Имя показателя.
+        :param documentation: Описание для строки HELP.
+        :param labels: Имена меток.
+        :param registry: Реестр или None для общего реестра REGISTRY.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}  # Кортеж значений меток -> значение
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def render(self):
+        """
+        Строки показателя в текстовом формате Prometheus.
+        :return: Список строк.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, values)} {format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        """
+        Увеличение счётчика.
+        :param labels: Значения меток.
+        :param amount: Величина увеличения.
+        """
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        """
+        Установка значения.
+        :param value: Значение.
+        :param labels: Значения меток.
+        """
+        self.values[labels] = value
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS, registry=None):
+        """
+        Инициализация гистограммы.
+        :param name: Имя показателя.
+        :param documentation: Описание для строки HELP.
+        :param labels: Имена меток.
+        :param buckets: Возрастающие границы корзин.
+        :param registry: Реестр или None для общего реестра REGISTRY.
+        """
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        """
+        Учёт наблюдения.
+        :param value: Значение, например время в секундах.
+        :param labels: Значения меток.
+        """
+        series = self.values.get(labels)
+        if series is None:
+            # Количество наблюдений по корзинам (последняя - +Inf) и сумма значений
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        counts = series[0]
+        index = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            index += 1
+        counts[index] += 1
+        series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, values, ('le', format_value(float(bound))))} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, values)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, values)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        """
+        Инициализация реестра показателей.
+        """
+        self.metrics = {}  # Имя -> показатель
+
+    def register(self, metric):
+        """
+        Регистрация показателя.
+        :param metric: Показатель.
+        """
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self.metrics[metric.name] = metric
+
+    def render(self):
+        """
+        Все показатели в текстовом формате Prometheus.
+        :return: Текст.
+        """
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = Histogram('quiz_handler_seconds', "Время обработки обновления по обработчикам.", ('handler',))
+DB_SECONDS = Histogram('quiz_db_seconds', "Время операций с базой данных.", ('operation',))
+DB_POOL_WAIT_SECONDS = Histogram('quiz_db_pool_wait_seconds', "Время ожидания соединения из пула.", ('mode',))
+MAILBOX_WAIT_SECONDS = Histogram('quiz_mailbox_wait_seconds', "Время ожидания очереди в почтовом ящике чата или матча.", ('kind',))
+API_SECONDS = Histogram('quiz_bot_api_seconds', "Время запросов к Telegram Bot API.", ('method',))
+API_REQUESTS = Counter('quiz_bot_api_requests_total', "Запросы к Telegram Bot API по результату.", ('method', 'result'))
+LOG_ERRORS = Counter('quiz_log_errors_total', "Записи журнала уровня ERROR по модулям.", ('logger',))
+LIVE_SESSIONS = Gauge('quiz_live_sessions', "Количество живых сессий.")
+SESSION_MEMORY_BYTES = Gauge('quiz_session_memory_bytes', "Оценка памяти, занятой сессиями.")
+LIVE_GAMES = Gauge('quiz_live_games', "Количество идущих викторин по режимам.", ('mode',))
+PVP_QUEUE_DEPTH = Gauge('quiz_pvp_queue_depth', "Количество игроков в очереди на PVP-викторину.")
+SEND_QUEUE_DEPTH = Gauge('quiz_send_queue_depth', "Количество исходящих запросов в очереди планировщика.")
+MAILBOX_DROPPED = Counter('quiz_mailbox_dropped_total', "Обновления, отброшенные переполненным почтовым ящиком.", ('kind',))
+ACTIVE_MAILBOXES = Gauge('quiz_active_mailboxes', "Количество почтовых ящиков с необработанными обновлениями.")
+SESSIONS_EVICTED = Counter('quiz_sessions_evicted_total', "Сессии, завершённые очисткой: idle - по бездействию, lru - при переполнении.", ('reason',))
+
+def timed(histogram, label, traced=True):
+    """
+    Декоратор асинхронной функции, записывающий время её выполнения в гистограмму
+    и участок с именем label в трассировку обрабатываемого обновления.
+    :param histogram: Гистограмма с одной меткой.
+    :param label: Значение метки.
+    :param traced: Записывать ли участок трассировки.
+    :return: Декоратор.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                if not traced:
+                    return await function(*args, **kwargs)
+                with span(label):
+                    return await function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, label)
+        return wrapper
+    return decorator
+
+def instrument(name, handler):
+    """
+    Обёртка обработчика обновлений, записывающая время обработки в quiz_handler_seconds
+    и создающая трассировку каждого обновления.
+    :param name: Имя обработчика, например "command:start".
+    :param handler: Асинхронный обработчик.
+    :return: Обёрнутый обработчик.
+    """
+    return trace_update(timed(HANDLER_SECONDS, name, traced=False)(handler), name)
+
+class ErrorLogCounter(logging.Handler):
+    def __init__(self):
+        """
+        Подсчёт записей журнала уровня ERROR. Ошибки, перехваченные в обработчиках и записанные
+        через logger.error, становятся видны в quiz_log_errors_total.
+        """
+        super().__init__(logging.ERROR)
+
+    def emit(self, record):
+        LOG_ERRORS.inc(record.name)
+
+class MetricsServer:
+    def __init__(self, registry=REGISTRY, host='127.0.0.1', port=9100, path='/metrics', collectors=()):
+        """
+        Инициализация HTTP-сервера показателей в формате Prometheus.
+        :param registry: Реестр показателей.
+        :param host: Адрес, на котором слушает сервер.
+        :param port: Порт, на котором слушает сервер.
+        :param path: Путь, по которому отдаются показатели.
+        :param collectors: Асинхронные функции, обновляющие показатели перед каждым запросом.
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.path = path
+        self.collectors = list(collectors)
+        self.runner = None
+        self.log_counter = ErrorLogCounter()
+
+    async def start(self):
+        """
+        Запуск HTTP-сервера и подсчёта ошибок в журнале.
+        """
+        logging.getLogger().addHandler(self.log_counter)
+        app = web.Application()
+        app.router.add_get(self.path, self.handle_metrics)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        logger.info(f"Metrics server listening on {self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        """
+        Остановка HTTP-сервера.
+        """
+        logging.getLogger().removeHandler(self.log_counter)
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle_metrics(self, request):
+        """
+        Выдача показателей.
+        :param request: HTTP-запрос.
+        :return: HTTP-ответ.
+        """
+        for collector in self.collectors:
+            try:
+                await collector()
+            except Exception as e:
+                logger.error(f"Error collecting metrics: {e}")
+        return web.Response(body=self.registry.render().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
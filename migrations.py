@@ -0,0 +1,99 @@
+import logging
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def create_base_tables(cursor):
+    """
+    Миграция 1: создание основных таблиц.
+    :param cursor: Курсор базы данных.
+    """
+    await cursor.execute('''
+    CREATE TABLE IF NOT EXISTS quizzes (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE
+    )
+    ''')
+    await cursor.execute('''
+    CREATE TABLE IF NOT EXISTS questions (
+        id INTEGER PRIMARY KEY,
+        quiz_id INTEGER,
+        question TEXT UNIQUE,
+        answer TEXT,
+        FOREIGN KEY (quiz_id) REFERENCES quizzes (id)
+    )
+    ''')
+    await cursor.execute('''
+    CREATE TABLE IF NOT EXISTS scores (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        username TEXT,
+        quiz_id INTEGER,
+        score REAL,
+        FOREIGN KEY (quiz_id) REFERENCES quizzes (id)
+    )
+    ''')
+
+async def add_indexes(cursor):
+    """
+    Миграция 2: удаление дубликатов результатов, уникальный ключ (user_id, quiz_id) и индексы.
+    :param cursor: Курсор базы данных.
+    """
+    # Для каждой пары (пользователь, викторина) оставляем только лучший результат
+    await cursor.execute('''
+    DELETE FROM scores WHERE id NOT IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id, quiz_id ORDER BY score DESC, id DESC) AS position
+            FROM scores
+        )
+        WHERE position = 1
+    )
+    ''')
+    await cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_scores_user_quiz ON scores (user_id, quiz_id)")
+    await cursor.execute("CREATE INDEX IF NOT EXISTS idx_scores_quiz_score ON scores (quiz_id, score)")
+    await cursor.execute("CREATE INDEX IF NOT EXISTS idx_questions_quiz ON questions (quiz_id)")
+
+async def create_meta_table(cursor):
+    """
+    Миграция 3: таблица служебных значений (например, версии начальных данных).
+    :param cursor: Курсор базы данных.
+    """
+    await cursor.execute('''
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    )
+    ''')
+
+# Список миграций по порядку: номер версии схемы и функция миграции
+MIGRATIONS = [
+    (1, create_base_tables),
+    (2, add_indexes),
+    (3, create_meta_table),
+]
+
+async def migrate(db):
+    """
+    Применение недостающих миграций. Текущая версия схемы хранится в PRAGMA user_version,
+    каждая миграция выполняется в отдельной транзакции.
+    :param db: Соединение с базой данных.
+    :return: Версия схемы после применения миграций.
+    """
+    cursor = await db.cursor()
+    await cursor.execute("PRAGMA user_version")
+    current_version = (await cursor.fetchone())[0]
+    for version, migration in MIGRATIONS:
+        if version <= current_version:
+            continue
+        await db.execute("BEGIN")
+        try:
+            await migration(cursor)
+            await cursor.execute(f"PRAGMA user_version = {version}")
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            raise e
+        logger.info(f"Database migrated to version {version}")
+        current_version = version
+    return current_version
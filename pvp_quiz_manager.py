@@ -1,143 +1,340 @@
 import asyncio
-import aiosqlite
 import logging
+from send_scheduler import PRIORITY_QUESTION
+from matchmaking import Matchmaker, RecentQuestions, MATCH_PREFIX, MATCH_FINISHED, PLAYER_PREFIX, match_key, opponent
+from answer_matcher import compile_answer
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class PVPQuizManager:
-    def __init__(self, bot):
+    def __init__(self, bot, database, usernames, sessions, reaper, mailboxes):
         """
         Инициализация менеджера PVP-викторин.
         :param bot: Экземпляр бота.
+        :param database: Экземпляр базы данных.
+        :param usernames: Кэш имён пользователей.
+        :param sessions: Хранилище сессий.
+        :param reaper: Очистка брошенных сессий.
+        :param mailboxes: Почтовые ящики: ответы одного матча обрабатываются по очереди.
         """
         self.bot = bot
-        self.pvp_game_state = {}
-        self.pvp_queue = []
-        self.lock = asyncio.Lock()  # Добавляем блокировку
+        self.database = database
+        self.usernames = usernames
+        self.sessions = sessions
+        self.matchmaker = Matchmaker(sessions)
+        self.reaper = reaper
+        self.mailboxes = mailboxes
+        self.reaper.add(MATCH_PREFIX, self.evict_match)
+        self.reaper.add(PLAYER_PREFIX, self.evict_player)
+        self.tasks = set()  # Фоновые задачи: запуск матчей и обратный отсчёт
+        self.start_delay = 10  # Пауза перед первым вопросом в секундах
+        self.countdown_seconds = 3  # Обратный отсчёт перед каждым вопросом в секундах
+        self.quiz_ids = None  # ID викторин, из которых берутся PVP-вопросы, None - из всех
+        self.recent = RecentQuestions()  # Недавно заданные игрокам вопросы
 
-    async def start_pvp_game(self, player1, player2):
+    async def get_match(self, player):
+        """
+        Получение текущего матча игрока.
+        :param player: ID игрока.
+        :return: Сессия матча или None.
+        """
+        return await self.matchmaker.get_match(player)
+
+    async def pair_players(self):
+        """
+        Создание матчей из всех пар игроков, ожидающих в очереди.
+        :return: Список сессий новых матчей.
+        """
+        # Каждый матч занимает три сессии: сам матч и индекс для двух игроков
+        await self.reaper.make_room(3 * (len(self.matchmaker.queue) // 2))
+        return await self.matchmaker.pair_players()
+
+    async def evict_match(self, key, match, reason):
+        """
+        Завершение брошенного матча очисткой сессий: игрокам отправляются итоги.
+        :param key: Ключ сессии матча.
+        :param match: Сессия матча.
+        :param reason: Причина: idle или lru.
+        :return: True.
+        """
+        await self.finish_pvp_game(match)
+        return True
+
+    async def evict_player(self, key, index, reason):
+        """
+        Очистка индекса игрок -> матч. Индекс живого матча при очистке по бездействию продлевается,
+        а при переполнении завершается весь матч: индексы создаются вместе с матчем, и без этого
+        вытеснение пропускало бы их, не освобождая места.
+        :param key: Ключ индекса.
+        :param index: Сессия индекса.
+        :param reason: Причина: idle или lru.
+        :return: True, если индекс удалён.
+        """
+        match = await self.sessions.get(match_key(index['match_id']))
+        if match is not None:
+            if reason == 'lru':
+                return await self.evict_match(match_key(index['match_id']), match, reason)
+            await self.sessions.put(key, index)
+            return False
+        await self.sessions.delete(key)
+        return True
+
+    async def resume_matches(self):
+        """
+        Продолжение матчей, восстановленных после перезапуска бота.
+        Матчи с открытым раундом продолжаются ответами игроков, а матчи, ожидавшие начала или
+        обратного отсчёта, запускаются заново с того же раунда.
+        :return: Количество продолженных матчей.
+        """
+        resumed = 0
+        for key in await self.sessions.keys(MATCH_PREFIX):
+            match = await self.sessions.get(key)
+            if match is not None and match['question'] == MATCH_FINISHED:
+                await self.matchmaker.remove_match(match)  # Итоги были отправлены до перезапуска
+                continue
+            if match is None or match['question'] % 2 == 1:
+                continue
+            if match['question'] == 0 and not match['questions']:
+                self.launch(self.start_pvp_game(match))
+            else:
+                self.launch(self.send_next_pvp_question(match['match_id'], match['question']))
+            resumed += 1
+        return resumed
+
+    def launch(self, coroutine):
+        """
+        Запуск фоновой задачи с сохранением ссылки на неё до завершения.
+        :param coroutine: Корутина.
+        """
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def stop(self):
+        """
+        Отмена фоновых задач матчей до закрытия хранилища сессий и базы.
+        Незавершённые матчи остаются в хранилище и продолжаются после перезапуска.
+        """
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def start_pvp_game(self, match):
         """
         Запуск PVP-викторины.
-        :param player1: ID первого игрока.
-        :param player2: ID второго игрока.
+        :param match: Сессия матча.
         """
         try:
-            player1_name = await self.get_username(player1)
-            player2_name = await self.get_username(player2)
-
-            await self.bot.send_message(player1, f"PVP-викторина начинается. Вы против игрока {player2_name}!")
-            await self.bot.send_message(player2, f"PVP-викторина начинается. Вы против игрока {player1_name}!")
+            player1, player2 = match['players']
+            player1_name, player2_name = await asyncio.gather(self.get_username(player1), self.get_username(player2))
 
-            await self.bot.send_message(player1, "Викторина начнётся через 10 секунд. Победит тот, кто первым ответит правильно на большее число вопросов.")
-            await self.bot.send_message(player2, "Викторина начнётся через 10 секунд. Победит тот, кто первым ответит правильно на большее число вопросов.")
+            await asyncio.gather(
+                self.bot.send_message(player1, f"PVP-викторина начинается. Вы против игрока {player2_name}!"),
+                self.bot.send_message(player2, f"PVP-викторина начинается. Вы против игрока {player1_name}!")
+            )
+            await asyncio.gather(
+                self.bot.send_message(player1, f"Викторина начнётся через {self.start_delay} секунд. Победит тот, кто первым ответит правильно на большее число вопросов."),
+                self.bot.send_message(player2, f"Викторина начнётся через {self.start_delay} секунд. Победит тот, кто первым ответит правильно на большее число вопросов.")
+            )
 
-            await asyncio.sleep(10)
+            await asyncio.sleep(self.start_delay)
 
-            questions = await self.fetch_questions_for_pvp()
-            self.pvp_game_state[player1] = {'questions': questions, 'current_question': 0, 'score': 0, 'answered': False, 'correct_answer': False}
-            self.pvp_game_state[player2] = {'questions': questions, 'current_question': 0, 'score': 0, 'answered': False, 'correct_answer': False}
-            await self.send_next_pvp_question(player1, player2)
+            questions = await self.fetch_questions_for_pvp(match['players'])
+            if await self.sessions.compare_and_set(match_key(match['match_id']), 0, 0, updates={'questions': questions}) is None:
+                logger.error(f"Error: PVP match {match['match_id']} is not active")
+                return
+            await self.send_next_pvp_question(match['match_id'], 0)
         except Exception as e:
             logger.error(f"Error starting PVP game: {e}")
 
-    async def send_next_pvp_question(self, player1, player2):
+    async def send_next_pvp_question(self, match_id, closed_round):
         """
         Отправка следующего вопроса для PVP-викторины.
-        :param player1: ID первого игрока.
-        :param player2: ID второго игрока.
+        Вызывается только тем обработчиком, который закрыл раунд closed_round, поэтому вопрос
+        отправляется один раз. Обратный отсчёт выполняется одновременно для обоих игроков.
+        :param match_id: ID матча.
+        :param closed_round: Номер закрытого раунда (чётный).
         """
         try:
-            async with self.lock:  # Используем блокировку для синхронизации
-                if player1 in self.pvp_game_state and player2 in self.pvp_game_state:
-                    current_question = self.pvp_game_state[player1]['current_question']
-                    questions = self.pvp_game_state[player1]['questions']
-
-                    if current_question < len(questions):
-                        # Обратный отсчет перед выводом вопроса
-                        countdown_message1 = await self.bot.send_message(player1, "Следующий вопрос через 3 секунды...")
-                        countdown_message2 = await self.bot.send_message(player2, "Следующий вопрос через 3 секунды...")
-
-                        for i in range(2, -1, -1):
-                            await asyncio.sleep(1)
-                            await self.bot.edit_message_text(chat_id=countdown_message1.chat.id, message_id=countdown_message1.message_id, text=f"Следующий вопрос через {i} секунд...")
-                            await self.bot.edit_message_text(chat_id=countdown_message2.chat.id, message_id=countdown_message2.message_id, text=f"Следующий вопрос через {i} секунд...")
-
-                        question, answer = questions[current_question]
-                        self.pvp_game_state[player1]['current_question'] += 1
-                        self.pvp_game_state[player2]['current_question'] += 1
-                        self.pvp_game_state[player1]['answer'] = answer
-                        self.pvp_game_state[player2]['answer'] = answer
-                        self.pvp_game_state[player1]['answered'] = False
-                        self.pvp_game_state[player2]['answered'] = False
-                        self.pvp_game_state[player1]['correct_answer'] = False
-                        self.pvp_game_state[player2]['correct_answer'] = False
-                        await self.bot.send_message(player1, question)
-                        await self.bot.send_message(player2, question)
-                    else:
-                        await self.finish_pvp_game(player1, player2)
-                else:
-                    logger.error(f"Error: Player {player1} or {player2} not in pvp_game_state")
-                    self.pvp_queue = []  # Очистка очереди игроков в случае ошибки
+            key = match_key(match_id)
+            match = await self.sessions.get(key)
+            if match is None or match['question'] != closed_round:
+                logger.error(f"Error: PVP match {match_id} is not active")
+                return
+            index = closed_round // 2
+            if index >= len(match['questions']):
+                await self.finish_pvp_game(match)
+                return
+            question, answer = match['questions'][index]
+
+            await self.run_countdown(match['players'], self.countdown_seconds)
+
+            # Открытие раунда: матч мог завершиться во время обратного отсчёта
+            match = await self.sessions.compare_and_set(
+                key, closed_round, closed_round + 1,
+                updates={'answer': answer, 'answered': {str(player): False for player in match['players']}}
+            )
+            if match is None:
+                return
+            await asyncio.gather(*(self.bot.send_message(player, question, priority=PRIORITY_QUESTION) for player in match['players']))
         except Exception as e:
             logger.error(f"Error sending next PVP question: {e}")
 
-    async def fetch_questions_for_pvp(self):
+    async def answer_question(self, player, text):
         """
-        Получение вопросов для PVP-викторины.
+        Обработка ответа игрока PVP-викторины.
+        Ответы обоих игроков матча проверяются по очереди в почтовом ящике матча, а следующий вопрос
+        с обратным отсчётом отправляется в фоне, чтобы ответы, пришедшие во время отсчёта, не ждали его
+        и не засчитывались к следующему вопросу.
+        :param player: ID игрока.
+        :param text: Текст ответа.
+        :return: True, если игрок участвует в PVP-викторине.
+        """
+        match = await self.get_match(player)
+        if match is None:
+            return False
+        closed_round = await self.mailboxes.run(('match', match['match_id']), self.judge_answer, player, text)
+        if closed_round is not None:
+            self.launch(self.send_next_pvp_question(match['match_id'], closed_round))
+        return True
+
+    async def judge_answer(self, player, text):
+        """
+        Проверка ответа игрока PVP-викторины.
+        Очко получает только тот, чей compare_and_set первым закрыл раунд, даже если игроки
+        обслуживаются разными процессами бота.
+        :param player: ID игрока.
+        :param text: Текст ответа.
+        :return: Номер раунда, закрытого этим ответом, или None.
+        """
+        match = await self.get_match(player)
+        if match is None:
+            return None
+        current_round = match['question']
+        if current_round % 2 == 0 or current_round == MATCH_FINISHED:
+            return None  # Во время обратного отсчёта и после завершения ответы не принимаются
+        key = match_key(match['match_id'])
+        rival = opponent(match, player)
+        if compile_answer(match['answer']).matches(text):
+            closed = await self.sessions.compare_and_set(
+                key, current_round, current_round + 1,
+                updates={'scores': {str(player): match['scores'][str(player)] + 1}}
+            )
+            if closed is None:
+                await self.bot.send_message(player, "Ответ уже был дан другим игроком.")
+                return None
+            player_name = await self.get_username(player)
+            await asyncio.gather(
+                self.bot.send_message(player, "Верно!"),
+                self.bot.send_message(rival, f"Игрок {player_name} ответил правильно!")
+            )
+            return current_round + 1
+        else:
+            match = await self.sessions.compare_and_set(key, current_round, current_round, updates={'answered': {str(player): True}})
+            await self.bot.send_message(player, "Не верно.")
+            # Раунд закрывает тот, кто увидел ответы обоих игроков первым
+            if match is not None and match['answered'][str(rival)]:
+                if await self.sessions.compare_and_set(key, current_round, current_round + 1) is not None:
+                    return current_round + 1
+        return None
+
+    async def run_countdown(self, players, seconds=3):
+        """
+        Обратный отсчёт перед вопросом. Сообщения отправляются игрокам одновременно,
+        а их правки выполняются отдельной фоновой задачей по расписанию.
+        :param players: ID игроков.
+        :param seconds: Длительность отсчёта в секундах.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + seconds
+        messages = await asyncio.gather(
+            *(self.bot.send_message(player, f"Следующий вопрос через {seconds} секунды...") for player in players)
+        )
+        self.launch(self.edit_countdown(messages, deadline, seconds))
+        await asyncio.sleep(max(0, deadline - loop.time()))
+
+    async def edit_countdown(self, messages, deadline, seconds):
+        """
+        Правка сообщений обратного отсчёта раз в секунду.
+        :param messages: Сообщения обратного отсчёта.
+        :param deadline: Время окончания отсчёта (loop.time()).
+        :param seconds: Длительность отсчёта в секундах.
+        """
+        loop = asyncio.get_running_loop()
+        for i in range(seconds - 1, -1, -1):
+            await asyncio.sleep(max(0, deadline - i - loop.time()))
+            results = await asyncio.gather(
+                *(self.bot.edit_message_text(chat_id=message.chat.id, message_id=message.message_id, text=f"Следующий вопрос через {i} секунд...")
+                  for message in messages),
+                return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"Error editing countdown message: {result}")
+
+    async def fetch_questions_for_pvp(self, players=()):
+        """
+        Получение случайных вопросов для PVP-викторины из кэша каталога.
+        Вопросы, недавно заданные кому-то из игроков, по возможности не повторяются.
+        :param players: ID игроков матча.
         :return: Список вопросов.
         """
         try:
-            async with aiosqlite.connect('quiz.db') as db:
-                cursor = await db.cursor()
-                await cursor.execute("SELECT question, answer FROM questions ORDER BY RANDOM() LIMIT 10")
-                questions = await cursor.fetchall()
-                if len(questions) < 10:
-                    logger.warning("Warning: Less than 10 questions fetched for PVP game")
-                return questions
+            await self.database.catalog.ensure_loaded()
+            questions = self.database.catalog.sample_questions(10, self.quiz_ids, self.recent.seen(*players))
+            self.recent.add(players, [question for question, _ in questions])
+            if len(questions) < 10:
+                logger.warning("Warning: Less than 10 questions fetched for PVP game")
+            return questions
         except Exception as e:
             logger.error(f"Error fetching questions for PVP: {e}")
             return []
 
-    async def finish_pvp_game(self, player1, player2):
+    async def finish_pvp_game(self, match):
         """
         Завершение PVP-викторины.
-        :param player1: ID первого игрока.
-        :param player2: ID второго игрока.
+        Матч помечается завершённым и удаляется до отправки итогов, поэтому итоги отправляет только
+        один обработчик, и после перезапуска или очистки сессий они не отправляются повторно.
+        :param match: Сессия матча.
         """
         try:
-            player1_name = await self.get_username(player1)
-            player2_name = await self.get_username(player2)
-            score1 = self.pvp_game_state[player1]['score']
-            score2 = self.pvp_game_state[player2]['score']
+            key = match_key(match['match_id'])
+            if match['question'] == MATCH_FINISHED:
+                await self.matchmaker.remove_match(match)
+                return
+            if await self.sessions.compare_and_set(key, match['question'], MATCH_FINISHED) is None:
+                return  # Матч уже завершает другой обработчик
+            await self.matchmaker.remove_match(match)
+
+            player1, player2 = match['players']
+            player1_name, player2_name = await asyncio.gather(self.get_username(player1), self.get_username(player2))
+            score1 = match['scores'][str(player1)]
+            score2 = match['scores'][str(player2)]
 
             if score1 > score2:
-                await self.bot.send_message(player1, f"Викторина завершена! Вы победили! ({score1} против {score2})")
-                await self.bot.send_message(player2, f"Викторина завершена! Победитель - {player1_name} ({score1} против {score2})")
+                messages = ((player1, f"Викторина завершена! Вы победили! ({score1} против {score2})"),
+                            (player2, f"Викторина завершена! Победитель - {player1_name} ({score1} против {score2})"))
             elif score2 > score1:
-                await self.bot.send_message(player2, f"Викторина завершена! Вы победили! ({score2} против {score1})")
-                await self.bot.send_message(player1, f"Викторина завершена! Победитель - {player2_name} ({score2} против {score1})")
+                messages = ((player2, f"Викторина завершена! Вы победили! ({score2} против {score1})"),
+                            (player1, f"Викторина завершена! Победитель - {player2_name} ({score2} против {score1})"))
             else:
-                await self.bot.send_message(player1, f"Викторина завершена! Ничья ({score1} против {score2})")
-                await self.bot.send_message(player2, f"Викторина завершена! Ничья ({score2} против {score1})")
-
-            # Сброс состояния игры
-            del self.pvp_game_state[player1]
-            del self.pvp_game_state[player2]
-            self.pvp_queue = []  # Очистка очереди игроков
+                messages = ((player1, f"Викторина завершена! Ничья ({score1} против {score2})"),
+                            (player2, f"Викторина завершена! Ничья ({score2} против {score1})"))
+            await asyncio.gather(*(self.bot.send_message(player, text) for player, text in messages))
         except Exception as e:
             logger.error(f"Error finishing PVP game: {e}")
 
     async def get_username(self, chat_id):
         """
-        Получение имени пользователя.
+        Получение имени пользователя из кэша.
         :param chat_id: ID чата.
         :return: Имя пользователя.
         """
         try:
-            chat = await self.bot.get_chat(chat_id)
-            return chat.username or "None"
+            return await self.usernames.get(chat_id) or "None"
         except Exception as e:
             logger.error(f"Error getting username: {e}")
             return "None"
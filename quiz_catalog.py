@@ -0,0 +1,172 @@
+import random
+import bisect
+import itertools
+import logging
+from answer_matcher import CompiledAnswer
+from metrics import DB_SECONDS, timed
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class QuizCatalog:
+    def __init__(self, pool):
+        """
+        Инициализация кэша каталога викторин.
+        Каталог хранит в памяти все викторины с их вопросами и ответами, загружается при запуске
+        и обновляется точечно при изменении викторин через Database. Ответы хранятся в виде CompiledAnswer,
+        поэтому нормализация выполняется один раз при загрузке, а не на каждое сообщение.
+        :param pool: Пул соединений с базой данных.
+        """
+        self.pool = pool
+        self.quizzes = {}  # quiz_id -> {'name': str, 'questions': tuple[(question, CompiledAnswer)]}
+        self.all_questions = None  # Плоский список всех вопросов, строится по требованию
+        self.loaded = False
+        self.version = 0  # Увеличивается при каждом изменении каталога
+
+    @timed(DB_SECONDS, 'catalog.load')
+    async def load(self):
+        """
+        Полная загрузка каталога из базы данных.
+        """
+        quizzes = {}
+        async with self.pool.reader() as db:
+            cursor = await db.cursor()
+            await cursor.execute("SELECT id, name FROM quizzes")
+            for quiz_id, quiz_name in await cursor.fetchall():
+                quizzes[quiz_id] = {'name': quiz_name, 'questions': []}
+            await cursor.execute("SELECT quiz_id, question, answer FROM questions ORDER BY id")
+            for quiz_id, question, answer in await cursor.fetchall():
+                if quiz_id in quizzes:
+                    quizzes[quiz_id]['questions'].append((question, CompiledAnswer(answer)))
+        for quiz in quizzes.values():
+            quiz['questions'] = tuple(quiz['questions'])
+        self.quizzes = quizzes
+        self.loaded = True
+        self._changed()
+        logger.info(f"Quiz catalog loaded: {len(quizzes)} quizzes")
+
+    async def ensure_loaded(self):
+        """
+        Загрузка каталога, если он ещё не был загружен.
+        """
+        if not self.loaded:
+            await self.load()
+
+    @timed(DB_SECONDS, 'catalog.reload_quiz')
+    async def reload_quiz(self, quiz_id):
+        """
+        Перезагрузка одной викторины из базы данных после её добавления или обновления.
+        :param quiz_id: ID викторины.
+        """
+        if not self.loaded:
+            return
+        async with self.pool.reader() as db:
+            cursor = await db.cursor()
+            await cursor.execute("SELECT name FROM quizzes WHERE id = ?", (quiz_id,))
+            quiz_name = await cursor.fetchone()
+            await cursor.execute("SELECT question, answer FROM questions WHERE quiz_id = ? ORDER BY id", (quiz_id,))
+            questions = await cursor.fetchall()
+        if quiz_name:
+            self.quizzes[quiz_id] = {
+                'name': quiz_name[0],
+                'questions': tuple((question, CompiledAnswer(answer)) for question, answer in questions)
+            }
+        else:
+            self.quizzes.pop(quiz_id, None)
+        self._changed()
+
+    def remove_quiz(self, quiz_id):
+        """
+        Удаление викторины из каталога.
+        :param quiz_id: ID викторины.
+        """
+        if self.quizzes.pop(quiz_id, None) is not None:
+            self._changed()
+
+    def get_quizzes(self):
+        """
+        Получение списка всех викторин.
+        :return: Список пар (ID, название).
+        """
+        return [(quiz_id, quiz['name']) for quiz_id, quiz in sorted(self.quizzes.items())]
+
+    def get_quiz_details(self, quiz_id):
+        """
+        Получение названия и вопросов викторины.
+        :param quiz_id: ID викторины.
+        :return: Название викторины и список вопросов, или (None, []) если викторина не найдена.
+        """
+        quiz = self.quizzes.get(quiz_id)
+        if quiz is None:
+            return None, []
+        return quiz['name'], list(quiz['questions'])
+
+    def get_questions(self, quiz_id, shuffle=True):
+        """
+        Получение вопросов викторины в случайном порядке.
+        :param quiz_id: ID викторины.
+        :param shuffle: Перемешивать ли вопросы.
+        :return: Новый список вопросов.
+        """
+        quiz = self.quizzes.get(quiz_id)
+        if quiz is None:
+            return []
+        questions = list(quiz['questions'])
+        if shuffle:
+            random.shuffle(questions)
+        return questions
+
+    def sample_questions(self, count, quiz_ids=None, exclude=()):
+        """
+        Случайная выборка различных вопросов.
+        Вопросы выбираются случайными индексами в кортежах вопросов викторин без построения
+        отфильтрованного списка, поэтому выборка занимает O(count) в ожидании, пока исключённых вопросов
+        немного по сравнению с доступными. Если случайных попыток не хватило, оставшиеся вопросы
+        выбираются полным перебором, а если вопросов без исключённых мало, добавляются исключённые.
+        :param count: Количество вопросов.
+        :param quiz_ids: ID викторин, из которых выбираются вопросы, или None для всех викторин.
+        :param exclude: Тексты вопросов, которые по возможности не выбираются (например, недавно заданные).
+        :return: Список вопросов (не больше, чем есть в выбранных викторинах).
+        """
+        if quiz_ids is None:
+            if self.all_questions is None:
+                self.all_questions = [question for quiz in self.quizzes.values() for question in quiz['questions']]
+            pools = [self.all_questions]
+        else:
+            pools = [self.quizzes[quiz_id]['questions'] for quiz_id in quiz_ids if quiz_id in self.quizzes]
+        offsets = list(itertools.accumulate(len(pool) for pool in pools))  # Конец каждой викторины в общей нумерации
+        total = offsets[-1] if offsets else 0
+        count = min(count, total)
+
+        chosen = {}  # Индекс в общей нумерации -> вопрос
+        for _ in range(4 * count + 8):
+            if len(chosen) == count:
+                break
+            index = random.randrange(total)
+            if index in chosen:
+                continue
+            pool = bisect.bisect_right(offsets, index)
+            question = pools[pool][index - (offsets[pool - 1] if pool else 0)]
+            if question[0] not in exclude:
+                chosen[index] = question
+        questions = list(chosen.values())
+        if len(questions) < count:
+            # Случайных попыток не хватило: почти все вопросы исключены или уже выбраны
+            taken = {question[0] for question in questions}
+            rest = [question for pool in pools for question in pool if question[0] not in taken]
+            fresh = [question for question in rest if question[0] not in exclude]
+            if len(fresh) >= count - len(questions):
+                questions += random.sample(fresh, count - len(questions))
+            else:
+                seen = [question for question in rest if question[0] in exclude]
+                questions += fresh + random.sample(seen, count - len(questions) - len(fresh))
+                random.shuffle(questions)
+        return questions
+
+    def _changed(self):
+        """
+        Сброс производных данных после изменения каталога.
+        """
+        self.all_questions = None
+        self.version += 1
@@ -0,0 +1,281 @@
+import os
+import sys
+import csv
+import json
+import time
+import asyncio
+import argparse
+import logging
+from connection_pool import ConnectionPool
+from migrations import migrate
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Колонки CSV и поля JSONL: одна строка файла - один вопрос
+FIELDS = ('quiz', 'question', 'answer')
+FORMATS = ('csv', 'jsonl')
+
+EXISTING_QUESTIONS_QUERY = "SELECT question FROM questions WHERE question IN (SELECT value FROM json_each(?))"
+INSERT_QUESTION_QUERY = "INSERT OR IGNORE INTO questions (quiz_id, question, answer) VALUES (?, ?, ?)"
+# Викторины, созданные порцией, все вопросы которой оказались дубликатами
+DELETE_EMPTY_QUIZZES_QUERY = """
+    DELETE FROM quizzes WHERE id IN (SELECT value FROM json_each(?))
+    AND NOT EXISTS (SELECT 1 FROM questions WHERE questions.quiz_id = quizzes.id)
+"""
+EXPORT_QUERY = """
+    SELECT quizzes.name, questions.question, questions.answer
+    FROM questions JOIN quizzes ON quizzes.id = questions.quiz_id
+    ORDER BY questions.quiz_id, questions.id
+"""
+
+def detect_format(path, fmt=None):
+    """
+    Определение формата файла по явному указанию или расширению.
+    :param path: Путь к файлу или '-'.
+    :param fmt: Явно указанный формат или None.
+    :return: 'csv' или 'jsonl'.
+    """
+    if fmt:
+        return fmt
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    raise ValueError(f"Cannot detect format of '{path}', use --format")
+
+def read_rows(handle, fmt):
+    """
+    Построчное чтение вопросов из файла.
+    :param handle: Открытый текстовый файл.
+    :param fmt: Формат файла.
+    :return: Генератор кортежей (номер строки, викторина, вопрос, ответ). Для некорректной строки
+    викторина равна None, а вопрос содержит исходный текст.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(handle)
+        for row in reader:
+            values = tuple((row.get(field) or '').strip() for field in FIELDS)
+            yield (reader.line_num, *values) if all(values) else (reader.line_num, None, str(row), '')
+        return
+    for line_number, line in enumerate(handle, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+            values = tuple(str(row.get(field) or '').strip() for field in FIELDS)
+        except (ValueError, AttributeError):
+            values = ()
+        yield (line_number, *values) if values and all(values) else (line_number, None, line.strip(), '')
+
+class RejectReport:
+    def __init__(self, handle=None):
+        """
+        Инициализация отчёта об отклонённых строках импорта.
+        :param handle: Открытый текстовый файл для отчёта в формате CSV или None, если нужен только подсчёт.
+        """
+        self.writer = csv.writer(handle) if handle is not None else None
+        if self.writer is not None:
+            self.writer.writerow(('line', 'reason', *FIELDS))
+        self.duplicates = 0
+        self.invalid = 0
+
+    def reject(self, line_number, reason, quiz, question, answer):
+        """
+        Запись отклонённой строки.
+        :param line_number: Номер строки во входном файле.
+        :param reason: Причина: 'duplicate' или 'invalid'.
+        :param quiz: Название викторины.
+        :param question: Вопрос.
+        :param answer: Ответ.
+        """
+        if reason == 'duplicate':
+            self.duplicates += 1
+        else:
+            self.invalid += 1
+        if self.writer is not None:
+            self.writer.writerow((line_number, reason, quiz or '', question, answer))
+
+class QuizImporter:
+    def __init__(self, pool, chunk_size=5000, report=None):
+        """
+        Инициализация потокового импорта вопросов.
+        Строки читаются порциями по chunk_size, каждая порция записывается одним executemany
+        в отдельной транзакции. Вопросы уникальны во всей базе, поэтому перед записью порции
+        одним запросом находятся уже существующие вопросы, и они попадают в отчёт как дубликаты.
+        :param pool: Пул соединений с базой данных.
+        :param chunk_size: Количество строк в одной транзакции.
+        :param report: Отчёт об отклонённых строках.
+        """
+        self.pool = pool
+        self.chunk_size = chunk_size
+        self.report = report or RejectReport()
+        self.quiz_ids = {}  # Название викторины -> ID
+        self.inserted = 0
+        self.created_quizzes = 0
+
+    async def load_quizzes(self):
+        """
+        Загрузка существующих викторин.
+        """
+        async with self.pool.reader() as db:
+            cursor = await db.execute("SELECT id, name FROM quizzes")
+            self.quiz_ids = {name: quiz_id for quiz_id, name in await cursor.fetchall()}
+
+    async def run(self, rows):
+        """
+        Импорт строк.
+        :param rows: Итератор кортежей (номер строки, викторина, вопрос, ответ).
+        """
+        await self.load_quizzes()
+        chunk = []
+        for row in rows:
+            if row[1] is None:
+                self.report.reject(row[0], 'invalid', None, row[2], row[3])
+                continue
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                await self.write_chunk(chunk)
+                chunk = []
+        if chunk:
+            await self.write_chunk(chunk)
+
+    async def write_chunk(self, chunk):
+        """
+        Запись порции строк в одной транзакции.
+        Викторина создаётся только для вопроса, которого ещё нет в базе, а созданные викторины,
+        оставшиеся пустыми (вопросы добавил другой процесс), удаляются в той же транзакции.
+        Новые ID викторин попадают в кэш только после фиксации транзакции.
+        :param chunk: Список кортежей (номер строки, викторина, вопрос, ответ).
+        """
+        created = {}  # Название викторины -> ID викторины, созданной в этой порции
+        async with self.pool.writer() as db:
+            cursor = await db.execute(EXISTING_QUESTIONS_QUERY, (json.dumps([row[2] for row in chunk], ensure_ascii=False),))
+            seen = {row[0] for row in await cursor.fetchall()}
+            values = []
+            for line_number, quiz, question, answer in chunk:
+                if question in seen:
+                    self.report.reject(line_number, 'duplicate', quiz, question, answer)
+                    continue
+                seen.add(question)
+                quiz_id = self.quiz_ids.get(quiz) or created.get(quiz)
+                if quiz_id is None:
+                    cursor = await db.execute("INSERT INTO quizzes (name) VALUES (?)", (quiz,))
+                    quiz_id = created[quiz] = cursor.lastrowid
+                values.append((quiz_id, question, answer))
+            changes = db.total_changes
+            await db.executemany(INSERT_QUESTION_QUERY, values)
+            # Вопросы, добавленные за это время другим процессом, пропускаются INSERT OR IGNORE
+            inserted = db.total_changes - changes
+            if created:
+                cursor = await db.execute(DELETE_EMPTY_QUIZZES_QUERY, (json.dumps(list(created.values())),))
+                if cursor.rowcount > 0:
+                    created = await self.nonempty(db, created)
+            await db.commit()
+        self.quiz_ids.update(created)
+        self.created_quizzes += len(created)
+        self.inserted += inserted
+
+    async def nonempty(self, db, created):
+        """
+        Отбор созданных викторин, оставшихся в базе после удаления пустых.
+        :param db: Соединение с базой данных.
+        :param created: Словарь название -> ID созданных викторин.
+        :return: Словарь только с оставшимися викторинами.
+        """
+        cursor = await db.execute("SELECT id FROM quizzes WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(list(created.values())),))
+        remaining = {row[0] for row in await cursor.fetchall()}
+        return {name: quiz_id for name, quiz_id in created.items() if quiz_id in remaining}
+
+async def export_quizzes(pool, handle, fmt, chunk_size=5000):
+    """
+    Потоковая выгрузка всех вопросов каталога.
+    :param pool: Пул соединений с базой данных.
+    :param handle: Открытый текстовый файл.
+    :param fmt: Формат файла.
+    :param chunk_size: Количество строк, читаемых из базы за раз.
+    :return: Количество выгруженных вопросов.
+    """
+    writer = None
+    if fmt == 'csv':
+        writer = csv.writer(handle)
+        writer.writerow(FIELDS)
+    exported = 0
+    async with pool.reader() as db:
+        cursor = await db.execute(EXPORT_QUERY)
+        rows = await cursor.fetchmany(chunk_size)
+        while rows:
+            if writer is not None:
+                writer.writerows(rows)
+            else:
+                handle.writelines(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + '\n' for row in rows)
+            exported += len(rows)
+            rows = await cursor.fetchmany(chunk_size)
+    return exported
+
+def open_text(path, mode):
+    """
+    Открытие текстового файла, '-' означает стандартный ввод или вывод.
+    :param path: Путь к файлу.
+    :param mode: 'r' или 'w'.
+    :return: Открытый файл.
+    """
+    if path == '-':
+        return os.fdopen(os.dup((sys.stdin if mode == 'r' else sys.stdout).fileno()), mode, encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+async def main(argv=None):
+    """
+    Точка входа командной строки:
+    python quiz_io.py import questions.csv [--rejects rejects.csv]
+    python quiz_io.py export questions.jsonl
+    :param argv: Аргументы командной строки.
+    :return: Код завершения.
+    """
+    parser = argparse.ArgumentParser(description="Импорт и экспорт вопросов викторин в CSV/JSONL.")
+    parser.add_argument('command', choices=('import', 'export'))
+    parser.add_argument('path', help="Путь к файлу или '-' для стандартного ввода/вывода.")
+    parser.add_argument('--db', default='quiz.db', help="Имя базы данных.")
+    parser.add_argument('--format', choices=FORMATS, help="Формат файла (по умолчанию - по расширению).")
+    parser.add_argument('--chunk-size', type=int, default=5000, help="Количество строк в одной транзакции.")
+    parser.add_argument('--rejects', help="Файл CSV для отклонённых строк импорта.")
+    args = parser.parse_args(argv)
+
+    try:
+        fmt = detect_format(args.path, args.format)
+    except ValueError as e:
+        parser.error(str(e))
+    pool = ConnectionPool(args.db, readers=1)
+    started = time.perf_counter()
+    try:
+        async with pool.writer() as db:
+            await migrate(db)
+        if args.command == 'export':
+            with open_text(args.path, 'w') as handle:
+                exported = await export_quizzes(pool, handle, fmt, args.chunk_size)
+            logger.info(f"Exported {exported} questions in {time.perf_counter() - started:.2f} s")
+            return 0
+
+        rejects = open_text(args.rejects, 'w') if args.rejects else None
+        try:
+            importer = QuizImporter(pool, args.chunk_size, RejectReport(rejects))
+            with open_text(args.path, 'r') as handle:
+                await importer.run(read_rows(handle, fmt))
+        finally:
+            if rejects is not None:
+                rejects.close()
+        report = importer.report
+        logger.info(f"Imported {importer.inserted} questions ({importer.created_quizzes} new quizzes) in "
+                    f"{time.perf_counter() - started:.2f} s, rejected {report.duplicates} duplicates "
+                    f"and {report.invalid} invalid rows")
+        return 0
+    except Exception as e:
+        logger.error(f"Error during quiz {args.command}: {e}")
+        return 1
+    finally:
+        await pool.close()
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,152 @@
+import json
+import asyncio
+import logging
+import sqlite3
+from metrics import DB_SECONDS, timed
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Лучший результат сохраняется средствами SQL: существующая запись перезаписывается только большим счётом
+UPSERT_SCORE_QUERY = """
+    INSERT INTO scores (user_id, username, quiz_id, score) VALUES (?, ?, ?, ?)
+    ON CONFLICT (user_id, quiz_id) DO UPDATE SET score = excluded.score, username = excluded.username
+    WHERE excluded.score > scores.score
+"""
+# Викторины пачки, которые ещё существуют: результаты удалённых викторин нарушили бы внешний ключ
+EXISTING_QUIZZES_QUERY = "SELECT id FROM quizzes WHERE id IN (SELECT value FROM json_each(?))"
+
+class ScoreWriter:
+    def __init__(self, pool, batch_size=200, flush_interval=1.0, max_failures=5):
+        """
+        Инициализация фоновой записи результатов.
+        Результаты попадают в очередь и записываются пачками в одной транзакции,
+        когда набирается batch_size записей или проходит flush_interval секунд.
+        Пачка, которую не удалось записать из-за временной ошибки (база занята или заблокирована), сохраняется
+        и записывается вместе со следующей; повтор выполняется не реже раза в flush_interval секунд.
+        Результаты удалённых викторин и пачки с постоянными ошибками отбрасываются, чтобы не блокировать
+        запись следующих результатов.
+        :param pool: Пул соединений с базой данных.
+        :param batch_size: Максимальный размер пачки.
+        :param flush_interval: Максимальное время ожидания пачки в секундах.
+        :param max_failures: Количество неудачных записей подряд, после которого пишется ошибка.
+        """
+        self.pool = pool
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_failures = max_failures
+        self.queue = asyncio.Queue()
+        self.pending = {}  # (user_id, quiz_id) -> лучший незаписанный результат
+        self.failures = 0  # Неудачные записи подряд
+        self.task = None
+
+    def start(self):
+        """
+        Запуск фоновой задачи записи.
+        """
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Остановка фоновой задачи. Все результаты, оставшиеся в очереди, записываются в базу.
+        """
+        if self.task is None:
+            return
+        self.queue.put_nowait(None)  # Сигнал завершения
+        await self.task
+        self.task = None
+
+    def submit(self, user_id, username, quiz_id, score):
+        """
+        Постановка результата в очередь на запись.
+        :param user_id: ID пользователя.
+        :param username: Имя пользователя.
+        :param quiz_id: ID викторины.
+        :param score: Результат викторины.
+        """
+        self.queue.put_nowait((user_id, username, quiz_id, score))
+
+    async def _run(self):
+        """
+        Основной цикл: сбор пачки из очереди и её запись.
+        """
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            if self.pending:
+                # Есть незаписанные результаты: повтор записи, даже если новых результатов нет
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    await self.flush([])
+                    continue
+            else:
+                item = await self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self.flush(batch)
+        # Дописываем всё, что успело попасть в очередь после сигнала завершения
+        remaining = []
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is not None:
+                remaining.append(item)
+        if remaining or self.pending:
+            await self.flush(remaining)
+        if self.pending:
+            logger.error(f"Scores lost on shutdown: {len(self.pending)}")
+
+    @timed(DB_SECONDS, 'scores.flush')
+    async def flush(self, batch):
+        """
+        Запись пачки результатов в одной транзакции вместе с ранее не записанными.
+        :param batch: Список кортежей (user_id, username, quiz_id, score).
+        """
+        # Внутри пачки оставляем только лучший результат для каждой пары (пользователь, викторина)
+        best, self.pending = self.pending, {}
+        for user_id, username, quiz_id, score in batch:
+            key = (user_id, quiz_id)
+            if key not in best or score > best[key][3]:
+                best[key] = (user_id, username, quiz_id, score)
+        try:
+            async with self.pool.writer() as db:
+                await db.execute("BEGIN")
+                cursor = await db.execute(EXISTING_QUIZZES_QUERY, (json.dumps(list({key[1] for key in best})),))
+                existing = {row[0] for row in await cursor.fetchall()}
+                rows = [row for key, row in best.items() if key[1] in existing]
+                await db.executemany(UPSERT_SCORE_QUERY, rows)
+                await db.commit()
+            if len(rows) < len(best):
+                logger.warning(f"Scores of deleted quizzes dropped: {len(best) - len(rows)}")
+            logger.info(f"Scores flushed: {len(rows)} of {len(batch)} queued")
+            self.failures = 0
+        except sqlite3.OperationalError as e:
+            # Временная ошибка (база занята): результаты возвращаются в ожидающие,
+            # новые результаты за время сбоя объединятся с ними
+            for key, row in best.items():
+                if key not in self.pending or row[3] > self.pending[key][3]:
+                    self.pending[key] = row
+            self.failures += 1
+            if self.failures >= self.max_failures:
+                logger.error(f"Error flushing scores ({self.failures} attempts, {len(self.pending)} pending): {e}")
+            else:
+                logger.warning(f"Error flushing scores, will retry: {e}")
+        except Exception as e:
+            # Повтор постоянной ошибки (например, нарушение ограничения) заблокировал бы все следующие пачки
+            logger.error(f"Error flushing scores, {len(best)} dropped: {e}")
@@ -0,0 +1,368 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+import logging
+from telebot.asyncio_helper import ApiTelegramException
+from metrics import API_SECONDS, API_REQUESTS
+from tracing import span
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих запросов: чем меньше число, тем раньше запрос уходит в Telegram
+PRIORITY_QUESTION = 0  # Вопросы викторин
+PRIORITY_NORMAL = 1  # Обычные сообщения
+PRIORITY_COSMETIC = 2  # Правки сообщений, например обратный отсчёт
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'blocked_until')
+
+    def __init__(self, rate, capacity):
+        """
+        Инициализация корзины токенов.
+        :param rate: Скорость пополнения (токенов в секунду).
+        :param capacity: Максимальное количество токенов.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def delay(self, now):
+        """
+        Время ожидания до появления свободного токена.
+        :param now: Текущее время (time.monotonic()).
+        :return: Задержка в секундах, 0 если токен доступен.
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        delay = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(delay, self.blocked_until - now)
+
+    def consume(self):
+        """
+        Списание одного токена.
+        """
+        self.tokens -= 1
+
+    def block(self, now, seconds):
+        """
+        Блокировка корзины на заданное время (ответ 429 с retry_after).
+        :param now: Текущее время (time.monotonic()).
+        :param seconds: Длительность блокировки в секундах.
+        """
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0
+
+class ChatQueue:
+    __slots__ = ('bucket', 'jobs', 'scheduled', 'in_flight')
+
+    def __init__(self, bucket):
+        """
+        Инициализация очереди исходящих запросов одного чата.
+        :param bucket: Корзина токенов чата.
+        """
+        self.bucket = bucket
+        self.jobs = []  # Куча (приоритет, порядковый номер, задание)
+        self.scheduled = False  # Чат уже стоит в очереди планировщика
+        self.in_flight = False  # Запрос этого чата сейчас выполняется
+
+class SendScheduler:
+    def __init__(self, bot, global_rate=30, chat_rate=1, chat_burst=3, max_retries=5, global_limit_chats=3, global_limit_window=1.0):
+        """
+        Инициализация планировщика исходящих сообщений.
+        Планировщик оборачивает экземпляр AsyncTeleBot: send_message и edit_message_text проходят через
+        общую корзину токенов и корзины отдельных чатов, остальные атрибуты берутся у бота напрямую.
+        Ответ 429 блокирует корзину своего чата. Если за global_limit_window секунд 429 получили
+        global_limit_chats разных чатов, превышен общий лимит бота, и на retry_after блокируется общая корзина.
+        Блокировать общую корзину на каждый 429 нельзя: один чат, превысивший свой лимит, остановил бы все.
+        :param bot: Экземпляр бота.
+        :param global_rate: Ограничение на все исходящие запросы (в секунду).
+        :param chat_rate: Ограничение на запросы в один чат (в секунду).
+        :param chat_burst: Допустимое количество запросов в один чат подряд.
+        :param max_retries: Количество повторов после ответа 429.
+        :param global_limit_chats: Количество чатов с 429, после которого блокируется общая корзина.
+        :param global_limit_window: Окно подсчёта чатов с 429 в секундах.
+        """
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.global_limit_chats = global_limit_chats
+        self.global_limit_window = global_limit_window
+        self.rate_limited = deque()  # Пары (время, chat_id) недавних ответов 429
+        self.tasks = set()  # Выполняющиеся запросы к Telegram
+        self.stopped = False
+        self.chats = {}  # chat_id -> ChatQueue
+        self.waiting = []  # Куча (время готовности, порядковый номер, chat_id)
+        self.ready = []  # Куча (приоритет, порядковый номер, chat_id)
+        self.counter = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.pruned_at = time.monotonic()
+        self.queued = 0
+        self.in_flight = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    def __getattr__(self, name):
+        """
+        Доступ к остальным методам бота (регистрация обработчиков, get_chat, polling и т.д.).
+        :param name: Имя атрибута.
+        :return: Атрибут бота.
+        """
+        return getattr(self.bot, name)
+
+    def start(self):
+        """
+        Запуск цикла отправки.
+        """
+        self.stopped = False
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Остановка цикла отправки. Ожидающие и выполняющиеся запросы завершаются с ошибкой,
+        новые запросы после остановки не принимаются.
+        """
+        self.stopped = True
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for chat in self.chats.values():
+            for _, _, job in chat.jobs:
+                if not job[3].done():
+                    job[3].set_exception(RuntimeError("Send scheduler stopped"))
+        self.chats = {}
+        self.waiting = []
+        self.ready = []
+        self.queued = 0
+
+    async def send_message(self, chat_id, text, priority=PRIORITY_NORMAL, **kwargs):
+        """
+        Отправка сообщения через планировщик.
+        :param chat_id: ID чата.
+        :param text: Текст сообщения.
+        :param priority: Приоритет запроса.
+        :return: Отправленное сообщение.
+        """
+        return await self._submit(chat_id, priority, self.bot.send_message, (chat_id, text), kwargs)
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, priority=PRIORITY_COSMETIC, **kwargs):
+        """
+        Изменение текста сообщения через планировщик.
+        :param text: Новый текст сообщения.
+        :param chat_id: ID чата.
+        :param message_id: ID сообщения.
+        :param priority: Приоритет запроса.
+        :return: Изменённое сообщение.
+        """
+        kwargs.update(chat_id=chat_id, message_id=message_id)
+        return await self._submit(chat_id, priority, self.bot.edit_message_text, (text,), kwargs)
+
+    def stats(self):
+        """
+        Статистика планировщика.
+        :return: Словарь с глубиной очереди и счётчиками запросов.
+        """
+        by_priority = {PRIORITY_QUESTION: 0, PRIORITY_NORMAL: 0, PRIORITY_COSMETIC: 0}
+        for chat in self.chats.values():
+            for priority, _, _ in chat.jobs:
+                by_priority[priority] = by_priority.get(priority, 0) + 1
+        return {
+            'queued': self.queued,
+            'queued_by_priority': by_priority,
+            'chats': sum(1 for chat in self.chats.values() if chat.jobs),
+            'in_flight': self.in_flight,
+            'sent': self.sent,
+            'retried': self.retried,
+            'failed': self.failed,
+        }
+
+    async def _submit(self, chat_id, priority, method, args, kwargs):
+        """
+        Постановка запроса в очередь чата и ожидание результата.
+        :param chat_id: ID чата.
+        :param priority: Приоритет запроса.
+        :param method: Метод бота.
+        :param args: Позиционные аргументы метода.
+        :param kwargs: Именованные аргументы метода.
+        :return: Результат метода бота.
+        """
+        if self.stopped:
+            raise RuntimeError("Send scheduler stopped")
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        job = [method, args, kwargs, future, 0]  # Последний элемент - номер попытки
+        self._enqueue(chat_id, priority, next(self.counter), job)
+        # Участок трассировки включает ожидание в очереди планировщика
+        with span(f"bot.{method.__name__}"):
+            return await future
+
+    def _enqueue(self, chat_id, priority, seq, job):
+        """
+        Добавление задания в очередь чата.
+        :param chat_id: ID чата.
+        :param priority: Приоритет запроса.
+        :param seq: Порядковый номер (сохраняет порядок внутри одного приоритета).
+        :param job: Задание.
+        """
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            chat = self.chats[chat_id] = ChatQueue(TokenBucket(self.chat_rate, self.chat_burst))
+        heapq.heappush(chat.jobs, (priority, seq, job))
+        self.queued += 1
+        self._schedule(chat_id, chat)
+        self.wakeup.set()
+
+    def _schedule(self, chat_id, chat):
+        """
+        Постановка чата в очередь планировщика, если у него есть задания и нет выполняющегося запроса.
+        :param chat_id: ID чата.
+        :param chat: Очередь чата.
+        """
+        if chat.scheduled or chat.in_flight or not chat.jobs:
+            return
+        now = time.monotonic()
+        heapq.heappush(self.waiting, (now + chat.bucket.delay(now), next(self.counter), chat_id))
+        chat.scheduled = True
+
+    async def _run(self):
+        """
+        Основной цикл: выбор самого приоритетного запроса среди чатов, для которых не превышен лимит.
+        """
+        while True:
+            now = time.monotonic()
+            while self.waiting and self.waiting[0][0] <= now:
+                _, _, chat_id = heapq.heappop(self.waiting)
+                chat = self.chats[chat_id]
+                priority, seq, _ = chat.jobs[0]
+                heapq.heappush(self.ready, (priority, seq, chat_id))
+
+            if not self.ready:
+                if now - self.pruned_at > 10:
+                    self._prune(now)
+                timeout = self.waiting[0][0] - now if self.waiting else None
+                await self._sleep(timeout)
+                continue
+
+            global_delay = self.global_bucket.delay(now)
+            if global_delay > 0:
+                await asyncio.sleep(global_delay)
+                continue
+
+            _, _, chat_id = heapq.heappop(self.ready)
+            chat = self.chats[chat_id]
+            priority, seq, job = heapq.heappop(chat.jobs)
+            self.queued -= 1
+            chat.scheduled = False
+            chat.in_flight = True
+            chat.bucket.consume()
+            self.global_bucket.consume()
+            self.in_flight += 1
+            task = asyncio.create_task(self._execute(chat_id, chat, priority, seq, job))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    def _prune(self, now):
+        """
+        Удаление простаивающих чатов, корзины которых полностью восстановились.
+        :param now: Текущее время (time.monotonic()).
+        """
+        self.pruned_at = now
+        for chat_id in [chat_id for chat_id, chat in self.chats.items()
+                        if not chat.jobs and not chat.in_flight and chat.bucket.delay(now) == 0
+                        and chat.bucket.tokens >= chat.bucket.capacity]:
+            del self.chats[chat_id]
+
+    async def _sleep(self, timeout):
+        """
+        Ожидание нового задания или истечения таймаута.
+        :param timeout: Таймаут в секундах или None.
+        """
+        self.wakeup.clear()
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _execute(self, chat_id, chat, priority, seq, job):
+        """
+        Выполнение запроса к Telegram с учётом retry_after.
+        :param chat_id: ID чата.
+        :param chat: Очередь чата.
+        :param priority: Приоритет запроса.
+        :param seq: Порядковый номер запроса.
+        :param job: Задание.
+        """
+        method, args, kwargs, future, attempt = job
+        name = method.__name__
+        started = time.perf_counter()
+        try:
+            result = await method(*args, **kwargs)
+            API_SECONDS.observe(time.perf_counter() - started, name)
+            API_REQUESTS.inc(name, 'ok')
+            self.sent += 1
+            if not future.done():
+                future.set_result(result)
+        except ApiTelegramException as e:
+            API_SECONDS.observe(time.perf_counter() - started, name)
+            API_REQUESTS.inc(name, 'rate_limited' if e.error_code == 429 else 'error')
+            if e.error_code == 429 and attempt < self.max_retries:
+                retry_after = e.result_json.get('parameters', {}).get('retry_after', 1)
+                logger.warning(f"Rate limited in chat {chat_id}, retry after {retry_after}s")
+                now = time.monotonic()
+                chat.bucket.block(now, retry_after)
+                if self._global_limit_hit(now, chat_id):
+                    logger.warning(f"Global rate limit hit, pausing all chats for {retry_after}s")
+                    self.global_bucket.block(now, retry_after)
+                job[4] = attempt + 1
+                self.retried += 1
+                heapq.heappush(chat.jobs, (priority, seq, job))  # Возвращаем запрос на его место в очереди
+                self.queued += 1
+            else:
+                self.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+        except asyncio.CancelledError:
+            if not future.done():
+                future.set_exception(RuntimeError("Send scheduler stopped"))
+            raise
+        except Exception as e:
+            API_SECONDS.observe(time.perf_counter() - started, name)
+            API_REQUESTS.inc(name, 'error')
+            self.failed += 1
+            if not future.done():
+                future.set_exception(e)
+        finally:
+            self.in_flight -= 1
+            chat.in_flight = False
+            self._schedule(chat_id, chat)
+            self.wakeup.set()
+
+    def _global_limit_hit(self, now, chat_id):
+        """
+        Учёт ответа 429 и проверка, что его получили сразу несколько чатов.
+        :param now: Текущее время (time.monotonic()).
+        :param chat_id: ID чата, получившего 429.
+        :return: True, если за окно global_limit_window 429 получили global_limit_chats разных чатов.
+        """
+        self.rate_limited.append((now, chat_id))
+        while self.rate_limited[0][0] < now - self.global_limit_window:
+            self.rate_limited.popleft()
+        return len({limited_chat for _, limited_chat in self.rate_limited}) >= self.global_limit_chats
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+from metrics import SESSIONS_EVICTED
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class SessionReaper:
+    def __init__(self, sessions, idle_ttl=1800, max_sessions=10000, interval=60, batch_size=100):
+        """
+        Инициализация очистки брошенных игровых сессий.
+        Раз в interval секунд завершаются сессии, не изменявшиеся дольше idle_ttl. Кроме того, перед
+        созданием новой сессии число живых сессий ограничивается max_sessions: при переполнении
+        вытесняются давно не изменявшиеся сессии (LRU).
+        Завершение сессии выполняет обработчик, зарегистрированный для префикса её ключа.
+        :param sessions: Хранилище сессий.
+        :param idle_ttl: Время бездействия сессии в секундах.
+        :param max_sessions: Максимальное количество живых сессий.
+        :param interval: Период проверки в секундах.
+        :param batch_size: Максимальное количество сессий, завершаемых за один шаг.
+        """
+        self.sessions = sessions
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.interval = interval
+        self.batch_size = batch_size
+        self.handlers = {}  # Префикс ключа -> обработчик handler(key, session, reason)
+        self.task = None
+        self.live_sessions = 0  # Количество живых сессий на момент последней проверки
+        self.memory_bytes = 0  # Оценка памяти, занятой сессиями, на момент последней проверки
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+
+    def add(self, prefix, handler):
+        """
+        Регистрация обработчика завершения сессий.
+        :param prefix: Префикс ключа сессии, например "game:".
+        :param handler: Асинхронный обработчик handler(key, session, reason), который должен удалить сессию;
+            reason - причина: idle (бездействие) или lru (переполнение).
+        """
+        self.handlers[prefix] = handler
+
+    def start(self):
+        """
+        Запуск фоновой проверки.
+        """
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Остановка фоновой проверки.
+        """
+        if self.task is None:
+            return
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        self.task = None
+
+    async def _run(self):
+        """
+        Основной цикл: периодическое завершение неактивных сессий и обновление показателей.
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reap()
+            except Exception as e:
+                logger.error(f"Error reaping sessions: {e}")
+
+    async def reap(self):
+        """
+        Завершение сессий, неактивных дольше idle_ttl, и обновление показателей.
+        """
+        seen = set()  # Сессии, которые обработчик оставил живыми, повторно не проверяются
+        keys = await self.sessions.idle(self.idle_ttl, self.batch_size)
+        while keys and not seen.issuperset(keys):
+            for key in keys:
+                if key not in seen:
+                    seen.add(key)
+                    if await self.evict(key, 'idle'):
+                        self.evicted_idle += 1
+                        SESSIONS_EVICTED.inc('idle')
+            if len(keys) < self.batch_size:
+                break
+            keys = await self.sessions.idle(self.idle_ttl, self.batch_size)
+        await self.make_room(0)
+        await self.update_gauges()
+
+    async def make_room(self, needed=1):
+        """
+        Вытеснение давно не изменявшихся сессий, чтобы после создания needed новых сессий
+        их количество не превысило max_sessions. Вытеснение продолжается, пока лимит не соблюдён
+        или сессий перестало становиться меньше.
+        :param needed: Количество создаваемых сессий.
+        """
+        excess = await self.sessions.count() + needed - self.max_sessions
+        while excess > 0:
+            previous = excess
+            for key in await self.sessions.oldest(min(excess, self.batch_size)):
+                if await self.evict(key, 'lru'):
+                    self.evicted_lru += 1
+                    SESSIONS_EVICTED.inc('lru')
+                    # Завершение матча освобождает сразу несколько сессий
+                    excess = await self.sessions.count() + needed - self.max_sessions
+                    if excess <= 0:
+                        return
+            excess = await self.sessions.count() + needed - self.max_sessions
+            if excess >= previous:
+                break
+
+    async def evict(self, key, reason):
+        """
+        Завершение сессии обработчиком её префикса.
+        :param key: Ключ сессии.
+        :param reason: Причина: idle или lru.
+        :return: True, если сессия была завершена.
+        """
+        session = await self.sessions.get(key)
+        if session is None:
+            return False
+        for prefix, handler in self.handlers.items():
+            if key.startswith(prefix):
+                try:
+                    return await handler(key, session, reason)
+                except Exception as e:
+                    logger.error(f"Error evicting session {key}: {e}")
+                    break
+        # Сессия неизвестного вида или ошибка обработчика: сессия удаляется, чтобы не занимать память
+        await self.sessions.delete(key)
+        return True
+
+    async def update_gauges(self):
+        """
+        Обновление показателей количества живых сессий и занятой ими памяти.
+        """
+        self.live_sessions = await self.sessions.count()
+        self.memory_bytes = await self.sessions.memory_usage()
+
+    def stats(self):
+        """
+        Показатели хранилища сессий.
+        :return: Словарь с количеством живых сессий, оценкой памяти и количеством вытесненных сессий.
+        """
+        return {
+            'live_sessions': self.live_sessions,
+            'memory_bytes': self.memory_bytes,
+            'evicted_idle': self.evicted_idle,
+            'evicted_lru': self.evicted_lru,
+        }
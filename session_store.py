@@ -0,0 +1,574 @@
+import os
+import abc
+import sys
+import gzip
+import json
+import time
+import asyncio
+import logging
+import itertools
+from collections import OrderedDict
+from connection_pool import ConnectionPool
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def merge_patch(target, patch):
+    """
+    Применение изменений к сессии по правилам JSON Merge Patch (RFC 7396):
+    вложенные словари объединяются, значение None удаляет ключ.
+    Исходный словарь не изменяется.
+    :param target: Исходный словарь.
+    :param patch: Изменения.
+    :return: Новый словарь.
+    """
+    result = dict(target)
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        elif isinstance(value, dict) and isinstance(result.get(key), dict):
+            result[key] = merge_patch(result[key], value)
+        else:
+            result[key] = value
+    return result
+
+# Файл снимка сессий и шаблон имени журнала изменений в каталоге SnapshotSessionStore
+SNAPSHOT_FILE = 'snapshot.jsonl.gz'
+DELTA_LOG_PREFIX = 'delta-'
+DELTA_LOG_SUFFIX = '.log'
+
+# Размер кортежа (вопрос, ответ) без учёта строк
+PAIR_SIZE = sys.getsizeof((None, None))
+
+def estimate_size(value):
+    """
+    Приблизительный размер значения в памяти с учётом вложенных словарей, списков и строк.
+    :param value: Значение.
+    :return: Размер в байтах.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        items = itertools.chain.from_iterable(value.items())
+    elif isinstance(value, (list, tuple)):
+        items = value
+    else:
+        return size
+    for item in items:
+        # Строки - самый частый случай (вопросы и ответы), их размер считается без рекурсии
+        size += sys.getsizeof(item) if isinstance(item, str) else estimate_size(item)
+    return size
+
+def session_size(session):
+    """
+    Приблизительный размер сессии в памяти. Имена полей общие для всех сессий и не учитываются,
+    а список вопросов - основная часть сессии - считается без рекурсии.
+    :param session: Сессия.
+    :return: Размер в байтах.
+    """
+    size = sys.getsizeof(session)
+    for name, value in session.items():
+        if name == 'questions':
+            size += sys.getsizeof(value) + len(value) * PAIR_SIZE
+            size += sum(sys.getsizeof(question) + sys.getsizeof(answer) for question, answer in value)
+        elif isinstance(value, (dict, list, tuple)):
+            size += estimate_size(value)
+        else:
+            size += sys.getsizeof(value)
+    return size
+
+class SessionStore(abc.ABC):
+    """
+    Хранилище игровых сессий.
+    Сессия - словарь с обязательными полями 'question' (номер вопроса) и 'score' (счёт) и произвольными
+    данными, которые должны сериализоваться в JSON. Возвращаемые сессии нельзя изменять напрямую:
+    все изменения выполняются через put и compare_and_set.
+    Хранилище, в котором не реализован хотя бы один абстрактный метод, нельзя создать.
+    """
+
+    async def open(self):
+        """
+        Подготовка хранилища к работе.
+        """
+
+    async def close(self):
+        """
+        Завершение работы с хранилищем.
+        """
+
+    @abc.abstractmethod
+    async def get(self, key):
+        """
+        Получение сессии.
+        :param key: Ключ сессии.
+        :return: Сессия или None.
+        """
+
+    @abc.abstractmethod
+    async def put(self, key, session):
+        """
+        Создание или замена сессии.
+        :param key: Ключ сессии.
+        :param session: Сессия.
+        """
+
+    @abc.abstractmethod
+    async def delete(self, key):
+        """
+        Удаление сессии.
+        :param key: Ключ сессии.
+        """
+
+    @abc.abstractmethod
+    async def compare_and_set(self, key, expected_question, new_question, score_delta=0, updates=None):
+        """
+        Атомарное изменение сессии, если её номер вопроса равен ожидаемому.
+        :param key: Ключ сессии.
+        :param expected_question: Ожидаемый номер вопроса.
+        :param new_question: Новый номер вопроса.
+        :param score_delta: Изменение счёта.
+        :param updates: Изменения остальных данных в формате JSON Merge Patch.
+        :return: Обновлённая сессия или None, если сессии нет или номер вопроса уже другой.
+        """
+
+    @abc.abstractmethod
+    async def keys(self, prefix):
+        """
+        Получение ключей сессий с заданным префиксом.
+        :param prefix: Префикс ключа.
+        :return: Список ключей.
+        """
+
+    @abc.abstractmethod
+    async def idle(self, idle_ttl, limit):
+        """
+        Получение сессий, которые не изменялись дольше idle_ttl, начиная с самых старых.
+        :param idle_ttl: Время бездействия в секундах.
+        :param limit: Максимальное количество ключей.
+        :return: Список ключей.
+        """
+
+    @abc.abstractmethod
+    async def oldest(self, count):
+        """
+        Получение давно не изменявшихся сессий для вытеснения по LRU.
+        :param count: Количество ключей.
+        :return: Список ключей.
+        """
+
+    @abc.abstractmethod
+    async def count(self):
+        """
+        Количество сессий.
+        :return: Количество сессий.
+        """
+
+    @abc.abstractmethod
+    async def memory_usage(self):
+        """
+        Оценка объёма памяти, занятого сессиями.
+        :return: Размер в байтах.
+        """
+
+class MemorySessionStore(SessionStore):
+    def __init__(self):
+        """
+        Инициализация хранилища сессий в памяти процесса.
+        Изменённая сессия всегда заменяется новым словарём, поэтому ранее полученные сессии не меняются.
+        Сессии упорядочены по времени последнего изменения, поэтому поиск неактивных сессий
+        просматривает только самые старые.
+        """
+        self.sessions = OrderedDict()  # Ключ -> сессия, от давно изменённых к недавним
+        self.touched = {}  # Ключ -> время последнего изменения (time.monotonic())
+        self.sizes = {}  # Ключ -> оценка размера сессии на момент создания
+        self.total_size = 0
+
+    def _touch(self, key, session):
+        """
+        Сохранение изменённой сессии с переносом в конец порядка LRU.
+        :param key: Ключ сессии.
+        :param session: Сессия.
+        """
+        self.sessions[key] = session
+        self.sessions.move_to_end(key)
+        self.touched[key] = time.monotonic()
+
+    async def get(self, key):
+        return self.sessions.get(key)
+
+    def _put(self, key, session):
+        """
+        Создание или замена сессии.
+        :param key: Ключ сессии.
+        :param session: Сессия.
+        :return: Сохранённая сессия.
+        """
+        session = dict(session, question=session.get('question', 0), score=session.get('score', 0))
+        self._touch(key, session)
+        # Размер оценивается один раз: последующие изменения затрагивают только номер вопроса, счёт и флаги
+        size = session_size(session)
+        self.total_size += size - self.sizes.get(key, 0)
+        self.sizes[key] = size
+        return session
+
+    def _delete(self, key):
+        """
+        Удаление сессии.
+        :param key: Ключ сессии.
+        :return: True, если сессия была.
+        """
+        if self.sessions.pop(key, None) is None:
+            return False
+        del self.touched[key]
+        self.total_size -= self.sizes.pop(key)
+        return True
+
+    def _apply(self, key, session, new_question, score_delta, updates):
+        """
+        Применение изменения к сессии без проверки номера вопроса.
+        :param key: Ключ сессии.
+        :param session: Текущая сессия.
+        :param new_question: Новый номер вопроса.
+        :param score_delta: Изменение счёта.
+        :param updates: Изменения остальных данных.
+        :return: Обновлённая сессия.
+        """
+        session = merge_patch(session, updates) if updates else dict(session)
+        session['question'] = new_question
+        session['score'] += score_delta
+        self._touch(key, session)
+        return session
+
+    async def put(self, key, session):
+        self._put(key, session)
+
+    async def delete(self, key):
+        self._delete(key)
+
+    async def compare_and_set(self, key, expected_question, new_question, score_delta=0, updates=None):
+        session = self.sessions.get(key)
+        if session is None or session['question'] != expected_question:
+            return None
+        return self._apply(key, session, new_question, score_delta, updates)
+
+    async def keys(self, prefix):
+        return [key for key in self.sessions if key.startswith(prefix)]
+
+    async def idle(self, idle_ttl, limit):
+        deadline = time.monotonic() - idle_ttl
+        keys = []
+        for key in self.sessions:
+            if len(keys) >= limit or self.touched[key] > deadline:
+                break
+            keys.append(key)
+        return keys
+
+    async def oldest(self, count):
+        return list(itertools.islice(self.sessions, count))
+
+    async def count(self):
+        return len(self.sessions)
+
+    async def memory_usage(self):
+        return self.total_size
+
+class SnapshotSessionStore(MemorySessionStore):
+    def __init__(self, directory, interval=60):
+        """
+        Инициализация хранилища сессий в памяти процесса с сохранением на диск.
+        Каждое изменение дописывается одной строкой в журнал изменений текущего поколения, а раз в interval
+        секунд и при остановке все сессии записываются в сжатый снимок, после чего журналы предыдущих
+        поколений удаляются. При запуске состояние восстанавливается из снимка и журналов.
+        Журнал пишется с построчной буферизацией, поэтому переживает падение процесса (но не сервера).
+        :param directory: Каталог для снимка и журналов.
+        :param interval: Период записи снимка в секундах.
+        """
+        super().__init__()
+        self.directory = directory
+        self.interval = interval
+        self.generation = 0
+        self.log = None
+        self.task = None
+
+    async def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        started = time.perf_counter()
+        self.restore()
+        self._switch_log()
+        logger.info(f"Restored {len(self.sessions)} sessions in {(time.perf_counter() - started) * 1000:.1f} ms")
+        self.task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self.log is None:
+            return  # Хранилище не было открыто: существующий снимок не перезаписывается
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.snapshot()
+        self.log.close()
+        self.log = None
+
+    async def put(self, key, session):
+        session = self._put(key, session)
+        self._append(['p', key, session])
+
+    async def delete(self, key):
+        if self._delete(key):
+            self._append(['d', key])
+
+    async def compare_and_set(self, key, expected_question, new_question, score_delta=0, updates=None):
+        session = await super().compare_and_set(key, expected_question, new_question, score_delta, updates)
+        if session is not None:
+            self._append(['c', key, new_question, score_delta, updates])
+        return session
+
+    def _append(self, record):
+        """
+        Запись изменения в журнал.
+        :param record: Изменение: ['p', ключ, сессия], ['d', ключ] или ['c', ключ, номер вопроса, изменение счёта, изменения].
+        """
+        self.log.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    def _log_path(self, generation):
+        """
+        Путь к журналу изменений поколения.
+        :param generation: Номер поколения.
+        :return: Путь.
+        """
+        return os.path.join(self.directory, f"{DELTA_LOG_PREFIX}{generation:08d}{DELTA_LOG_SUFFIX}")
+
+    def _log_generations(self):
+        """
+        Номера поколений журналов, имеющихся в каталоге.
+        :return: Отсортированный список номеров.
+        """
+        generations = []
+        for name in os.listdir(self.directory):
+            if name.startswith(DELTA_LOG_PREFIX) and name.endswith(DELTA_LOG_SUFFIX):
+                number = name[len(DELTA_LOG_PREFIX):-len(DELTA_LOG_SUFFIX)]
+                if number.isdigit():
+                    generations.append(int(number))
+        return sorted(generations)
+
+    def _switch_log(self):
+        """
+        Переход к журналу нового поколения.
+        """
+        if self.log is not None:
+            self.log.close()
+        self.generation += 1
+        self.log = open(self._log_path(self.generation), 'a', encoding='utf-8', buffering=1)
+
+    def restore(self):
+        """
+        Восстановление сессий из снимка и журналов изменений.
+        Снимок поколения N содержит состояние на момент начала журнала N, поэтому после него
+        применяются журналы N, N+1 и т.д. Оборванная последняя строка журнала пропускается.
+        Одинаковые вопросы восстановленных сессий разделяют один кортеж (вопрос, ответ).
+        """
+        generation = 0
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if os.path.exists(path):
+            with gzip.open(path, 'rt', encoding='utf-8') as snapshot:
+                header = json.loads(snapshot.readline())
+                generation = header['generation']
+                pairs = [tuple(pair) for pair in header['questions']]
+                for line in snapshot:
+                    key, session = json.loads(line)
+                    if 'questions' in session:
+                        session['questions'] = [pairs[index] for index in session['questions']]
+                    self._put(key, session)
+        self.generation = generation
+        for log_generation in self._log_generations():
+            if log_generation < generation:
+                continue
+            with open(self._log_path(log_generation), encoding='utf-8') as log:
+                for line in log:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        logger.warning(f"Skipping damaged session log record in generation {log_generation}")
+                        continue
+                    self._replay(record)
+            self.generation = log_generation
+
+    def _replay(self, record):
+        """
+        Применение изменения из журнала.
+        :param record: Изменение.
+        """
+        if record[0] == 'p':
+            self._put(record[1], record[2])
+        elif record[0] == 'd':
+            self._delete(record[1])
+        elif record[0] == 'c':
+            _, key, new_question, score_delta, updates = record
+            session = self.sessions.get(key)
+            if session is not None:
+                self._apply(key, session, new_question, score_delta, updates)
+
+    async def snapshot(self):
+        """
+        Запись снимка всех сессий. Сессии не изменяются на месте, поэтому копия словаря - согласованный
+        срез состояния, и запись выполняется в отдельном потоке, не останавливая обработку обновлений.
+        """
+        sessions = list(self.sessions.items())
+        self._switch_log()
+        generation = self.generation
+        await asyncio.to_thread(self._write_snapshot, generation, sessions)
+        for log_generation in self._log_generations():
+            if log_generation < generation:
+                os.remove(self._log_path(log_generation))
+
+    def _write_snapshot(self, generation, sessions):
+        """
+        Запись снимка во временный файл и атомарная замена им предыдущего снимка.
+        Первая строка снимка - заголовок с номером поколения и таблицей вопросов, далее по строке на сессию.
+        :param generation: Номер поколения снимка.
+        :param sessions: Список пар (ключ, сессия).
+        """
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        temporary = f"{path}.{generation}.tmp"
+        # Вопросы записываются один раз в заголовок, а сессии ссылаются на них по номеру
+        pairs = {}
+        lines = []
+        for key, session in sessions:
+            if 'questions' in session:
+                session = dict(session, questions=[pairs.setdefault(tuple(pair), len(pairs)) for pair in session['questions']])
+            lines.append(json.dumps([key, session], ensure_ascii=False, separators=(',', ':')))
+        header = {'generation': generation, 'questions': list(pairs)}
+        with open(temporary, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=1) as snapshot:
+                snapshot.write((json.dumps(header, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8'))
+                snapshot.write(('\n'.join(lines) + '\n').encode('utf-8') if lines else b'')
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(temporary, path)
+
+    async def _run(self):
+        """
+        Основной цикл: периодическая запись снимка.
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.snapshot()
+            except Exception as e:
+                logger.error(f"Error writing session snapshot: {e}")
+
+class SQLiteSessionStore(SessionStore):
+    def __init__(self, db_name):
+        """
+        Инициализация хранилища сессий в отдельной базе SQLite в режиме WAL.
+        Хранилище может использоваться одновременно несколькими процессами бота на одном сервере:
+        compare_and_set выполняется одним оператором UPDATE ... WHERE question = ?.
+        :param db_name: Имя файла базы сессий.
+        """
+        self.pool = ConnectionPool(db_name, readers=2)
+
+    async def open(self):
+        await self.pool.open()
+        async with self.pool.writer() as db:
+            await db.execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                key TEXT PRIMARY KEY,
+                question INTEGER NOT NULL,
+                score INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            ''')
+            await db.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at)")
+            await db.commit()
+
+    async def close(self):
+        await self.pool.close()
+
+    @staticmethod
+    def _load(row):
+        """
+        Преобразование строки таблицы в сессию.
+        :param row: Кортеж (question, score, data).
+        :return: Сессия.
+        """
+        question, score, data = row
+        session = json.loads(data)
+        session['question'] = question
+        session['score'] = score
+        return session
+
+    async def get(self, key):
+        async with self.pool.reader() as db:
+            cursor = await db.execute("SELECT question, score, data FROM sessions WHERE key = ?", (key,))
+            row = await cursor.fetchone()
+        return self._load(row) if row else None
+
+    async def put(self, key, session):
+        data = {name: value for name, value in session.items() if name not in ('question', 'score')}
+        async with self.pool.writer() as db:
+            await db.execute(
+                "INSERT OR REPLACE INTO sessions (key, question, score, data, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (key, session.get('question', 0), session.get('score', 0), json.dumps(data, ensure_ascii=False), time.time()))
+            await db.commit()
+
+    async def delete(self, key):
+        async with self.pool.writer() as db:
+            await db.execute("DELETE FROM sessions WHERE key = ?", (key,))
+            await db.commit()
+
+    async def compare_and_set(self, key, expected_question, new_question, score_delta=0, updates=None):
+        async with self.pool.writer() as db:
+            cursor = await db.execute('''
+                UPDATE sessions
+                SET question = ?, score = score + ?, data = json_patch(data, ?), updated_at = ?
+                WHERE key = ? AND question = ?
+                RETURNING question, score, data
+            ''', (new_question, score_delta, json.dumps(updates or {}, ensure_ascii=False), time.time(), key, expected_question))
+            row = await cursor.fetchone()
+            await db.commit()
+        return self._load(row) if row else None
+
+    async def keys(self, prefix):
+        async with self.pool.reader() as db:
+            cursor = await db.execute("SELECT key FROM sessions WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+            return [row[0] for row in await cursor.fetchall()]
+
+    async def idle(self, idle_ttl, limit):
+        async with self.pool.reader() as db:
+            cursor = await db.execute(
+                "SELECT key FROM sessions WHERE updated_at < ? ORDER BY updated_at LIMIT ?",
+                (time.time() - idle_ttl, limit))
+            return [row[0] for row in await cursor.fetchall()]
+
+    async def oldest(self, count):
+        async with self.pool.reader() as db:
+            cursor = await db.execute("SELECT key FROM sessions ORDER BY updated_at LIMIT ?", (count,))
+            return [row[0] for row in await cursor.fetchall()]
+
+    async def count(self):
+        async with self.pool.reader() as db:
+            cursor = await db.execute("SELECT COUNT(*) FROM sessions")
+            return (await cursor.fetchone())[0]
+
+    async def memory_usage(self):
+        async with self.pool.reader() as db:
+            cursor = await db.execute("SELECT COALESCE(SUM(LENGTH(key) + LENGTH(data)), 0) FROM sessions")
+            return (await cursor.fetchone())[0]
+
+def create_session_store(backend, db_name='sessions.db', snapshot_dir='sessions', snapshot_interval=60):
+    """
+    Создание хранилища сессий по названию.
+    :param backend: 'memory', 'snapshot' или 'sqlite'.
+    :param db_name: Имя файла базы сессий для 'sqlite'.
+    :param snapshot_dir: Каталог снимков для 'snapshot'.
+    :param snapshot_interval: Период записи снимка в секундах для 'snapshot'.
+    :return: Хранилище сессий.
+    """
+    if backend == 'memory':
+        return MemorySessionStore()
+    if backend == 'snapshot':
+        return SnapshotSessionStore(snapshot_dir, snapshot_interval)
+    if backend == 'sqlite':
+        return SQLiteSessionStore(db_name)
+    raise ValueError(f"Unknown session store: {backend}")
@@ -0,0 +1,58 @@
+import pytest
+from answer_matcher import normalize_answer, allowed_typos, within_distance, compile_answer, CompiledAnswer
+
+
+def test_normalization():
+    assert normalize_answer("  Рейкьявик! ") == "рейкьявик"
+    assert normalize_answer("Ёж") == "еж"
+    assert normalize_answer("Синий   кит.") == "синий кит"
+
+
+@pytest.mark.parametrize("text, typos", [
+    ("кит", 0),
+    ("клён", 0),
+    ("париж", 1),
+    ("мадагаскар", 2),
+    ("1945", 0),
+    ("1234567", 0),
+    ("апполон 11", 0),
+])
+def test_allowed_typos(text, typos):
+    assert allowed_typos(normalize_answer(text)) == typos
+
+
+@pytest.mark.parametrize("first, second, limit, expected", [
+    ("париж", "париж", 0, True),
+    ("париж", "парижж", 1, True),
+    ("париж", "пориш", 1, False),
+    ("мадагаскар", "мадогаскор", 2, True),
+    ("мадагаскар", "модогоскор", 2, False),
+    ("абв", "абвгде", 2, False),
+    ("", "аб", 2, True),
+])
+def test_within_distance(first, second, limit, expected):
+    assert within_distance(first, second, limit) is expected
+
+
+def test_matches_with_aliases_and_typos():
+    answer = compile_answer("Кит|Синий кит")
+    assert answer.matches("синий КИТ")
+    assert answer.matches("Кит!")
+    assert not answer.matches("Кот")  # Короткие ответы без опечаток
+    assert compile_answer("Рейкьявик").matches("рейкявик ")
+    assert not compile_answer("Рейкьявик").matches("рейкявек ик")
+
+
+def test_numeric_answers_do_not_accept_typos():
+    assert compile_answer("1945").matches(" 1945. ")
+    assert not compile_answer("1945").matches("1946")
+    assert not compile_answer("1234567").matches("1234568")
+    assert not compile_answer("Аполлон 11").matches("Аполлон 12")
+
+
+def test_compiled_answer_is_cached_and_behaves_like_string():
+    answer = compile_answer("Париж")
+    assert isinstance(answer, CompiledAnswer)
+    assert answer == "Париж"
+    assert compile_answer("Париж") is answer
+    assert compile_answer(answer) is answer
@@ -0,0 +1,33 @@
+import pytest
+from callback_router import encode_callback, decode_callback
+
+
+@pytest.mark.parametrize("data, expected", [
+    ("single", ("single", ())),
+    ("pvp", ("pvp", ())),
+    ("leave_queue", ("leave_queue", ())),
+    ("delete_quiz", ("delete_quiz", ())),
+    ("quiz_12", ("quiz", (12,))),
+    ("replay_7", ("replay", (7,))),
+    ("select_quiz_3", ("select_quiz", (3,))),
+    ("delete_quiz_5", ("delete_quiz_id", (5,))),
+])
+def test_legacy_callback_data_is_decoded(data, expected):
+    assert decode_callback(data) == expected
+
+
+@pytest.mark.parametrize("data", ["", "quiz_", "quiz_abc", "unknown", "unknown_1", "1z", "1q", "1q:x", "1q:1:2"])
+def test_unknown_or_malformed_callback_data(data):
+    assert decode_callback(data) == (None, ())
+
+
+def test_round_trip():
+    assert decode_callback(encode_callback("quiz", 42)) == ("quiz", (42,))
+    assert decode_callback(encode_callback("quiz_page", "q", "p", 10, "Сто")) == ("quiz_page", ("q", "p", 10, "Сто"))
+
+
+def test_encode_rejects_colon_and_oversized_data():
+    with pytest.raises(ValueError):
+        encode_callback("quiz_page", "q", "n", 0, "a:b")
+    with pytest.raises(ValueError):
+        encode_callback("quiz_page", "q", "n", 0, "я" * 40)
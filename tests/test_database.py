@@ -0,0 +1,42 @@
+import asyncio
+from database import Database
+
+
+async def open_database(path):
+    database = Database(str(path), seed_file=None)
+    await database.open()
+    await database.initialize_database()
+    return database
+
+
+async def count_scores(database, quiz_id):
+    async with database.pool.writer() as db:
+        cursor = await db.execute("SELECT COUNT(*) FROM scores WHERE quiz_id = ?", (quiz_id,))
+        return (await cursor.fetchone())[0]
+
+
+async def quiz_id(database, quiz_name):
+    async with database.pool.writer() as db:
+        cursor = await db.execute("SELECT id FROM quizzes WHERE name = ?", (quiz_name,))
+        return (await cursor.fetchone())[0]
+
+
+def test_delete_quiz_with_scores(tmp_path):
+    async def scenario():
+        database = await open_database(tmp_path / 'quiz.db')
+        try:
+            for name in ('Столицы', 'Реки'):
+                assert 'успешно' in await database.add_quiz(name, [(f'{name}: вопрос', 'ответ')])
+            capitals, rivers = await quiz_id(database, 'Столицы'), await quiz_id(database, 'Реки')
+            await database.scores.flush([(1, 'alice', capitals, 3), (2, 'bob', capitals, 1), (1, 'alice', rivers, 2)])
+            assert await count_scores(database, capitals) == 2
+
+            # Удаление по названию и по ID не нарушает внешний ключ scores -> quizzes
+            assert await database.delete_quiz('Столицы') == "Викторина 'Столицы' успешно удалена."
+            assert await count_scores(database, capitals) == 0
+            assert await database.delete_quiz_by_id(rivers) == "Викторина 'Реки' успешно удалена."
+            assert await count_scores(database, rivers) == 0
+            assert await database.get_quizzes() == []
+        finally:
+            await database.close()
+    asyncio.run(scenario())
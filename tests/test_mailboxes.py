@@ -0,0 +1,87 @@
+import asyncio
+import random
+import pytest
+from types import SimpleNamespace
+from mailboxes import Mailboxes, MailboxFull, update_chat
+
+
+def message(chat_id, text=''):
+    return SimpleNamespace(chat=SimpleNamespace(id=chat_id), text=text)
+
+
+def test_updates_of_one_chat_run_in_order_and_one_at_a_time():
+    async def scenario():
+        mailboxes = Mailboxes(size=100)
+        processed = {}
+        running = set()
+        overlapped = []
+
+        async def handler(update):
+            chat_id = update.chat.id
+            if chat_id in running:
+                overlapped.append(chat_id)
+            running.add(chat_id)
+            await asyncio.sleep(random.random() / 1000)
+            processed.setdefault(chat_id, []).append(int(update.text))
+            running.discard(chat_id)
+
+        serial = mailboxes.serial(handler)
+        await asyncio.gather(*(serial(message(chat_id, str(i))) for i in range(20) for chat_id in range(10)))
+        assert not overlapped
+        assert processed == {chat_id: list(range(20)) for chat_id in range(10)}
+        assert mailboxes.mailboxes == {}
+    asyncio.run(scenario())
+
+
+def test_different_chats_run_in_parallel():
+    async def scenario():
+        mailboxes = Mailboxes()
+        both_started = asyncio.Event()
+        started = []
+
+        async def handler(update):
+            started.append(update.chat.id)
+            if len(started) == 2:
+                both_started.set()
+            await asyncio.wait_for(both_started.wait(), 1)
+
+        serial = mailboxes.serial(handler)
+        await asyncio.gather(serial(message(1)), serial(message(2)))
+    asyncio.run(scenario())
+
+
+def test_full_mailbox_rejects_updates():
+    async def scenario():
+        mailboxes = Mailboxes(size=2)
+        release = asyncio.Event()
+
+        async def handler():
+            await release.wait()
+
+        tasks = [asyncio.ensure_future(mailboxes.run(('chat', 1), handler)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(MailboxFull):
+            await mailboxes.run(('chat', 1), handler)
+        release.set()
+        await asyncio.gather(*tasks)
+        assert mailboxes.stats() == {'mailboxes': 0, 'processed': 2, 'dropped': 1}
+    asyncio.run(scenario())
+
+
+def test_handler_errors_propagate_and_free_the_mailbox():
+    async def scenario():
+        mailboxes = Mailboxes()
+
+        async def failing():
+            raise ValueError("boom")
+
+        with pytest.raises(ValueError):
+            await mailboxes.run(('match', 'abc'), failing)
+        assert mailboxes.mailboxes == {}
+    asyncio.run(scenario())
+
+
+def test_update_chat_key():
+    assert update_chat(message(5)) == ('chat', 5)
+    call = SimpleNamespace(data='1s', message=message(7))
+    assert update_chat(call) == ('chat', 7)
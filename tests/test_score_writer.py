@@ -0,0 +1,87 @@
+import asyncio
+from database import Database
+
+
+async def open_database(path):
+    database = Database(str(path), seed_file=None)
+    await database.open()
+    await database.initialize_database()
+    await database.add_quiz('Столицы', [('Столица Франции?', 'Париж')])
+    return database
+
+
+async def fetch_scores(database):
+    async with database.pool.writer() as db:
+        cursor = await db.execute("SELECT user_id, quiz_id, score FROM scores ORDER BY user_id")
+        return [tuple(row) for row in await cursor.fetchall()]
+
+
+def test_orphan_score_does_not_block_later_scores(tmp_path):
+    async def scenario():
+        database = await open_database(tmp_path / 'quiz.db')
+        try:
+            quiz_id = 1  # Первая викторина новой базы
+            writer = database.scores
+            # Результат викторины, удалённой до записи, нарушил бы внешний ключ
+            await writer.flush([(1, 'alice', 999, 5), (2, 'bob', quiz_id, 3)])
+            assert writer.pending == {}
+            assert writer.failures == 0
+            await writer.flush([(3, 'carol', quiz_id, 4)])
+            assert await fetch_scores(database) == [(2, quiz_id, 3), (3, quiz_id, 4)]
+        finally:
+            await database.close()
+    asyncio.run(scenario())
+
+
+def test_constraint_error_drops_batch_instead_of_retrying(tmp_path):
+    async def scenario():
+        database = await open_database(tmp_path / 'quiz.db')
+        try:
+            async with database.pool.writer() as db:
+                await db.execute('''
+                CREATE TRIGGER reject_negative BEFORE INSERT ON scores WHEN NEW.score < 0
+                BEGIN SELECT RAISE(ABORT, 'negative score'); END
+                ''')
+                await db.commit()
+            writer = database.scores
+            await writer.flush([(1, 'alice', 1, -1)])
+            assert writer.pending == {}
+            await writer.flush([(2, 'bob', 1, 2)])
+            assert await fetch_scores(database) == [(2, 1, 2)]
+        finally:
+            await database.close()
+    asyncio.run(scenario())
+
+
+def test_busy_database_keeps_scores_for_retry(tmp_path):
+    async def scenario():
+        database = await open_database(tmp_path / 'quiz.db')
+        try:
+            writer = database.scores
+            async with database.pool.writer() as db:
+                # Пачка, начатая внутри чужой транзакции, завершается OperationalError
+                await db.execute("BEGIN")
+                writer.pool = BusyPool(db)
+                await writer.flush([(1, 'alice', 1, 2)])
+                writer.pool = database.pool
+            assert writer.pending == {(1, 1): (1, 'alice', 1, 2)}
+            await writer.flush([])
+            assert writer.pending == {}
+            assert await fetch_scores(database) == [(1, 1, 2)]
+        finally:
+            await database.close()
+    asyncio.run(scenario())
+
+
+class BusyPool:
+    def __init__(self, db):
+        self.db = db
+
+    def writer(self):
+        return self
+
+    async def __aenter__(self):
+        return self.db
+
+    async def __aexit__(self, *exc):
+        return False
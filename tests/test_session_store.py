@@ -0,0 +1,121 @@
+import asyncio
+import pytest
+from session_store import SessionStore, MemorySessionStore, SnapshotSessionStore, SQLiteSessionStore, merge_patch
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_store(request, tmp_path):
+    def factory():
+        if request.param == 'memory':
+            return MemorySessionStore()
+        return SQLiteSessionStore(str(tmp_path / 'sessions.db'))
+    return factory
+
+
+def session(question=0, score=0, **data):
+    return dict(data, question=question, score=score)
+
+
+def test_merge_patch():
+    target = {'a': 1, 'b': {'x': 1, 'y': 2}}
+    assert merge_patch(target, {'a': None, 'b': {'y': 3}, 'c': 4}) == {'b': {'x': 1, 'y': 3}, 'c': 4}
+    assert target == {'a': 1, 'b': {'x': 1, 'y': 2}}
+
+
+def test_incomplete_store_cannot_be_created():
+    class PartialStore(SessionStore):
+        async def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        PartialStore()
+    for store_class in (MemorySessionStore, SQLiteSessionStore):
+        assert not store_class.__abstractmethods__
+
+
+def test_compare_and_set_conflict_on_question_index(make_store):
+    async def scenario():
+        store = make_store()
+        await store.open()
+        try:
+            await store.put('game:1', session(question=3, answer='Париж'))
+            # Два ответа на один вопрос: засчитывается только первый
+            first, second = await asyncio.gather(
+                store.compare_and_set('game:1', 3, 4, score_delta=1),
+                store.compare_and_set('game:1', 3, 4, score_delta=1),
+            )
+            assert (first is None) != (second is None)
+            stored = await store.get('game:1')
+            assert stored['question'] == 4
+            assert stored['score'] == 1
+            # Устаревший номер вопроса
+            assert await store.compare_and_set('game:1', 3, 4, score_delta=1) is None
+            assert await store.compare_and_set('game:missing', 0, 1) is None
+            updated = await store.compare_and_set('game:1', 4, 5, updates={'answer': 'Берлин'})
+            assert updated['answer'] == 'Берлин'
+            assert (await store.get('game:1'))['score'] == 1
+        finally:
+            await store.close()
+    asyncio.run(scenario())
+
+
+def test_delete_and_keys(make_store):
+    async def scenario():
+        store = make_store()
+        await store.open()
+        try:
+            await store.put('game:1', session())
+            await store.put('pvp:1', session())
+            assert await store.keys('game:') == ['game:1']
+            await store.delete('game:1')
+            assert await store.get('game:1') is None
+            assert await store.count() == 1
+        finally:
+            await store.close()
+    asyncio.run(scenario())
+
+
+def crash(store):
+    """
+    Имитация падения процесса: журнал закрывается без записи снимка.
+    """
+    store.task.cancel()
+    store.log.close()
+    store.log = None
+
+
+def test_snapshot_and_delta_log_replay_after_crash(tmp_path):
+    directory = str(tmp_path / 'sessions')
+
+    async def before_crash():
+        store = SnapshotSessionStore(directory, interval=3600)
+        await store.open()
+        questions = [('Столица Франции?', 'Париж'), ('Столица Германии?', 'Берлин')]
+        await store.put('game:1', session(questions=questions, answer='Париж'))
+        await store.put('game:2', session(questions=questions))
+        await store.put('game:3', session())
+        await store.snapshot()
+        # Изменения после снимка попадают только в журнал
+        await store.compare_and_set('game:1', 0, 1, score_delta=1, updates={'answer': 'Берлин'})
+        await store.delete('game:2')
+        await store.put('game:4', session(question=2))
+        crash(store)
+        with open(store._log_path(store.generation), 'a', encoding='utf-8') as log:
+            log.write('["c","game:3",1')  # Оборванная последняя запись
+
+    async def after_restart():
+        store = SnapshotSessionStore(directory, interval=3600)
+        await store.open()
+        try:
+            first = await store.get('game:1')
+            assert first['question'] == 1 and first['score'] == 1 and first['answer'] == 'Берлин'
+            assert first['questions'] == [('Столица Франции?', 'Париж'), ('Столица Германии?', 'Берлин')]
+            assert await store.get('game:2') is None
+            assert (await store.get('game:3'))['question'] == 0
+            assert (await store.get('game:4'))['question'] == 2
+            assert await store.count() == 3
+        finally:
+            await store.close()
+
+    asyncio.run(before_crash())
+    asyncio.run(after_restart())
@@ -0,0 +1,87 @@
+import asyncio
+import aiohttp
+from webhook_server import WebhookServer, SECRET_TOKEN_HEADER
+
+
+class FakeBot:
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.updates = []
+
+    async def set_webhook(self, url, secret_token):
+        self.webhook = (url, secret_token)
+
+    async def process_new_updates(self, updates):
+        # Обработка не завершается, пока тест не разрешит: так очередь можно заполнить
+        await self.release.wait()
+        self.updates.extend(updates)
+
+
+def update(update_id):
+    return {'update_id': update_id}
+
+
+async def start_server(bot, **kwargs):
+    server = WebhookServer(bot, None, 'secret', host='127.0.0.1', port=0, **kwargs)
+    await server.start()
+    host, port = server.runner.addresses[0][:2]
+    return server, f'http://{host}:{port}{server.path}'
+
+
+async def raw_post(url, header):
+    """
+    Запрос с заголовком в сыром виде: клиент aiohttp не отправит не-ASCII заголовок.
+    """
+    host, port = url.split('//')[1].split('/')[0].split(':')
+    reader, writer = await asyncio.open_connection(host, int(port))
+    body = b'{"update_id": 1}'
+    writer.write(b'POST /webhook HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                 + SECRET_TOKEN_HEADER.encode() + b': ' + header + b'\r\n'
+                 + b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+    await writer.drain()
+    status_line = await reader.readline()
+    writer.close()
+    await writer.wait_closed()
+    return int(status_line.split()[1])
+
+
+def test_secret_token_is_checked():
+    async def scenario():
+        bot = FakeBot()
+        bot.release.set()
+        server, url = await start_server(bot)
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.post(url, json=update(1)) as response:
+                    assert response.status == 403
+                async with session.post(url, json=update(2), headers={SECRET_TOKEN_HEADER: 'wrong'}) as response:
+                    assert response.status == 403
+                async with session.post(url, json=update(3), headers={SECRET_TOKEN_HEADER: 'secret'}) as response:
+                    assert response.status == 200
+            # Не-ASCII заголовок отклоняется, а не роняет обработчик
+            assert await raw_post(url, 'секрет'.encode('utf-8')) == 403
+        finally:
+            await server.stop()
+        assert [item.update_id for item in bot.updates] == [3]
+    asyncio.run(scenario())
+
+
+def test_full_queue_returns_503():
+    async def scenario():
+        bot = FakeBot()
+        server, url = await start_server(bot, queue_size=1, workers=1)
+        try:
+            headers = {SECRET_TOKEN_HEADER: 'secret'}
+            async with aiohttp.ClientSession() as session:
+                # Первое обновление занимает обработчик, второе - единственное место в очереди
+                statuses = []
+                for update_id in range(1, 4):
+                    async with session.post(url, json=update(update_id), headers=headers) as response:
+                        statuses.append(response.status)
+                    await asyncio.sleep(0.05)
+                assert statuses == [200, 200, 503]
+        finally:
+            bot.release.set()
+            await server.stop()
+        assert [item.update_id for item in bot.updates] == [1, 2]
+    asyncio.run(scenario())
@@ -0,0 +1,222 @@
+import os
+import time
+import heapq
+import uuid
+import cProfile
+import functools
+import contextvars
+import logging
+from contextlib import contextmanager
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Текущий span обрабатываемого обновления; дочерние задачи asyncio получают копию контекста
+current_span = contextvars.ContextVar('current_span', default=None)
+
+class Span:
+    __slots__ = ('name', 'trace', 'started', 'duration', 'children')
+
+    def __init__(self, name, trace):
+        """
+        Инициализация участка трассировки.
+        :param name: Имя участка, например "leaderboard.fetch" или "bot.send_message".
+        :param trace: Трассировка обновления, которой принадлежит участок.
+        """
+        self.name = name
+        self.trace = trace
+        self.started = time.perf_counter()
+        self.duration = None  # None, пока участок не завершён
+        self.children = []
+
+    def finish(self):
+        """
+        Завершение участка.
+        """
+        self.duration = time.perf_counter() - self.started
+
+class Trace:
+    __slots__ = ('trace_id', 'description', 'root', 'finished')
+
+    def __init__(self, name, description):
+        """
+        Инициализация трассировки одного входящего обновления.
+        :param name: Имя обработчика.
+        :param description: Описание обновления: чат, текст сообщения или callback_data.
+        """
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.description = description
+        self.root = Span(name, self)
+        self.finished = False
+
+    def render(self):
+        """
+        Дерево участков в текстовом виде: смещение от начала обновления и длительность каждого участка.
+        :return: Текст.
+        """
+        lines = [f"Slow update {self.trace_id} ({self.root.duration * 1000:.1f} ms): {self.description}"]
+        stack = [(self.root, 1)]
+        while stack:
+            node, depth = stack.pop()
+            offset = (node.started - self.root.started) * 1000
+            duration = f"{node.duration * 1000:.1f} ms" if node.duration is not None else "unfinished"
+            lines.append(f"{'  ' * depth}{node.name} +{offset:.1f} ms {duration}")
+            stack.extend((child, depth + 1) for child in reversed(node.children))
+        return '\n'.join(lines)
+
+@contextmanager
+def span(name):
+    """
+    Участок трассировки внутри обрабатываемого обновления. Вне обновления (фоновые задачи,
+    завершённая трассировка) ничего не записывает.
+    :param name: Имя участка.
+    :return: Span или None.
+    """
+    parent = current_span.get()
+    if parent is None or parent.trace.finished:
+        yield None
+        return
+    child = Span(name, parent.trace)
+    parent.children.append(child)
+    token = current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.finish()
+        current_span.reset(token)
+
+def current_trace_id():
+    """
+    ID трассировки обрабатываемого обновления.
+    :return: ID или None вне обновления.
+    """
+    parent = current_span.get()
+    return parent.trace.trace_id if parent is not None else None
+
+def describe_update(update):
+    """
+    Краткое описание входящего обновления для журнала.
+    :param update: Сообщение или callback-запрос.
+    :return: Строка.
+    """
+    data = getattr(update, 'data', None)
+    if data is not None:
+        return f"callback chat={update.message.chat.id} data={data!r}"
+    text = getattr(update, 'text', None) or ''
+    return f"message chat={update.chat.id} text={text[:40]!r}"
+
+class Tracer:
+    def __init__(self, slow_threshold=1.0, profile=False, profile_top=10, profile_dir='profiles'):
+        """
+        Инициализация трассировки входящих обновлений.
+        Каждое обновление получает ID трассировки, участки работы с базой и Bot API записываются в дерево,
+        и дерево обновлений, обработанных дольше slow_threshold, записывается в журнал.
+        Если включён profile, обновления профилируются cProfile по одному (пока одно профилируется,
+        остальные пропускаются), и профили самых медленных profile_top обновлений сохраняются в profile_dir.
+        Профиль охватывает всё время обработки обновления, включая работу других задач, выполнявшуюся
+        во время его ожидания.
+        :param slow_threshold: Порог медленного обновления в секундах, 0 - не записывать.
+        :param profile: Включить профилирование.
+        :param profile_top: Количество сохраняемых профилей.
+        :param profile_dir: Каталог файлов .prof (pstats, snakeviz, flameprof).
+        """
+        self.slow_threshold = slow_threshold
+        self.profile = profile
+        self.profile_top = profile_top
+        self.profile_dir = profile_dir
+        self.profiling = False  # Какое-то обновление сейчас профилируется
+        self.profiles = []  # Куча (длительность, путь к файлу) сохранённых профилей
+        self.traced = 0
+        self.slow = 0
+
+    def configure(self, slow_threshold=None, profile=None, profile_top=None, profile_dir=None):
+        """
+        Изменение настроек.
+        :param slow_threshold: Порог медленного обновления в секундах.
+        :param profile: Включить профилирование.
+        :param profile_top: Количество сохраняемых профилей.
+        :param profile_dir: Каталог файлов .prof.
+        """
+        if slow_threshold is not None:
+            self.slow_threshold = slow_threshold
+        if profile is not None:
+            self.profile = profile
+        if profile_top is not None:
+            self.profile_top = profile_top
+        if profile_dir is not None:
+            self.profile_dir = profile_dir
+
+    async def run(self, name, handler, update, *args, **kwargs):
+        """
+        Обработка обновления с трассировкой.
+        :param name: Имя обработчика.
+        :param handler: Асинхронный обработчик.
+        :param update: Сообщение или callback-запрос.
+        :return: Результат обработчика.
+        """
+        trace = Trace(name, describe_update(update))
+        token = current_span.set(trace.root)
+        profiler = None
+        if self.profile and not self.profiling:
+            self.profiling = True
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            return await handler(update, *args, **kwargs)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self.profiling = False
+            trace.root.finish()
+            trace.finished = True
+            current_span.reset(token)
+            self.traced += 1
+            if self.slow_threshold and trace.root.duration >= self.slow_threshold:
+                self.slow += 1
+                logger.warning(trace.render())
+            if profiler is not None:
+                self.keep_profile(trace, profiler)
+
+    def keep_profile(self, trace, profiler):
+        """
+        Сохранение профиля, если обновление входит в число самых медленных.
+        :param trace: Трассировка обновления.
+        :param profiler: Профиль cProfile.
+        """
+        duration = trace.root.duration
+        if len(self.profiles) >= self.profile_top and duration <= self.profiles[0][0]:
+            return
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f"update-{duration * 1000:09.1f}ms-{trace.trace_id}.prof")
+            profiler.dump_stats(path)
+            heapq.heappush(self.profiles, (duration, path))
+            if len(self.profiles) > self.profile_top:
+                _, evicted = heapq.heappop(self.profiles)
+                os.remove(evicted)
+        except Exception as e:
+            logger.error(f"Error saving profile: {e}")
+
+    def stats(self):
+        """
+        Статистика трассировки.
+        :return: Словарь с количеством обновлений, медленных обновлений и сохранённых профилей.
+        """
+        return {'traced': self.traced, 'slow': self.slow, 'profiles': len(self.profiles)}
+
+TRACER = Tracer()
+
+def trace_update(handler, name=None):
+    """
+    Обёртка обработчика обновлений, создающая трассировку для каждого обновления.
+    :param handler: Асинхронный обработчик handler(update).
+    :param name: Имя обработчика, по умолчанию имя функции.
+    :return: Обёрнутый обработчик.
+    """
+    name = name or handler.__name__
+
+    @functools.wraps(handler)
+    async def wrapper(update, *args, **kwargs):
+        return await TRACER.run(name, handler, update, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,88 @@
+import asyncio
+import time
+import logging
+from collections import OrderedDict
+from metrics import API_SECONDS, API_REQUESTS
+from tracing import span
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class UsernameCache:
+    def __init__(self, bot, max_size=10000, ttl=3600, negative_ttl=60):
+        """
+        Инициализация кэша имён пользователей перед bot.get_chat.
+        :param bot: Экземпляр бота.
+        :param max_size: Максимальное количество записей, при превышении вытесняются самые старые (LRU).
+        :param ttl: Время жизни записи в секундах.
+        :param negative_ttl: Время жизни записи о неудачном запросе в секундах.
+        """
+        self.bot = bot
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.entries = OrderedDict()  # chat_id -> (username, время истечения)
+        self.pending = {}  # chat_id -> Future запроса, который уже выполняется
+
+    def remember(self, chat_id, username, ttl=None):
+        """
+        Сохранение имени пользователя в кэш.
+        :param chat_id: ID чата.
+        :param username: Имя пользователя (может быть None, если у пользователя нет username).
+        :param ttl: Время жизни записи в секундах, по умолчанию self.ttl.
+        """
+        self.entries[chat_id] = (username, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self.entries.move_to_end(chat_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def remember_message(self, message):
+        """
+        Сохранение имени пользователя из входящего сообщения, без запроса к Telegram.
+        :param message: Объект сообщения.
+        """
+        chat = message.chat
+        self.remember(chat.id, chat.username)
+
+    async def get(self, chat_id):
+        """
+        Получение имени пользователя. Одновременные запросы для одного чата объединяются в один вызов get_chat.
+        :param chat_id: ID чата.
+        :return: Имя пользователя или None.
+        """
+        entry = self.entries.get(chat_id)
+        if entry is not None:
+            username, expires_at = entry
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(chat_id)
+                return username
+            del self.entries[chat_id]
+
+        future = self.pending.get(chat_id)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(chat_id))
+            self.pending[chat_id] = future
+            future.add_done_callback(lambda _: self.pending.pop(chat_id, None))
+        with span('bot.get_chat'):
+            return await asyncio.shield(future)
+
+    async def _fetch(self, chat_id):
+        """
+        Запрос имени пользователя у Telegram.
+        :param chat_id: ID чата.
+        :return: Имя пользователя или None.
+        """
+        started = time.perf_counter()
+        try:
+            chat = await self.bot.get_chat(chat_id)
+        except Exception as e:
+            API_SECONDS.observe(time.perf_counter() - started, 'get_chat')
+            API_REQUESTS.inc('get_chat', 'error')
+            logger.error(f"Error getting chat {chat_id}: {e}")
+            self.remember(chat_id, None, ttl=self.negative_ttl)
+            return None
+        API_SECONDS.observe(time.perf_counter() - started, 'get_chat')
+        API_REQUESTS.inc('get_chat', 'ok')
+        self.remember(chat_id, chat.username)
+        return chat.username
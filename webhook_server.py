@@ -0,0 +1,117 @@
+import asyncio
+import hmac
+import logging
+from aiohttp import web
+from telebot import types
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Заголовок, в котором Telegram передаёт секрет, указанный при установке вебхука
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+class WebhookServer:
+    def __init__(self, bot, url, secret_token, host='0.0.0.0', port=8080, path='/webhook', queue_size=1000, workers=8):
+        """
+        Инициализация приёма обновлений через вебхук.
+        Обновления принимаются локальным HTTP-сервером aiohttp, складываются в ограниченную очередь
+        и обрабатываются несколькими обработчиками параллельно.
+        :param bot: Экземпляр бота.
+        :param url: Внешний адрес сервера, который сообщается Telegram (без пути), или None, если вебхук
+        устанавливается вручную.
+        :param secret_token: Секрет для проверки заголовка X-Telegram-Bot-Api-Secret-Token.
+        :param host: Адрес, на котором слушает сервер.
+        :param port: Порт, на котором слушает сервер.
+        :param path: Путь, по которому принимаются обновления.
+        :param queue_size: Максимальное количество необработанных обновлений.
+        :param workers: Количество параллельных обработчиков очереди.
+        """
+        self.bot = bot
+        self.url = url
+        self.secret_token = secret_token
+        self.host = host
+        self.port = port
+        self.path = path
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.workers_count = workers
+        self.workers = []
+        self.runner = None
+        self.stopped = asyncio.Event()
+
+    def create_app(self):
+        """
+        Создание приложения aiohttp.
+        :return: Приложение aiohttp.
+        """
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        return app
+
+    async def start(self):
+        """
+        Запуск HTTP-сервера, обработчиков очереди и установка вебхука в Telegram.
+        """
+        self.runner = web.AppRunner(self.create_app())
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(self.workers_count)]
+        if self.url:
+            await self.bot.set_webhook(url=self.url.rstrip('/') + self.path, secret_token=self.secret_token)
+        logger.info(f"Webhook server listening on {self.host}:{self.port}{self.path}")
+
+    async def serve_forever(self):
+        """
+        Ожидание остановки сервера.
+        """
+        await self.stopped.wait()
+
+    async def stop(self):
+        """
+        Остановка сервера. Обновления, уже попавшие в очередь, обрабатываются до конца.
+        """
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+        await self.queue.join()
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+        self.stopped.set()
+
+    async def handle_update(self, request):
+        """
+        Приём обновления от Telegram.
+        :param request: HTTP-запрос.
+        :return: HTTP-ответ.
+        """
+        # Сравниваются байты: compare_digest не принимает строки с не-ASCII символами
+        header = request.headers.get(SECRET_TOKEN_HEADER, '').encode('utf-8', 'surrogateescape')
+        if self.secret_token and not hmac.compare_digest(header, self.secret_token.encode('utf-8')):
+            return web.Response(status=403)
+        try:
+            update = types.Update.de_json(await request.json())
+        except Exception as e:
+            logger.error(f"Error parsing webhook update: {e}")
+            return web.Response(status=400)
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram повторит доставку позже
+            logger.warning("Webhook update queue is full")
+            return web.Response(status=503)
+        return web.Response()
+
+    async def worker(self):
+        """
+        Обработчик очереди обновлений.
+        """
+        while True:
+            update = await self.queue.get()
+            try:
+                await self.bot.process_new_updates([update])
+            except Exception as e:
+                logger.error(f"Error processing webhook update: {e}")
+            finally:
+                self.queue.task_done()